@@ -1,18 +1,50 @@
 """Provides a higher level abstaction for asyncio.create_subprocess_exec"""
+import os
+import time
+import signal
 import logging
 import asyncio
 
+from kodi_wol_listener import metrics
+
+SPAWN_SECONDS = metrics.histogram('kodi_wol_listener_subprocess_spawn_seconds',
+                                  'Time to spawn a subprocess', ['command'])
+
 class AsyncSubprocess():  # pylint: disable=logging-fstring-interpolation
-    """Asyncio based subprocess runner"""
-    def __init__(self, cmd_base, abort_on_fail=True, logging_level=logging.WARNING):
-        self.cmd_base = cmd_base
+    """Asyncio based subprocess runner
+
+    The command is run by a shell, which may or may not exec it. With
+    new_session, the process runs in a session of its own and terminate()
+    signals the whole process group, the command included.
+    """
+
+    __slots__ = ('cmd_base', 'command_name', 'abort_on_fail', 'abort_level', 'new_session',
+                 'proc', 'cmd', 'pid')
+    def __init__(self, cmd_base, abort_on_fail=True, logging_level=logging.WARNING,
+                 new_session=False):
+        self.cmd_base = None
+        self.command_name = None
+        self.set_command(cmd_base)
         self.abort_on_fail = abort_on_fail
         if abort_on_fail:
             self.abort_level = logging.ERROR
         else:
             self.abort_level = logging_level
+        self.new_session = new_session
         self.proc = None
         self.cmd = None
+        # Process id of the last process started, kept after it has exited
+        self.pid = None
+
+    def set_command(self, cmd_base):
+        """Change the command, a running process is not affected
+
+        Args:
+            cmd_base (bytes) The command string, arguments are added on run
+        """
+        self.cmd_base = cmd_base
+        # Metrics label, the name of the executable
+        self.command_name = os.path.basename(cmd_base.split()[0]).decode(errors='replace')
 
     async def run(self, cmd_args=b''):
         """Run a subprocess with the given addon argument
@@ -21,10 +53,26 @@ class AsyncSubprocess():  # pylint: disable=logging-fstring-interpolation
             cmd_args (bytes) Additional argument to be added to the command string
         """
         self.cmd = self.cmd_base + b' ' + cmd_args
+        start = time.monotonic()
         self.proc = await asyncio.create_subprocess_shell(
             self.cmd,
             stdout=asyncio.subprocess.PIPE,  #pylint: disable=no-member
-            stderr=asyncio.subprocess.PIPE)  #pylint: disable=no-member
+            stderr=asyncio.subprocess.PIPE,  #pylint: disable=no-member
+            start_new_session=self.new_session)
+        SPAWN_SECONDS.observe(time.monotonic() - start, self.command_name)
+        self.pid = self.proc.pid
+
+    def terminate(self):
+        """Send SIGTERM to the running process, its process group with new_session"""
+        if not self.proc or self.proc.returncode is not None:
+            return
+        try:
+            if self.new_session:
+                os.killpg(self.proc.pid, signal.SIGTERM)
+            else:
+                self.proc.terminate()
+        except ProcessLookupError:
+            pass
 
     async def wait_completed(self):
         """Return result from running process, wait if process is still executing
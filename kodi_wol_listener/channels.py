@@ -0,0 +1,491 @@
+"""Parse and query a VDR channels.conf
+
+Each line of the file is a channel in VDR's colon separated format
+    Name,Short name;Provider:Frequency:Parameters:Source:Symbolrate:VPID:APID:TPID:CAID:SID:NID:TID:RID
+or a group separator starting with ':' (':Name' or ':@<number> Name'). A '|'
+in the name stands for a ':'.
+
+The file is parsed in a single pass into a Channels table. The fields used for
+lookups are kept in arrays, strings repeating across channels (provider,
+source, parameters) are stored once in a string pool. The text of each line
+is kept as well, the file is written back unchanged unless the table was
+modified, and all further fields are parsed on demand, see Channels.channel().
+"""
+import collections
+from array import array
+from typing import List
+
+import typer
+
+Channel = collections.namedtuple(
+    'Channel', ['name', 'short_name', 'provider', 'frequency', 'parameters', 'source', 'srate',
+                'vpid', 'apid', 'tpid', 'caid', 'sid', 'nid', 'tid', 'rid'])
+
+# Kind of a line
+CHANNEL = 0
+GROUP = 1
+# A blank line, kept to write the file back unchanged
+BLANK = 2
+
+POLARIZATIONS = 'HVLR'
+# Largest values of the numbers kept in arrays, see Channels
+MAX_FREQUENCY = MAX_SRATE = 0xffffffff
+MAX_ID = 0xffff
+
+
+def polarization(parameters):
+    """Return the polarization (H, V, L or R) of a parameter string, '' if none
+
+    The parameters are letters each followed by an optional number, e.g.
+    'HC34M2S0', the polarization is a letter without number.
+    """
+    for char in parameters:
+        if char in POLARIZATIONS:
+            return char
+    return ''
+
+
+class Channels():
+    """The channels and group separators of a channels.conf in file order
+
+    Rows are numbered in file order. The per row columns are:
+        lines (list of str) Text of the line including its line break
+        kinds (bytearray) CHANNEL, GROUP or BLANK
+        names (list of str) Name of the channel or group, '' for blank lines
+    and for channels (0 for other rows):
+        providers, sources, parameters (array) Indexes into strings
+        frequencies, srates, sids, nids, tids, rids (array) The numbers
+        polarizations (bytearray) The polarization character, 0 if none
+
+    Args:
+        lines (iterable of str) Lines of a channels.conf, e.g. an open file
+    Raises:
+        ValueError A line is not a valid channel
+    """
+    def __init__(self, lines=()):
+        self.lines = []
+        self.kinds = bytearray()
+        self.names = []
+        self.providers = array('I')
+        self.sources = array('I')
+        self.parameters = array('I')
+        self.frequencies = array('I')
+        self.srates = array('I')
+        self.sids = array('H')
+        self.nids = array('H')
+        self.tids = array('H')
+        self.rids = array('H')
+        self.polarizations = bytearray()
+        # String pool, the index of each string in strings
+        self.strings = ['']
+        self._string_ids = {'': 0}
+        # Indexes, each maps to the rows in file order
+        self.by_name = collections.defaultdict(list)
+        self.by_transponder = collections.defaultdict(list)
+        self.by_service = collections.defaultdict(list)
+        for line in lines:
+            self.append(line)
+
+    @classmethod
+    def load(cls, path):
+        """Read a channels.conf file"""
+        with open(path, encoding='utf-8', errors='surrogateescape', newline='') as conf:
+            return cls(conf)
+
+    def save(self, path):
+        """Write the table to a channels.conf file"""
+        with open(path, 'w', encoding='utf-8', errors='surrogateescape', newline='') as conf:
+            conf.write(self.text())
+
+    def text(self):
+        """Return the content of the channels.conf"""
+        return ''.join(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def _intern(self, string):
+        string_id = self._string_ids.get(string)
+        if string_id is None:
+            string_id = self._string_ids[string] = len(self.strings)
+            self.strings.append(string)
+        return string_id
+
+    def append(self, line):
+        """Add a line to the end of the table
+
+        Args:
+            line (str) The line, a line break is added if missing
+        Returns:
+            (int) The row of the line
+        Raises:
+            ValueError The line is not a valid channel
+        """
+        row = len(self.lines)
+        if self.lines and not self.lines[-1].endswith('\n'):
+            self.lines[-1] += '\r\n' if line.endswith('\r\n') else '\n'
+        text = line.rstrip('\r\n')
+        if not text.strip():
+            self._append_row(line, BLANK, '')
+            return row
+        if text.startswith(':'):
+            name = text[1:]
+            if name.startswith('@'):
+                name = name.partition(' ')[2]
+            self._append_row(line, GROUP, name)
+            return row
+        fields = text.split(':')
+        if len(fields) != 13:
+            raise ValueError(f"Invalid channel in line {row + 1}: {text}")
+        name, short_name, provider = self._split_name(fields[0])
+        try:
+            frequency, srate, sid, nid, tid, rid = (
+                int(fields[1]), int(fields[4]), int(fields[9]), int(fields[10]),
+                int(fields[11]), int(fields[12]))
+        except ValueError:
+            raise ValueError(f"Invalid channel in line {row + 1}: {text}") from None
+        if not (0 <= frequency <= MAX_FREQUENCY and 0 <= srate <= MAX_SRATE
+                and all(0 <= value <= MAX_ID for value in (sid, nid, tid, rid))):
+            raise ValueError(f"Number out of range in line {row + 1}: {text}")
+        source = self._intern(fields[3])
+        pol = ord(polarization(fields[2]) or '\0')
+        self._append_row(line, CHANNEL, name, self._intern(provider), source,
+                         self._intern(fields[2]), frequency, srate, sid, nid, tid, rid, pol)
+        self.by_name[name].append(row)
+        if short_name and short_name != name:
+            self.by_name[short_name].append(row)
+        self.by_transponder[source, frequency, pol].append(row)
+        self.by_service[nid, tid, sid].append(row)
+        return row
+
+    def _append_row(self, line, kind, name, provider=0, source=0, parameters=0, frequency=0,
+                    srate=0, sid=0, nid=0, tid=0, rid=0, pol=0):
+        # pylint: disable=too-many-arguments
+        self.lines.append(line)
+        self.kinds.append(kind)
+        self.names.append(name)
+        self.providers.append(provider)
+        self.sources.append(source)
+        self.parameters.append(parameters)
+        self.frequencies.append(frequency)
+        self.srates.append(srate)
+        self.sids.append(sid)
+        self.nids.append(nid)
+        self.tids.append(tid)
+        self.rids.append(rid)
+        self.polarizations.append(pol)
+
+    @staticmethod
+    def _split_name(field):
+        """Split the name field into name, short name and provider"""
+        names, _, provider = field.partition(';')
+        name, _, short_name = names.partition(',')
+        return name.replace('|', ':'), short_name.replace('|', ':'), provider.replace('|', ':')
+
+    def channel(self, row):
+        """Return all fields of the channel in a row
+
+        Returns:
+            (Channel) The fields, the numbers as int, all others as str
+        """
+        if self.kinds[row] != CHANNEL:
+            raise ValueError(f"Row {row} is not a channel")
+        fields = self.lines[row].rstrip('\r\n').split(':')
+        return Channel(*self._split_name(fields[0]), int(fields[1]), fields[2], fields[3],
+                       int(fields[4]), *fields[5:9], *(int(field) for field in fields[9:]))
+
+    def channel_rows(self):
+        """Return the rows of all channels"""
+        return [row for row, kind in enumerate(self.kinds) if kind == CHANNEL]
+
+    def numbers(self):
+        """Return the rows by channel number
+
+        VDR numbers the channels from 1, a group separator ':@<number>'
+        continues the numbering at the given number.
+
+        Returns:
+            (dict) The row of each channel number
+        Raises:
+            ValueError A group separator has an invalid number
+        """
+        numbers = {}
+        number = 1
+        for row, kind in enumerate(self.kinds):
+            if kind == CHANNEL:
+                numbers[number] = row
+                number += 1
+            elif kind == GROUP and self.lines[row].startswith(':@'):
+                try:
+                    number = int(self.lines[row][2:].split(None, 1)[0])
+                except (ValueError, IndexError):
+                    raise ValueError(f"Invalid channel number in line {row + 1}: "
+                                     f"{self.lines[row].rstrip()}") from None
+        return numbers
+
+    def reordered(self, order):
+        """Return a table of the rows in the given order
+
+        Args:
+            order (list of int) Rows of this table
+        """
+        return Channels(self.lines[row] for row in order)
+
+    def transponder(self, row):
+        """Return the transponder (source, frequency, polarization) of a channel"""
+        return (self.strings[self.sources[row]], self.frequencies[row],
+                chr(self.polarizations[row]) if self.polarizations[row] else '')
+
+    def transponder_key(self, row):
+        """Return the key of the transponder of a row in by_transponder"""
+        return self.sources[row], self.frequencies[row], self.polarizations[row]
+
+    def find(self, name):
+        """Return the rows of the channels with given name or short name"""
+        return self.by_name.get(name, [])
+
+    def on_transponder(self, source, frequency, pol=''):
+        """Return the rows of the channels on a transponder"""
+        return self.by_transponder.get(
+            (self._string_ids.get(source, -1), frequency, ord(pol or '\0')), [])
+
+    def service(self, nid, tid, sid):
+        """Return the rows of the channels with the given ids"""
+        return self.by_service.get((nid, tid, sid), [])
+
+    def transponders(self):
+        """Return the channel rows grouped by transponder
+
+        Returns:
+            (dict) The rows of each transponder (source, frequency,
+                polarization), in the order the transponders first appear
+        """
+        return {self.transponder(rows[0]): rows for rows in self.by_transponder.values()}
+
+    def groups(self):
+        """Return the channel rows grouped by the group separators
+
+        Returns:
+            (list) (name, rows) for each group, name is None for the channels
+                before the first separator
+        """
+        groups = [(None, [])]
+        for row, kind in enumerate(self.kinds):
+            if kind == GROUP:
+                groups.append((self.names[row], []))
+            elif kind == CHANNEL:
+                groups[-1][1].append(row)
+        if not groups[0][1]:
+            groups.pop(0)
+        return groups
+
+
+def transponder_order(channels, pinned=()):
+    """Return the rows ordered to keep the channels of a transponder adjacent
+
+    Group separators, blank lines and pinned channels keep their position.
+    The other channels of each group are ordered by transponder, the
+    transponders in the order they first appear within the group, the channels
+    of a transponder in their original order. Ordering the result again does
+    not change it.
+
+    Args:
+        channels (Channels) The table
+        pinned (set of int) Rows of channels not to move
+    Returns:
+        (list of int) All rows of the table in the new order
+    """
+    order = list(range(len(channels)))
+    start = 0
+    for end in [row for row, kind in enumerate(channels.kinds) if kind == GROUP] + [len(order)]:
+        free = [row for row in range(start, end)
+                if channels.kinds[row] == CHANNEL and row not in pinned]
+        clusters = {}
+        for row in free:
+            clusters.setdefault(channels.transponder_key(row), []).append(row)
+        for position, row in zip(free, (row for rows in clusters.values() for row in rows)):
+            order[position] = row
+        start = end + 1
+    return order
+
+
+def retunes(channels, rows):
+    """Return the number of retunes zapping through the rows in given order"""
+    keys = [channels.transponder_key(row) for row in rows]
+    return sum(1 for key, next_key in zip(keys, keys[1:]) if key != next_key)
+
+
+def zap_retunes(channels, numbers=None):
+    """Return the number of retunes of a zapping sequence
+
+    Args:
+        channels (Channels) The table
+        numbers (list of int) Channel numbers in zapping order, None to zap
+            through all channels
+    """
+    if numbers is None:
+        return retunes(channels, channels.channel_rows())
+    rows = channels.numbers()
+    return retunes(channels, [rows[number] for number in numbers if number in rows])
+
+
+ChannelDiff = collections.namedtuple('ChannelDiff', ['added', 'removed', 'retuned', 'renamed'])
+
+
+def identities(channels):
+    """Return the rows by channel identity
+
+    The identity of a channel is (source, NID, TID, SID, n), n counts channels
+    of the same (source, NID, TID, SID) in file order starting from 0.
+
+    Returns:
+        (dict) The row of each identity, in file order
+    """
+    rows = {}
+    counts = collections.Counter()
+    for row in channels.channel_rows():
+        key = (channels.strings[channels.sources[row]], channels.nids[row], channels.tids[row],
+               channels.sids[row])
+        rows[key + (counts[key],)] = row
+        counts[key] += 1
+    return rows
+
+
+def _split_line(line):
+    """Split a channel line into name field and the remaining fields"""
+    name, _, rest = line.rstrip('\r\n').partition(':')
+    return name, rest
+
+
+def diff(ours, scan):
+    """Compare two channel tables by the identity of the channels
+
+    Args:
+        ours (Channels) The maintained table
+        scan (Channels) The table of a fresh scan
+    Returns:
+        (ChannelDiff) added (list of int) rows of scan not in ours, removed
+            (list of int) rows of ours not in scan, retuned and renamed (list
+            of (int, int)) rows of ours and scan of channels with changed
+            parameters respectively name field, all in the order of the
+            respective table
+    """
+    our_rows = identities(ours)
+    scan_rows = identities(scan)
+    result = ChannelDiff([], [], [], [])
+    for identity, row in our_rows.items():
+        scan_row = scan_rows.get(identity)
+        if scan_row is None:
+            result.removed.append(row)
+            continue
+        our_name, our_rest = _split_line(ours.lines[row])
+        scan_name, scan_rest = _split_line(scan.lines[scan_row])
+        if our_rest != scan_rest:
+            result.retuned.append((row, scan_row))
+        if our_name != scan_name:
+            result.renamed.append((row, scan_row))
+    result.added.extend(row for identity, row in scan_rows.items() if identity not in our_rows)
+    return result
+
+
+def merge(ours, scan, keep_removed=False, new_group=None):
+    """Update a channel table with a fresh scan
+
+    The order and the name fields of ours are kept, the parameters of the
+    channels are taken from the scan. Channels new in the scan are appended.
+
+    Args:
+        ours (Channels) The maintained table
+        scan (Channels) The table of a fresh scan
+        keep_removed (bool) Keep the channels missing in the scan
+        new_group (str) Name of a group separator added before the new
+            channels, None for none
+    Returns:
+        (Channels) The merged table
+    """
+    scan_rows = identities(scan)
+    lines = list(ours.lines)
+    dropped = set()
+    for identity, row in identities(ours).items():
+        scan_row = scan_rows.pop(identity, None)
+        if scan_row is None:
+            if not keep_removed:
+                dropped.add(row)
+            continue
+        name, _ = _split_line(ours.lines[row])
+        _, rest = _split_line(scan.lines[scan_row])
+        line_break = ours.lines[row][len(ours.lines[row].rstrip('\r\n')):]
+        lines[row] = f'{name}:{rest}{line_break}'
+    lines = [line for row, line in enumerate(lines) if row not in dropped]
+    if scan_rows and new_group:
+        lines.append(f':{new_group}\n')
+    lines.extend(scan.lines[row] for row in scan_rows.values())
+    return Channels(lines)
+
+
+app = typer.Typer()
+
+
+@app.callback()
+def main():
+    """Maintain a VDR channels.conf"""
+
+
+@app.command()
+def reorder(path: str = typer.Argument(..., help="The channels.conf"),
+            output: str = typer.Option(None, help="Write the result to this file"),
+            pin: List[str] = typer.Option([], help="Name of a channel not to move"),
+            pin_group: List[str] = typer.Option(
+                [], help="Name of a group whose channels are not moved"),
+            zap_log: str = typer.Option(
+                None, help="File of channel numbers in zapping order, one per line")):
+    """Keep the channels of a transponder adjacent to reduce retunes on zapping"""
+    channels = Channels.load(path)
+    pinned = {row for name in pin for row in channels.find(name)}
+    pinned.update(row for name, rows in channels.groups() if name in pin_group for row in rows)
+    result = channels.reordered(transponder_order(channels, pinned))
+    numbers = None
+    if zap_log:
+        with open(zap_log) as log:
+            numbers = [int(line) for line in log if line.strip()]
+    typer.echo(f"Retunes {'of the zapping log' if zap_log else 'zapping through all channels'}: "
+               f"{zap_retunes(channels, numbers)} before, {zap_retunes(result, numbers)} after")
+    if output:
+        result.save(output)
+
+
+@app.command(name='diff')
+def diff_command(path: str = typer.Argument(..., help="The maintained channels.conf"),
+                 scan: str = typer.Argument(..., help="The channels.conf of a fresh scan")):
+    """List the channels added, removed, retuned or renamed by a scan"""
+    ours, scanned = Channels.load(path), Channels.load(scan)
+    changes = diff(ours, scanned)
+    for row in changes.added:
+        typer.echo(f"+ {scanned.lines[row].rstrip()}")
+    for row in changes.removed:
+        typer.echo(f"- {ours.lines[row].rstrip()}")
+    for row, scan_row in changes.retuned:
+        typer.echo(f"~ {ours.names[row]}: {_split_line(ours.lines[row])[1]} "
+                   f"-> {_split_line(scanned.lines[scan_row])[1]}")
+    for row, scan_row in changes.renamed:
+        typer.echo(f"= {_split_line(ours.lines[row])[0]} "
+                   f"-> {_split_line(scanned.lines[scan_row])[0]}")
+    typer.echo(f"{len(changes.added)} added, {len(changes.removed)} removed, "
+               f"{len(changes.retuned)} retuned, {len(changes.renamed)} renamed")
+
+
+@app.command(name='merge')
+def merge_command(path: str = typer.Argument(..., help="The maintained channels.conf"),
+                  scan: str = typer.Argument(..., help="The channels.conf of a fresh scan"),
+                  output: str = typer.Option(..., help="Write the result to this file"),
+                  keep_removed: bool = typer.Option(
+                      False, help="Keep the channels missing in the scan"),
+                  new_group: str = typer.Option(
+                      None, help="Add the new channels in a group of this name")):
+    """Update the parameters of the channels from a scan, keep order and names"""
+    merged = merge(Channels.load(path), Channels.load(scan), keep_removed, new_group)
+    merged.save(output)
+
+
+if __name__ == '__main__':
+    app()
@@ -0,0 +1,186 @@
+"""Configuration file of the listener
+
+The file is in INI format, all settings are optional:
+    [listener]
+    port = 42429
+    interface = eth0
+    debug_level = warning
+    metrics_port = 0
+    # IPv4 addresses whose status queries are answered, e.g. the VDR backend
+    # running vdr_shutdown_hook, separated by spaces. Empty to answer none.
+    status_hosts =
+
+    [kodi]
+    command = /usr/bin/kodi
+    jsonrpc_port = 9090
+    desktop_restart_command = /usr/bin/sudo systemctl restart sddm
+    # Minutes without usage until kodi is stopped, 0 to disable
+    idle_timeout = 0
+    # quit: kodi exits when idle. standby: kodi keeps running with HDMI off
+    # and the VDR add-on disabled, the next wake resumes it within a second
+    idle_action = quit
+
+    [hdmi]
+    vcgencmd = /usr/bin/vcgencmd
+
+    [cec]
+    # cec-client command line to switch the TV on at launch, empty to
+    # disable, e.g. /usr/bin/cec-client -d 1 -t p -o Kodi
+    command =
+
+    [prewake]
+    backend_mac =
+    # Minutes to wake the backend ahead of predicted usage
+    lead = 5
+    threshold = 0.5
+
+    [rsync]
+    # Name of the rsync daemon processes to throttle while kodi plays, empty
+    # to disable, e.g. rsync
+    process =
+    # systemd unit of the daemon, its weights are lowered if possible
+    unit = rsync_user.service
+
+    [library]
+    # Directory tree whose new files kodi is asked to scan, empty to disable,
+    # e.g. ~/Videos
+    watch =
+    # Seconds without further changes until kodi is asked to scan
+    settle = 10
+
+    [hotplug]
+    # Start kodi (or resume it from standby) as a display gets connected,
+    # on/off, yes/no, true/false or 1/0
+    prelaunch = off
+    # Minimum seconds between two hotplug starts, suppresses launch storms
+    # of a flapping hotplug line
+    throttle = 120
+    # Monitors the HDMI port if the kernel has no drm connectors
+    tvservice = /usr/bin/tvservice
+
+    [journal]
+    # Records the wakes and kodi sessions, the pre-wake model learns from
+    # them. Empty to disable. Kept in $XDG_DATA_HOME if set.
+    path = ~/.local/share/kodi_wol_listener/wake_journal.bin
+    # Bytes the journal is rotated at, twice that many are kept
+    max_bytes = 1048576
+
+The file is read at startup and again on SIGHUP, see KodiManager.reload().
+"""
+import os
+import configparser
+
+from kodi_wol_listener.wake_journal import default_journal_path
+
+def default_config_path():
+    """Return the default path of the configuration file"""
+    config_home = os.environ.get('XDG_CONFIG_HOME', os.path.expanduser('~/.config'))
+    return os.path.join(config_home, 'kodi_wol_listener', 'kodi_wol_listener.conf')
+
+
+class Config():
+    """Settings of the listener, the defaults updated by a configuration file
+
+    Settings are addressed as (section, option) tuples, their type is the
+    type of the default value. Settings listed in CHOICES take one of the
+    given values only.
+
+    Args:
+        overrides (dict) Settings taking precedence over the file, e.g. given
+            on the command line
+    """
+
+    DEFAULTS = {
+        ('listener', 'port'): 42429,
+        ('listener', 'interface'): 'eth0',
+        ('listener', 'debug_level'): 'warning',
+        ('listener', 'metrics_port'): 0,
+        ('listener', 'status_hosts'): '',
+        ('kodi', 'command'): '/usr/bin/kodi',
+        ('kodi', 'jsonrpc_port'): 9090,
+        ('kodi', 'desktop_restart_command'): '/usr/bin/sudo systemctl restart sddm',
+        ('kodi', 'idle_timeout'): 0,
+        ('kodi', 'idle_action'): 'quit',
+        ('hdmi', 'vcgencmd'): '/usr/bin/vcgencmd',
+        ('cec', 'command'): '',
+        ('prewake', 'backend_mac'): '',
+        ('prewake', 'lead'): 5,
+        ('prewake', 'threshold'): 0.5,
+        ('rsync', 'process'): '',
+        ('rsync', 'unit'): 'rsync_user.service',
+        ('library', 'watch'): '',
+        ('library', 'settle'): 10.0,
+        ('hotplug', 'prelaunch'): False,
+        ('hotplug', 'throttle'): 120.0,
+        ('hotplug', 'tvservice'): '/usr/bin/tvservice',
+        ('journal', 'path'): default_journal_path(),
+        ('journal', 'max_bytes'): 1 << 20,
+    }
+
+    CHOICES = {
+        ('listener', 'debug_level'): ('notset', 'debug', 'info', 'warning', 'error',
+                                      'critical'),
+        ('kodi', 'idle_action'): ('quit', 'standby'),
+    }
+
+    def __init__(self, overrides=None):
+        self.values = dict(self.DEFAULTS)
+        self.values.update(overrides or {})
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    @classmethod
+    def load(cls, path=None, overrides=None):
+        """Read a configuration file
+
+        A missing file results in the default settings.
+
+        Args:
+            path (str) Path of the file, the default path if None
+            overrides (dict) Settings taking precedence over the file
+        Returns:
+            (Config) The settings
+        Raises:
+            ValueError The file is malformed or has unknown/invalid settings
+        """
+        config = cls()
+        parser = configparser.ConfigParser(interpolation=None)
+        try:
+            with open(path or default_config_path()) as config_file:
+                parser.read_file(config_file)
+        except FileNotFoundError:
+            pass
+        except configparser.Error as excp:
+            raise ValueError(f"Invalid configuration file: {excp}") from excp
+        for section in parser.sections():
+            for option, value in parser.items(section):
+                config.set((section, option), value)
+        config.values.update(overrides or {})
+        return config
+
+    def set(self, key, value):
+        """Set a setting from its string representation"""
+        if key not in self.DEFAULTS:
+            raise ValueError(f"Unknown setting {key[1]} in section [{key[0]}]")
+        default = self.DEFAULTS[key]
+        invalid = f"Invalid value {value!r} of setting {key[1]} in section [{key[0]}]"
+        value = value.strip()
+        if isinstance(default, bool):
+            if value.lower() not in configparser.ConfigParser.BOOLEAN_STATES:
+                raise ValueError(invalid)
+            self.values[key] = configparser.ConfigParser.BOOLEAN_STATES[value.lower()]
+            return
+        try:
+            value = type(default)(value)
+        except ValueError as excp:
+            raise ValueError(invalid) from excp
+        if key in self.CHOICES:
+            value = value.lower()
+            if value not in self.CHOICES[key]:
+                raise ValueError(f"{invalid}, expected one of {', '.join(self.CHOICES[key])}")
+        self.values[key] = value
+
+    def diff(self, other):
+        """Return the keys of the settings that differ between both configs"""
+        return {key for key, value in self.values.items() if other.values[key] != value}
@@ -0,0 +1,144 @@
+"""Local control API of the listener on a unix domain socket
+
+The protocol is line based. A client sends one of these commands:
+    status      Respond with the current state
+    start       Start kodi (like a received WOL pattern), respond with the state
+    stop        Stop kodi gracefully, respond with the state after kodi exited
+    subscribe   Respond with the current state, then with each state change
+Each response is a single line JSON object. Errors are reported as
+{"error": "<message>"}. A subscriber not reading its state changes is
+disconnected once MAX_BUFFER bytes are pending.
+
+Example:
+    $ echo status | socat - UNIX-CONNECT:$XDG_RUNTIME_DIR/kodi_wol_listener.sock
+    {"kodi_running": false, "standby": false, "hdmi": false, "uptime": 1234.5,
+     "last_wake": null, "next_wake": null}
+"""
+import os
+import json
+import stat
+import asyncio
+import logging
+
+# Bytes pending to a subscriber until it is disconnected
+MAX_BUFFER = 64 * 1024
+
+def fallback_runtime_dir():
+    """Return the directory of the socket if there is no XDG_RUNTIME_DIR"""
+    return f'/tmp/kodi_wol_listener-{os.getuid()}'
+
+def default_socket_path():
+    """Return the default path of the control socket"""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR') or fallback_runtime_dir()
+    return os.path.join(runtime_dir, 'kodi_wol_listener.sock')
+
+def check_private_dir(path):
+    """Make sure a directory is accessible by this user only
+
+    Other users may create the directory in /tmp before the listener does.
+
+    Args:
+        path (str) The directory
+    Raises:
+        OSError It is no directory, is not owned by this user or its mode is
+            not 0700
+    """
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        raise OSError(f"{path} is no directory")
+    if info.st_uid != os.getuid():
+        raise OSError(f"{path} is owned by uid {info.st_uid}")
+    if stat.S_IMODE(info.st_mode) != 0o700:
+        raise OSError(f"{path} has mode {stat.S_IMODE(info.st_mode):o}, expected 700")
+
+
+class ControlServer():
+    """Serves the control API for a KodiManager
+
+    Args:
+        manager (KodiManager) The application to control
+    """
+    def __init__(self, manager):
+        self.manager = manager
+        self.server = None
+        self.path = None
+
+    async def init(self, path=None):
+        """Start serving on the unix socket at path, replacing a stale socket
+
+        Raises:
+            OSError The socket could not be created, also if the directory
+                in /tmp is not private to this user
+        """
+        self.path = path or default_socket_path()
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        if directory == fallback_runtime_dir():
+            check_private_dir(directory)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self._client, self.path)
+        os.chmod(self.path, 0o600)
+        logging.debug("Control socket listening on %s", self.path)
+        return self
+
+    def close(self):
+        """Stop serving and remove the socket"""
+        if self.server:
+            self.server.close()
+            self.server = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    @staticmethod
+    def _encode(message):
+        return json.dumps(message).encode() + b'\n'
+
+    async def _client(self, reader, writer):
+        try:
+            async for line in reader:
+                command = line.decode(errors='replace').strip().lower()
+                if command == 'subscribe':
+                    await self._subscribe(reader, writer)
+                    break
+                writer.write(self._encode(await self._command(command)))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        except ValueError:
+            # A line exceeding the limit of the stream reader
+            logging.warning("Control client sent an overlong line, disconnected")
+        finally:
+            writer.close()
+
+    async def _command(self, command):
+        """Execute a single command, return the response"""
+        if command == 'status':
+            pass
+        elif command == 'start':
+            self.manager.kodi_start(('unix', 0))
+        elif command == 'stop':
+            await self.manager.kodi_stop()
+        else:
+            return {'error': f'unknown command {command!r}'}
+        return self.manager.status()
+
+    async def _subscribe(self, reader, writer):
+        """Push the state on each change until the client disconnects"""
+        def state_changed(status):
+            if writer.is_closing():
+                return
+            if writer.transport.get_write_buffer_size() > MAX_BUFFER:
+                logging.warning("Control subscriber does not read, disconnected")
+                # Closing would wait for the buffer to drain
+                writer.transport.abort()
+                return
+            writer.write(self._encode(status))
+        self.manager.add_state_listener(state_changed)
+        try:
+            writer.write(self._encode(self.manager.status()))
+            # Any further input is ignored, wait for the client to hang up
+            while await reader.read(4096):
+                pass
+        finally:
+            self.manager.remove_state_listener(state_changed)
@@ -1,10 +1,142 @@
-"""DBUS interface to systemd based on dbus_next"""
+"""DBUS interface to systemd based on dbus_next
+
+dbus_next is imported on first use, it is not loaded by a listener that never
+talks to systemd.
+"""
 import os
 import logging
 import asyncio
 
-from dbus_next.aio import MessageBus
-from dbus_next import BusType
+class DbusConnectionManager():
+    """Owner of the process wide DBUS connections
+
+    At most one connection per bus type is held. A connection is established
+    on first use and shared by all users, as are the proxy objects created on
+    it. If the connection is lost (e.g. dbus-daemon restarted), it is
+    re-established and the registered reconnect handlers are called, allowing
+    users to re-create their interfaces and signal subscriptions.
+    """
+
+    # Delays between reconnect attempts, the last one is repeated
+    RECONNECT_DELAYS = (0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+    def __init__(self):
+        self.loop = None
+        self.buses = {}
+        self.proxies = {}
+        self.locks = {}
+        self.reconnect_handlers = {}
+        self.watchers = {}
+
+    def _check_loop(self):
+        """Forget about connections made within another event loop"""
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            self.loop = loop
+            self.buses.clear()
+            self.proxies.clear()
+            self.locks.clear()
+            self.watchers.clear()
+            self.reconnect_handlers.clear()
+
+    async def get_bus(self, bus_type):
+        """Return the connected bus of given type, connect if required
+
+        Args:
+            bus_type (dbus_next.BusType) The bus to get
+        Returns:
+            (dbus_next.aio.MessageBus) The connected bus
+        """
+        self._check_loop()
+        bus = self.buses.get(bus_type)
+        if bus and bus.connected:
+            return bus
+        lock = self.locks.setdefault(bus_type, asyncio.Lock())
+        async with lock:
+            bus = self.buses.get(bus_type)
+            if bus and bus.connected:
+                return bus
+            reconnect = bus_type in self.buses
+            self.proxies.pop(bus_type, None)
+            from dbus_next.aio import MessageBus  # pylint: disable=import-outside-toplevel
+            bus = await MessageBus(bus_type=bus_type).connect()
+            logging.debug("DBUS %s bus %sconnected as %s", bus_type.name.lower(),
+                          're' if reconnect else '', bus.unique_name)
+            self.buses[bus_type] = bus
+            self.watchers[bus_type] = self.loop.create_task(self._watch(bus_type, bus))
+        return bus
+
+    async def get_object(self, bus_type, service, obj_path):
+        """Return a (shared) proxy object
+
+        Args:
+            bus_type (dbus_next.BusType) The bus the service is located on
+            service (str) The DBUS service name
+            obj_path (str) The path of the object within the service
+        Returns:
+            (dbus_next.aio.ProxyObject) The proxy object
+        """
+        bus = await self.get_bus(bus_type)
+        proxies = self.proxies.setdefault(bus_type, {})
+        key = (service, obj_path)
+        if key not in proxies:
+            introspection = await bus.introspect(service, obj_path)
+            proxies[key] = bus.get_proxy_object(service, obj_path, introspection)
+        return proxies[key]
+
+    def add_reconnect_handler(self, bus_type, handler):
+        """Register a coroutine function called after the bus got reconnected"""
+        self.reconnect_handlers.setdefault(bus_type, []).append(handler)
+
+    def remove_reconnect_handler(self, bus_type, handler):
+        """Unregister a handler registered by add_reconnect_handler"""
+        self.reconnect_handlers.get(bus_type, []).remove(handler)
+
+    async def _watch(self, bus_type, bus):
+        """Wait for the loss of a connection, reconnect if anybody depends on it"""
+        try:
+            await bus.wait_for_disconnect()
+        except Exception as excp:  # pylint: disable=broad-except
+            logging.warning("DBUS %s bus connection lost: %s", bus_type.name.lower(), excp)
+        if self.buses.get(bus_type) is not bus:
+            return
+        pending = list(self.reconnect_handlers.get(bus_type, []))
+        for delay in self._reconnect_delays():
+            # Skip handlers unregistered in the meantime
+            registered = self.reconnect_handlers.get(bus_type, [])
+            pending = [handler for handler in pending if handler in registered]
+            if not pending:
+                # Nobody is waiting, connect again on next use
+                return
+            await asyncio.sleep(delay)
+            try:
+                await self.get_bus(bus_type)
+            except Exception as excp:  # pylint: disable=broad-except
+                logging.debug("DBUS reconnect failed: %s", excp)
+                continue
+            # Handlers failing (e.g. service not yet back on the bus) are retried
+            for handler in list(pending):
+                try:
+                    await handler()
+                    pending.remove(handler)
+                except Exception as excp:  # pylint: disable=broad-except
+                    logging.debug("DBUS reconnect handler failed: %s", excp)
+
+    def _reconnect_delays(self):
+        yield from self.RECONNECT_DELAYS
+        while True:
+            yield self.RECONNECT_DELAYS[-1]
+
+    def disconnect(self):
+        """Close all connections"""
+        for watcher in self.watchers.values():
+            watcher.cancel()
+        for bus in self.buses.values():
+            bus.disconnect()
+        self.buses.clear()
+        self.proxies.clear()
+        self.watchers.clear()
+
 
 class DbusSystemd():
     """Base class containing common definitions and methods"""
@@ -12,32 +144,47 @@ class DbusSystemd():
     # The typical path of systemd service on system DBUS
     DBUS_SERVICE_SYSTEMD = 'org.freedesktop.systemd1'
 
+    # Connections shared by all instances
+    connections = DbusConnectionManager()
+
     def __init__(self):
         self.bus = None
+        self.bus_type = None
 
     async def init(self, use_system_bus=False):
         """Asyncio initialization
 
-        Initialize connection to the bus
+        Initialize connection to the bus. The connection is shared with all
+        other DbusSystemd instances on the same bus.
 
         Args:
             use_system_bus (bool) True to connect to system bus
         """
-        bus_type = BusType.SYSTEM if use_system_bus else BusType.SESSION
-        self.bus = MessageBus(bus_type=bus_type)
-        await self.bus.connect()
+        from dbus_next import BusType  # pylint: disable=import-outside-toplevel
+        self.bus_type = BusType.SYSTEM if use_system_bus else BusType.SESSION
+        self.bus = await self.connections.get_bus(self.bus_type)
         return self
 
     async def get_object(self, obj_path):
         """Get an object from systemd dbus service"""
-        introspection = await self.bus.introspect(self.DBUS_SERVICE_SYSTEMD, obj_path)
-        # Select systemd service object
-        return self.bus.get_proxy_object(self.DBUS_SERVICE_SYSTEMD, obj_path, introspection)
+        return await self.connections.get_object(self.bus_type, self.DBUS_SERVICE_SYSTEMD,
+                                                 obj_path)
+
+    def add_reconnect_handler(self, handler):
+        """Register a coroutine function called after the bus got reconnected"""
+        self.connections.add_reconnect_handler(self.bus_type, handler)
+
+    def remove_reconnect_handler(self, handler):
+        """Unregister a handler registered by add_reconnect_handler"""
+        self.connections.remove_reconnect_handler(self.bus_type, handler)
 
 
 class SystemdUnit():
     """Asyncio based Systemd.unit wrapper"""
 
+    __slots__ = ('service_name', 'service_if', 'service_state', 'properties_if',
+                 'status_callback', 'job', 'systemd')
+
     # Base path of units within systemd DBUS service
     DBUS_OBJECT_UNIT_BASE = '/org/freedesktop/systemd1/unit/'
 
@@ -61,6 +208,7 @@ class SystemdUnit():
         self.properties_if = None
         self.status_callback = status_callback
         self.job = None
+        self.systemd = None
 
     @property
     def state(self):
@@ -91,9 +239,17 @@ class SystemdUnit():
         Args:
             systemd (DbusSystemd) Initialized systemd object
         """
+        self.systemd = systemd
+        await self._bind()
+        # Bind again to the new connection in case the bus is reconnected
+        systemd.add_reconnect_handler(self._rebind)
+        return self
+
+    async def _bind(self):
+        """Get interfaces and subscribe to signals on the current connection"""
         # Select systemd service object
         dbus_name = self.DBUS_OBJECT_UNIT_BASE + self.get_mangled_unit_object_name()
-        obj = await systemd.get_object(dbus_name)
+        obj = await self.systemd.get_object(dbus_name)
         # Get required interfaces
         self.service_if = obj.get_interface(self.DBUS_INTERFACE_UNIT)
         self.properties_if = obj.get_interface(self.DBUS_INTERFACE_PROPERTIES)
@@ -102,7 +258,21 @@ class SystemdUnit():
         # Get initial service state
         state = await self.properties_if.call_get(self.DBUS_INTERFACE_UNIT, 'ActiveState')
         self.state = state.value
-        return self
+
+    async def _rebind(self):
+        """Reconnect handler, reports state changes missed while disconnected"""
+        prev_state = self.state
+        await self._bind()
+        if self.state != prev_state and self.status_callback:
+            self.status_callback(self.state)
+
+    def close(self):
+        """Stop monitoring the unit"""
+        if self.properties_if:
+            self.properties_if.off_properties_changed(self.on_properties_changed_cb)
+        if self.systemd:
+            self.systemd.remove_reconnect_handler(self._rebind)
+            self.systemd = None
 
     def on_properties_changed_cb(self, interface_name, changed_properties, invalidated_properties):
         """Callback for receiving properties changed signals for given unit
@@ -166,6 +336,7 @@ class SystemdManager():
 
     def __init__(self):
         self.manager_if = None
+        self.systemd = None
 
     async def init(self, systemd):
         """Initialize a system wrapper on given bus
@@ -177,12 +348,24 @@ class SystemdManager():
         Args:
             systemd (DbusSystemd) Initialized systemd object
         """
+        self.systemd = systemd
+        await self._bind()
+        # Bind again to the new connection in case the bus is reconnected
+        systemd.add_reconnect_handler(self._bind)
+        return self
+
+    async def _bind(self):
+        """Get the manager interface on the current connection"""
         # Select systemd service object
-        obj = await systemd.get_object(self.DBUS_OBJECT_SYSTEMD)
+        obj = await self.systemd.get_object(self.DBUS_OBJECT_SYSTEMD)
         # Get required interface
         self.manager_if = obj.get_interface(self.DBUS_INTERFACE_MANAGER)
 
-        return self
+    def close(self):
+        """Release the manager, it is not re-bound on reconnects anymore"""
+        if self.systemd:
+            self.systemd.remove_reconnect_handler(self._bind)
+            self.systemd = None
 
     async def reload(self):
         """Equivalent to systemctl daemon-reload"""
@@ -239,3 +422,17 @@ class SystemdManager():
             unit (str) Unit to stop. Should be unit name, not path
         """
         await self.manager_if.call_stop_unit(unit, 'fail')
+
+    async def set_unit_properties(self, unit, properties, runtime=True):
+        """Equivalent to systemctl set-property
+
+        Args:
+            unit (str) Unit to change. Should be unit name, not path
+            properties (dict[str:tuple]) (D-Bus signature, value) of each
+                property to set, e.g. {'CPUWeight': ('t', 10)}
+            runtime (bool) True if the change shall not survive a reboot
+        """
+        from dbus_next import Variant  # pylint: disable=import-outside-toplevel
+        await self.manager_if.call_set_unit_properties(
+            unit, runtime, [[name, Variant(signature, value)]
+                            for name, (signature, value) in properties.items()])
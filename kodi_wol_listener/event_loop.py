@@ -0,0 +1,57 @@
+"""Selection of the asyncio event loop implementation"""
+import asyncio
+import logging
+import enum
+
+class EventLoop(enum.Enum):
+    """Available event loop implementations"""
+    ASYNCIO = 'asyncio'
+    UVLOOP = 'uvloop'
+
+
+def new_event_loop(loop_type=EventLoop.ASYNCIO):
+    """Create a new event loop of given type
+
+    Falls back to the default asyncio loop if uvloop is not installed.
+
+    Args:
+        loop_type (EventLoop) The requested implementation
+    Returns:
+        (asyncio.AbstractEventLoop, EventLoop) The loop and its actual type
+    """
+    if loop_type == EventLoop.UVLOOP:
+        try:
+            import uvloop  # pylint: disable=import-outside-toplevel
+            return uvloop.new_event_loop(), EventLoop.UVLOOP
+        except ImportError:
+            logging.warning("uvloop is not installed, using the asyncio event loop")
+    return asyncio.new_event_loop(), EventLoop.ASYNCIO
+
+
+class _EventLoopPolicy(asyncio.DefaultEventLoopPolicy):
+    """Creates the loops of asyncio.run() with new_event_loop()"""
+    def __init__(self, loop_type):
+        super().__init__()
+        self.loop_type = loop_type
+
+    def new_event_loop(self):
+        return new_event_loop(self.loop_type)[0]
+
+
+def install_event_loop(loop_type=EventLoop.ASYNCIO):
+    """Make asyncio.run() use the given event loop implementation
+
+    Falls back to the default asyncio loop if uvloop is not installed, see
+    new_event_loop().
+
+    Args:
+        loop_type (EventLoop) The requested implementation
+    Returns:
+        (EventLoop) The implementation actually installed
+    """
+    loop, actual = new_event_loop(loop_type)
+    loop.close()
+    if actual != EventLoop.ASYNCIO:
+        asyncio.set_event_loop_policy(_EventLoopPolicy(actual))
+        logging.debug("Using %s event loop", actual.value)
+    return actual
@@ -0,0 +1,193 @@
+"""Control the TV via HDMI-CEC through a long-lived cec-client co-process
+
+cec-client scans the CEC bus for several seconds when it starts. Instead of
+spawning it per command, a single process is kept running and commands are
+written to its stdin, one per line (e.g. 'on 0', 'as', 'pow 0'). Its output
+is parsed by a reader task, replies are matched to the pending commands.
+
+The process is started in the background and restarted on the next command
+if it died.
+"""
+import os
+import re
+import shlex
+import asyncio
+import logging
+import collections
+
+from kodi_wol_listener import metrics
+
+CEC_COMMANDS = metrics.counter('kodi_wol_listener_cec_commands', 'Commands sent to cec-client',
+                               ['command'])
+
+class CecError(Exception):
+    """cec-client is not available or did not respond"""
+
+
+class CecClient():
+    """Send commands to a persistent cec-client process
+
+    Commands are queued and written in order. Commands with a reply wait for
+    the reply line, all others complete as soon as they have been written.
+
+    Args:
+        command (bytes) The cec-client command line (executed without a
+            shell), without the device argument it scans for the adapter
+        timeout (float) Seconds to wait for the adapter to be ready and for
+            replies
+    """
+
+    # Printed by cec-client once the adapter is open and commands are accepted
+    READY = 'waiting for input'
+    # Printed by cec-client if no adapter could be opened
+    FAILED = ('could not open a connection', 'no serial port given')
+
+    POWER_STATUS = re.compile(r'power status:\s*(\S+)')
+
+    def __init__(self, command=b'/usr/bin/cec-client -d 1 -t p -o Kodi', timeout=15.0):
+        self.command = command
+        self.timeout = timeout
+        self.proc = None
+        self.ready = None
+        self.reader_task = None
+        self.lock = asyncio.Lock()
+        # Pending replies in command order as (pattern, future)
+        self.replies = collections.deque()
+
+    @property
+    def running(self):
+        """True while the cec-client process is running"""
+        return self.proc is not None and self.proc.returncode is None
+
+    async def start(self):
+        """Start cec-client, return as soon as it accepts commands
+
+        Raises:
+            CecError cec-client failed to open the adapter in time
+        """
+        if not self.running:
+            logging.debug("Starting %s", self.command.decode(errors='replace'))
+            self.ready = asyncio.get_running_loop().create_future()
+            # Not via a shell, the process shall get the signals
+            try:
+                self.proc = await asyncio.create_subprocess_exec(
+                    *shlex.split(os.fsdecode(self.command)),
+                    stdin=asyncio.subprocess.PIPE,  #pylint: disable=no-member
+                    stdout=asyncio.subprocess.PIPE,  #pylint: disable=no-member
+                    stderr=asyncio.subprocess.STDOUT)  #pylint: disable=no-member
+            except OSError as excp:
+                raise CecError(f"Starting cec-client failed: {excp}") from excp
+            self.reader_task = asyncio.get_running_loop().create_task(self._read(self.proc))
+        try:
+            await asyncio.wait_for(asyncio.shield(self.ready), self.timeout)
+        except asyncio.TimeoutError:
+            await self.close()
+            raise CecError("cec-client did not get ready in time") from None
+        except CecError:
+            await self.close()
+            raise
+        return self
+
+    async def close(self):
+        """Quit cec-client, kill it if it does not exit"""
+        if self.running:
+            try:
+                self.proc.stdin.write(b'q\n')
+                await asyncio.wait_for(self.proc.wait(), 2)
+            except (asyncio.TimeoutError, ConnectionError):
+                self.proc.kill()
+        if self.reader_task:
+            await self.reader_task
+            self.reader_task = None
+
+    async def _read(self, proc):
+        """Parse the output of the process until it exits"""
+        while True:
+            line = await proc.stdout.readline()
+            if not line:
+                break
+            line = line.decode(errors='replace').strip()
+            logging.debug("cec-client: %s", line)
+            lowered = line.lower()
+            if not self.ready.done():
+                if self.READY in lowered:
+                    self.ready.set_result(True)
+                elif any(failure in lowered for failure in self.FAILED):
+                    self.ready.set_exception(CecError(line))
+                continue
+            # Entries of callers that gave up are skipped
+            while self.replies and self.replies[0][1].done():
+                self.replies.popleft()
+            if self.replies:
+                pattern, future = self.replies[0]
+                match = pattern.search(lowered)
+                if match:
+                    self.replies.popleft()
+                    future.set_result(match.group(1))
+        await proc.wait()
+        logging.debug("cec-client exited with %d", proc.returncode)
+        error = CecError(f"cec-client exited with {proc.returncode}")
+        if not self.ready.done():
+            self.ready.set_exception(error)
+        while self.replies:
+            _, future = self.replies.popleft()
+            if not future.done():
+                future.set_exception(error)
+
+    async def send(self, command, reply=None):
+        """Queue a command
+
+        Args:
+            command (str) The cec-client command, e.g. 'on 0'
+            reply (re.Pattern) Pattern of the reply line, its first group is
+                returned. None if the command has no reply.
+        Returns:
+            (str) The first group of the reply pattern, None without reply
+        Raises:
+            CecError cec-client is not available or did not reply in time
+        """
+        async with self.lock:
+            await self.start()
+            future = None
+            if reply:
+                future = asyncio.get_running_loop().create_future()
+                self.replies.append((reply, future))
+            CEC_COMMANDS.inc(command.split()[0])
+            try:
+                self.proc.stdin.write(command.encode() + b'\n')
+                await self.proc.stdin.drain()
+            except ConnectionError as excp:
+                raise CecError(f"cec-client gone: {excp}") from excp
+        if future is None:
+            return None
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            raise CecError(f"No reply to {command}") from None
+        finally:
+            # A timed out or cancelled reply must not take the next reply line
+            try:
+                self.replies.remove((reply, future))
+            except ValueError:
+                pass
+
+    async def power_on(self, address=0):
+        """Power on the device with given logical address, 0 is the TV"""
+        await self.send(f'on {address}')
+
+    async def standby(self, address=0):
+        """Put the device with given logical address into standby"""
+        await self.send(f'standby {address}')
+
+    async def active_source(self):
+        """Make this device the active source, the TV switches its input"""
+        await self.send('as')
+
+    async def power_status(self, address=0):
+        """Return the power status of a device, e.g. 'on' or 'standby'"""
+        return await self.send(f'pow {address}', self.POWER_STATUS)
+
+    async def wake_tv(self):
+        """Power on the TV and switch it to this device"""
+        await self.power_on(0)
+        await self.active_source()
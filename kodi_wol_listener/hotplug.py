@@ -0,0 +1,207 @@
+"""Watch for a display being connected to the HDMI port
+
+Users often switch the TV on first and only then open the remote app sending
+the magic packet. Switching the TV on raises the hotplug detect line of the
+HDMI port, so kodi can be started before the packet arrives.
+
+With the KMS driver, the kernel reports hotplugs as uevents of the drm
+subsystem on a NETLINK_KOBJECT_UEVENT socket. The uevent does not tell the
+new state, it is read from the status files of the HDMI connectors. With the
+legacy firmware driver there are no connectors, the events printed by
+'tvservice -M' are parsed instead.
+
+A flapping hotplug line (e.g. a TV cycling through its inputs) reports
+attaches in quick succession, they are throttled.
+"""
+import os
+import glob
+import errno
+import time
+import shlex
+import socket
+import asyncio
+import logging
+
+from kodi_wol_listener import metrics
+
+HOTPLUG_EVENTS = metrics.counter('kodi_wol_listener_hotplug_events',
+                                 'Display hotplug events', ['event'])
+
+NETLINK_KOBJECT_UEVENT = 15
+# Multicast group of the uevents sent by the kernel (udev uses 2)
+UEVENT_KERNEL_GROUP = 1
+
+
+def parse_uevent(data):
+    """Parse a kernel uevent message
+
+    Args:
+        data (bytes) The message, 'action@devpath' followed by KEY=value
+            fields, each terminated by a null byte
+    Returns:
+        (dict) The fields, None if the message is not a kernel uevent
+    """
+    fields = data.split(b'\0')
+    if b'@' not in fields[0]:
+        # E.g. a message of udev, starting with 'libudev'
+        return None
+    event = {}
+    for field in fields[1:]:
+        key, sep, value = field.partition(b'=')
+        if sep:
+            event[key.decode(errors='replace')] = value.decode(errors='replace')
+    return event
+
+
+def connector_status(drm_dir='/sys/class/drm'):
+    """Return True if a display is connected to an HDMI connector
+
+    Args:
+        drm_dir (str) The sysfs directory of the drm devices
+    Returns:
+        (bool) The state, None if there is no HDMI connector
+    """
+    connected = None
+    for path in glob.glob(os.path.join(drm_dir, 'card*-HDMI-A-*', 'status')):
+        try:
+            with open(path) as status:
+                state = status.read().strip() == 'connected'
+        except OSError:
+            continue
+        connected = connected or state
+    return connected
+
+
+class HotplugMonitor():
+    """Call back once a display got connected
+
+    Args:
+        callback (callable) Called without arguments as a display got
+            connected
+        throttle (float) Minimum seconds between two callbacks, attaches in
+            between are dropped
+        tvservice (bytes) The tvservice command line monitoring the HDMI
+            port, used if there are no drm connectors
+        drm_dir (str) The sysfs directory of the drm devices
+    """
+
+    # tvservice -M lines reporting the hotplug state
+    TVSERVICE_ATTACHED = 'hdmi is attached'
+    TVSERVICE_UNPLUGGED = 'hdmi cable is unplugged'
+
+    def __init__(self, callback, throttle=120.0, tvservice=b'/usr/bin/tvservice',
+                 drm_dir='/sys/class/drm'):
+        self.callback = callback
+        self.throttle = throttle
+        self.tvservice = tvservice
+        self.drm_dir = drm_dir
+        # Last known state, None if unknown
+        self.connected = None
+        self.last_callback = None
+        self.sock = None
+        self.proc = None
+        self.reader_task = None
+
+    async def start(self, sock=None):
+        """Start monitoring
+
+        Args:
+            sock (socket) Datagram socket receiving the uevents, a netlink
+                socket is opened if None
+        Raises:
+            OSError Neither uevents nor tvservice are available
+        """
+        self.connected = connector_status(self.drm_dir)
+        if sock is None and self.connected is not None:
+            try:
+                sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM,
+                                     NETLINK_KOBJECT_UEVENT)
+                sock.bind((0, UEVENT_KERNEL_GROUP))
+            except OSError as excp:
+                logging.warning("Receiving uevents failed, using tvservice: %s", excp)
+                sock = None
+        if sock is not None:
+            sock.setblocking(False)
+            self.sock = sock
+            asyncio.get_running_loop().add_reader(self.sock.fileno(), self._read_uevents)
+            logging.debug("Monitoring HDMI hotplug uevents, display %sconnected",
+                          '' if self.connected else 'not ')
+        else:
+            self.proc = await asyncio.create_subprocess_exec(
+                *shlex.split(os.fsdecode(self.tvservice)), '-M',
+                stdin=asyncio.subprocess.DEVNULL,  #pylint: disable=no-member
+                stdout=asyncio.subprocess.PIPE,  #pylint: disable=no-member
+                stderr=asyncio.subprocess.STDOUT)  #pylint: disable=no-member
+            self.reader_task = asyncio.get_running_loop().create_task(self._read_tvservice())
+            logging.debug("Monitoring HDMI hotplug with tvservice")
+        return self
+
+    async def close(self):
+        """Stop monitoring"""
+        if self.sock is not None:
+            asyncio.get_running_loop().remove_reader(self.sock.fileno())
+            self.sock.close()
+            self.sock = None
+        if self.proc and self.proc.returncode is None:
+            self.proc.kill()
+        if self.reader_task:
+            await self.reader_task
+            self.reader_task = None
+        self.proc = None
+
+    def _read_uevents(self):
+        """Handle the received uevents"""
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except BlockingIOError:
+                return
+            except OSError as excp:
+                if excp.errno == errno.ENOBUFS:
+                    # uevents got lost, the state is read from sysfs anyway
+                    logging.debug("uevents lost")
+                    self._hotplug(connector_status(self.drm_dir))
+                    continue
+                logging.error("Receiving uevents failed, HDMI hotplug not monitored: %s", excp)
+                asyncio.get_running_loop().remove_reader(self.sock.fileno())
+                self.sock.close()
+                self.sock = None
+                return
+            event = parse_uevent(data)
+            if event and event.get('SUBSYSTEM') == 'drm' and event.get('HOTPLUG') == '1':
+                self._hotplug(connector_status(self.drm_dir))
+
+    async def _read_tvservice(self):
+        """Parse the output of tvservice until it exits"""
+        while True:
+            line = await self.proc.stdout.readline()
+            if not line:
+                break
+            line = line.decode(errors='replace').strip().lower()
+            if self.TVSERVICE_ATTACHED in line:
+                self._hotplug(True)
+            elif self.TVSERVICE_UNPLUGGED in line:
+                self._hotplug(False)
+        await self.proc.wait()
+        if self.proc.returncode > 0:
+            logging.warning("tvservice exited with %d, HDMI hotplug not monitored",
+                            self.proc.returncode)
+
+    def _hotplug(self, connected):
+        """Handle the current state, call back on a new connection"""
+        if connected is None or connected == self.connected:
+            return
+        self.connected = connected
+        if not connected:
+            HOTPLUG_EVENTS.inc('detached')
+            logging.debug("Display disconnected")
+            return
+        now = time.monotonic()
+        if self.last_callback is not None and now - self.last_callback < self.throttle:
+            HOTPLUG_EVENTS.inc('throttled')
+            logging.debug("Display connected, throttled")
+            return
+        HOTPLUG_EVENTS.inc('attached')
+        logging.info("Display connected")
+        self.last_callback = now
+        self.callback()
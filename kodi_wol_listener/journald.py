@@ -0,0 +1,121 @@
+"""Logging handler writing records to the systemd journal
+
+Records are sent as datagrams in the journal native protocol to the journald
+socket, no text formatting or colouring is done besides the message itself.
+Besides MESSAGE and PRIORITY, the record source (CODE_FILE, CODE_LINE,
+CODE_FUNC, LOGGER) and all upper case attributes of the record are sent as
+fields. Those are given by the extra argument of the logging calls:
+    logging.info("Kodi started", extra={'KODI_PID': pid})
+and can be queried on, e.g. journalctl --user KODI_PID=1234.
+"""
+import os
+import re
+import socket
+import struct
+import logging
+
+SOCKET_PATH = '/run/systemd/journal/socket'
+
+# Valid journal field names, fields starting with an underscore are trusted
+# ones set by journald
+_FIELD_NAME = re.compile(r'^[A-Z0-9][A-Z0-9_]*$')
+
+_PRIORITIES = ((logging.CRITICAL, b'2'), (logging.ERROR, b'3'), (logging.WARNING, b'4'),
+               (logging.INFO, b'6'))
+
+def journal_stream_connected():
+    """True if stderr is connected to the journal (the process runs under systemd)
+
+    systemd sets JOURNAL_STREAM to <device>:<inode> of the stream it connected
+    to stdout/stderr.
+    """
+    try:
+        device, inode = (int(value) for value in os.environ['JOURNAL_STREAM'].split(':'))
+        stat = os.fstat(2)
+    except (KeyError, ValueError, OSError):
+        return False
+    return (stat.st_dev, stat.st_ino) == (device, inode)
+
+def _priority(levelno):
+    for level, priority in _PRIORITIES:
+        if levelno >= level:
+            return priority
+    return b'7'
+
+def _field(name, value):
+    """Serialize a single field in the journal native protocol"""
+    if not isinstance(value, bytes):
+        value = str(value).encode('utf-8', errors='replace')
+    name = name.encode('ascii')
+    if b'\n' in value:
+        return name + b'\n' + struct.pack('<Q', len(value)) + value + b'\n'
+    return name + b'=' + value + b'\n'
+
+
+class JournalHandler(logging.Handler):
+    """Send log records to journald
+
+    The socket is non-blocking, records are dropped (and counted in
+    self.dropped) instead of blocking the event loop if journald is congested.
+
+    Args:
+        identifier (str) SYSLOG_IDENTIFIER of the records
+        socket_path (str) Path of the journald native protocol socket
+        level (int) Minimal level of the records handled
+    """
+    def __init__(self, identifier='kodi_wol_listener', socket_path=SOCKET_PATH,
+                 level=logging.NOTSET):
+        super().__init__(level)
+        self.socket_path = socket_path
+        self.identifier = _field('SYSLOG_IDENTIFIER', identifier)
+        self.sock = None
+        self.dropped = 0
+
+    def _socket(self):
+        if self.sock is None:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.sock.setblocking(False)
+        return self.sock
+
+    def serialize(self, record):
+        """Return the datagram for a record"""
+        # The message is only formatted here, after all level filters passed
+        fields = [_field('MESSAGE', self.format(record)),
+                  b'PRIORITY=' + _priority(record.levelno) + b'\n',
+                  self.identifier,
+                  _field('LOGGER', record.name),
+                  _field('CODE_FILE', record.pathname),
+                  _field('CODE_LINE', record.lineno),
+                  _field('CODE_FUNC', record.funcName)]
+        for name, value in record.__dict__.items():
+            if _FIELD_NAME.match(name):
+                fields.append(_field(name, value))
+        return b''.join(fields)
+
+    def emit(self, record):
+        try:
+            self._socket().sendto(self.serialize(record), self.socket_path)
+        except BlockingIOError:
+            self.dropped += 1
+        except Exception:  # pylint: disable=broad-except
+            self.handleError(record)
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+        super().close()
+
+
+def install(level='warning', identifier='kodi_wol_listener'):
+    """Make a JournalHandler the only handler of the root logger
+
+    Args:
+        level (str) Name of the minimal level logged
+        identifier (str) SYSLOG_IDENTIFIER of the records
+    """
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(JournalHandler(identifier))
+    root.setLevel(level.upper())
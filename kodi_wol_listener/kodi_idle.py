@@ -0,0 +1,95 @@
+"""Detects an unused Kodi by polling its JSON-RPC API"""
+import time
+import logging
+import asyncio
+
+from kodi_wol_listener.kodi_jsonrpc import KodiJsonRpcError
+
+class KodiIdleMonitor():
+    """Poll Kodi for user activity, call a coroutine function once it is idle
+
+    Kodi is considered in use while a player is active or user input has been
+    received. Kodi is idle as soon as neither has happened for idle_timeout
+    seconds. An active screensaver is taken as proof of no recent input.
+
+    The poll interval adapts to the situation to keep the overhead low: during
+    playback Kodi is polled rarely, without playback the interval shrinks as
+    the idle deadline comes closer.
+
+    Args:
+        rpc (KodiJsonRpc) The JSON-RPC client for the Kodi to monitor
+        idle_timeout (float) Seconds without activity until Kodi is idle
+        idle_callback (coroutine function) Awaited once Kodi got idle
+    """
+
+    # Poll interval while a player is active
+    PLAYING_INTERVAL = 300.0
+    # Bounds of the poll interval without playback
+    MIN_INTERVAL = 5.0
+    MAX_INTERVAL = 120.0
+
+    def __init__(self, rpc, idle_timeout, idle_callback):
+        self.rpc = rpc
+        self.idle_timeout = idle_timeout
+        self.idle_callback = idle_callback
+        self.idle_since = None
+        self.playing = False
+
+    def next_interval(self, now):
+        """Return the time to wait until the next poll
+
+        Args:
+            now (float) Current time.monotonic()
+        """
+        remaining = self.idle_timeout - (now - self.idle_since)
+        if self.playing:
+            # Idle time starts counting not before playback has ended
+            return min(self.PLAYING_INTERVAL, self.idle_timeout)
+        interval = min(max(remaining / 2, self.MIN_INTERVAL), self.MAX_INTERVAL)
+        return max(min(interval, remaining), 0)
+
+    async def poll(self, now):
+        """Query Kodi for activity and update the idle start time
+
+        Args:
+            now (float) Current time.monotonic()
+        Returns:
+            (bool) True if Kodi has been idle for idle_timeout seconds
+        """
+        players = await self.rpc.call('Player.GetActivePlayers')
+        self.playing = bool(players)
+        if self.playing:
+            self.idle_since = now
+            return False
+        # IdleTime(n) is true if there was no input within the last n seconds
+        idle_seconds = max(int(now - self.idle_since), 1)
+        idle_label = f'System.IdleTime({idle_seconds})'
+        booleans = await self.rpc.call('XBMC.GetInfoBooleans',
+                                       {'booleans': ['System.ScreenSaverActive', idle_label]})
+        booleans = {key.lower(): value for key, value in booleans.items()}
+        if not (booleans.get('system.screensaveractive') or booleans.get(idle_label.lower())):
+            self.idle_since = now
+        return now - self.idle_since >= self.idle_timeout
+
+    async def run(self):
+        """Monitor Kodi until it got idle, then await the idle callback
+
+        Errors while talking to Kodi (e.g. during Kodi startup) are logged and
+        the poll is repeated, they do not count as activity or idleness.
+        """
+        self.idle_since = time.monotonic()
+        self.playing = False
+        while True:
+            now = time.monotonic()
+            try:
+                if await self.poll(now):
+                    break
+                interval = self.next_interval(time.monotonic())
+            except (OSError, asyncio.TimeoutError, KodiJsonRpcError) as excp:
+                logging.debug("Kodi idle poll failed: %r", excp)
+                interval = max(self.next_interval(time.monotonic()), self.MIN_INTERVAL)
+            logging.debug("Kodi %s, next idle poll in %.1fs",
+                          'playing' if self.playing else 'not playing', interval)
+            await asyncio.sleep(interval)
+        logging.info("Kodi idle for %ds", self.idle_timeout)
+        await self.idle_callback()
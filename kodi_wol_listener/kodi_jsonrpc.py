@@ -0,0 +1,145 @@
+"""Minimal asyncio client for the Kodi JSON-RPC API
+
+Kodi offers JSON-RPC on a raw TCP socket (port 9090 by default). Requests and
+responses are plain JSON objects without any framing, notifications sent by
+Kodi are interleaved with the responses.
+"""
+import json
+import logging
+import asyncio
+
+class KodiJsonRpcError(Exception):
+    """Error response received from Kodi"""
+
+
+class KodiJsonRpc():
+    """Asyncio based Kodi JSON-RPC client on the raw TCP interface
+
+    The connection is established lazily on the first call and kept open
+    until close() is called or Kodi closes it.
+    """
+
+    DEFAULT_PORT = 9090
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, timeout=5.0,
+                 notification_callback=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.notification_callback = notification_callback
+        self.reader = None
+        self.writer = None
+        self.read_task = None
+        # Serializes connecting, created in the event loop on first use
+        self.connect_lock = None
+        self.pending = {}
+        self.request_id = 0
+
+    @property
+    def connected(self):
+        """True if a connection to Kodi is established"""
+        return self.writer is not None
+
+    async def connect(self):
+        """Connect to Kodi, raises OSError if Kodi is not listening
+
+        Concurrent callers share a single connection.
+        """
+        if self.connected:
+            return self
+        if self.connect_lock is None:
+            self.connect_lock = asyncio.Lock()
+        async with self.connect_lock:
+            if self.connected:
+                return self
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout)
+            self.reader, self.writer = reader, writer
+            self.read_task = asyncio.get_running_loop().create_task(
+                self._read_loop(reader, writer))
+        logging.debug("Kodi JSON-RPC connected to %s:%d", self.host, self.port)
+        return self
+
+    def close(self):
+        """Close the connection, fail all pending calls"""
+        if self.read_task:
+            self.read_task.cancel()
+            self.read_task = None
+        if self.writer:
+            self.writer.close()
+        self.reader = None
+        self.writer = None
+        for fut in self.pending.values():
+            if not fut.done():
+                fut.set_exception(ConnectionError('Kodi JSON-RPC connection closed'))
+        self.pending.clear()
+
+    async def call(self, method, params=None):
+        """Call a JSON-RPC method and return its result
+
+        Args:
+            method (str) The method to call, e.g. 'Player.GetActivePlayers'
+            params (dict) Optional method parameters
+        Returns:
+            The 'result' member of the response
+        Raises:
+            (OSError) If Kodi cannot be reached or the connection is lost
+            (asyncio.TimeoutError) If Kodi does not respond in time
+            (KodiJsonRpcError) If Kodi responds with an error
+        """
+        await self.connect()
+        self.request_id += 1
+        request = {'jsonrpc': '2.0', 'method': method, 'id': self.request_id}
+        if params is not None:
+            request['params'] = params
+        fut = asyncio.get_running_loop().create_future()
+        self.pending[self.request_id] = fut
+        try:
+            self.writer.write(json.dumps(request).encode())
+            return await asyncio.wait_for(fut, self.timeout)
+        finally:
+            self.pending.pop(request['id'], None)
+
+    async def _read_loop(self, reader, writer):
+        """Split the incoming stream into JSON objects and dispatch them
+
+        The connection is closed as it ends, the current one only if it is
+        still this one.
+        """
+        decoder = json.JSONDecoder()
+        buf = ''
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                buf += data.decode(errors='replace')
+                while buf:
+                    buf = buf.lstrip()
+                    try:
+                        message, end = decoder.raw_decode(buf)
+                    except ValueError:
+                        # Incomplete object, wait for more data
+                        break
+                    buf = buf[end:]
+                    self._dispatch(message)
+        except OSError as excp:
+            logging.debug("Kodi JSON-RPC connection error: %s", excp)
+        if writer is self.writer:
+            self.read_task = None
+            self.close()
+        else:
+            writer.close()
+
+    def _dispatch(self, message):
+        """Hand a received message to the waiting call or notification callback"""
+        if 'id' in message:
+            fut = self.pending.get(message['id'])
+            if fut is None or fut.done():
+                return
+            if 'error' in message:
+                fut.set_exception(KodiJsonRpcError(message['error']))
+            else:
+                fut.set_result(message.get('result'))
+        elif 'method' in message and self.notification_callback:
+            self.notification_callback(message['method'], message.get('params'))
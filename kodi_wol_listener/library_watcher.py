@@ -0,0 +1,163 @@
+"""Watch the video directory for new files using inotify
+
+New recordings and videos are uploaded by rsync, which writes each file as a
+hidden temporary file and renames it when complete. The watcher collects the
+directories that got new files or subdirectories and reports them once no
+further change happened for a settle time, so a whole upload results in a
+single report. Kodi is then asked to scan just these directories instead of
+the whole library.
+
+inotify is used through ctypes, each directory of the tree is watched.
+"""
+import os
+import time
+import errno
+import ctypes
+import struct
+import asyncio
+import logging
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+# struct inotify_event without the name following it
+EVENT = struct.Struct('iIII')
+
+
+def coalesce(directories):
+    """Return the directories without those below another one of them
+
+    Args:
+        directories (iterable of str) Directories, without trailing separator
+    Returns:
+        (list of str) The remaining directories, sorted
+    """
+    result = []
+    for directory in sorted(directories):
+        # A parent sorts right before its subdirectories
+        if result and (directory == result[-1]
+                       or directory.startswith(result[-1].rstrip(os.sep) + os.sep)):
+            continue
+        result.append(directory)
+    return result
+
+
+class LibraryWatcher():
+    """Report directories below root with new files
+
+    Args:
+        root (str) The directory tree to watch
+        callback (callable) Called with the list of changed directories (see
+            coalesce())
+        settle (float) Seconds without changes until the changes are reported
+        max_delay (float) Seconds after the first change the changes are
+            reported at the latest, even if the tree is still changing
+    """
+
+    MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self, root, callback, settle=10.0, max_delay=300.0):
+        self.root = os.path.abspath(root)
+        self.callback = callback
+        self.settle = settle
+        self.max_delay = max_delay
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = None
+        # Watched directory of each watch descriptor
+        self.watches = {}
+        self.pending = set()
+        self.first_change = None
+        self.timer = None
+
+    def start(self):
+        """Start watching, raises OSError if inotify is not available"""
+        fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1 failed: {os.strerror(err)}")
+        self.fd = fd
+        self._watch_tree(self.root)
+        asyncio.get_running_loop().add_reader(self.fd, self._read)
+        logging.debug("Watching %d directories below %s", len(self.watches), self.root)
+        return self
+
+    def close(self):
+        """Stop watching, pending changes are dropped"""
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        if self.fd is not None:
+            asyncio.get_running_loop().remove_reader(self.fd)
+            os.close(self.fd)
+            self.fd = None
+        self.watches.clear()
+
+    def _watch_tree(self, path):
+        """Watch a directory and all directories below, hidden ones excluded"""
+        for dirpath, dirnames, _ in os.walk(path):
+            dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dirpath), self.MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    logging.warning("Watching %s failed, raise "
+                                    "fs.inotify.max_user_watches", dirpath)
+                elif err != errno.ENOENT:
+                    logging.warning("Watching %s failed: %s", dirpath, os.strerror(err))
+                continue
+            self.watches[wd] = dirpath
+
+    def _read(self):
+        """Parse the available events"""
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b'\0')
+            offset += EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Events got lost, fall back to scanning everything
+                self._changed(self.root)
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            directory = self.watches.get(wd)
+            if directory is None or name.startswith(b'.'):
+                # Unknown watch or a temporary file of rsync
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                # Files may have arrived before the watch was added
+                self._watch_tree(path)
+                self._changed(path)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                self._changed(directory)
+
+    def _changed(self, directory):
+        """Record a changed directory, (re)start the settle timer"""
+        now = time.monotonic()
+        if not self.pending:
+            self.first_change = now
+        self.pending.add(directory)
+        if self.timer:
+            self.timer.cancel()
+        delay = min(self.settle, max(self.first_change + self.max_delay - now, 0))
+        self.timer = asyncio.get_running_loop().call_later(delay, self._report)
+
+    def _report(self):
+        """Hand the changed directories to the callback"""
+        self.timer = None
+        directories = coalesce(self.pending)
+        self.pending.clear()
+        logging.debug("Library changes in %s", ', '.join(directories))
+        self.callback(directories)
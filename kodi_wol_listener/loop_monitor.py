@@ -0,0 +1,99 @@
+"""Instrumentation of the asyncio event loop
+
+LoopLagMonitor measures how late the loop wakes up a sleeping coroutine,
+which is the time the loop was blocked by other callbacks. Profiler records a
+cProfile profile for a limited time when triggered, e.g. by a signal, while
+the application keeps running.
+
+Nothing in here is active unless explicitly enabled.
+"""
+import os
+import time
+import signal
+import asyncio
+import logging
+
+from kodi_wol_listener import metrics
+
+LOOP_LAG_SECONDS = metrics.histogram(
+    'kodi_wol_listener_loop_lag_seconds', 'Event loop wake-up delay',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+
+
+class LoopLagMonitor():
+    """Sample the event loop lag periodically
+
+    Args:
+        interval (float) Seconds between two samples
+        warn_threshold (float) Lag in seconds logged as warning
+        slow_callback_duration (float) Callbacks running longer are reported by
+            asyncio, None to disable. Turns on asyncio debug mode, whose
+            overhead adds to the lag measured, so use it for diagnosis only.
+    """
+    def __init__(self, interval=0.25, warn_threshold=0.1, slow_callback_duration=None):
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self.slow_callback_duration = slow_callback_duration
+        self.max_lag = 0.0
+
+    async def run(self):
+        """Sample forever"""
+        loop = asyncio.get_running_loop()
+        if self.slow_callback_duration is not None:
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.slow_callback_duration
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - start - self.interval, 0.0)
+            LOOP_LAG_SECONDS.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.warn_threshold:
+                logging.warning("Event loop blocked for %.3fs", lag)
+
+
+class Profiler():
+    """Run cProfile for a limited time on request
+
+    The profile is written to <directory>/kodi_wol_listener-<time>.prof and
+    can be inspected with the pstats module or tools like snakeviz.
+
+    Args:
+        directory (str) Directory the profiles are written to
+        duration (float) Seconds to profile per request
+    """
+    def __init__(self, directory, duration=30.0):
+        self.directory = directory
+        self.duration = duration
+        self.profile = None
+        self.path = None
+
+    def install(self, signum=signal.SIGUSR2):
+        """Start a profile whenever the process receives the given signal"""
+        asyncio.get_running_loop().add_signal_handler(signum, self.start)
+
+    def start(self):
+        """Start profiling, stop automatically after duration seconds"""
+        if self.profile:
+            logging.info("Profiling in progress already")
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory,
+                                 time.strftime('kodi_wol_listener-%Y%m%d-%H%M%S.prof'))
+        logging.info("Profiling for %.0fs into %s", self.duration, self.path)
+        import cProfile  # pylint: disable=import-outside-toplevel
+        self.profile = cProfile.Profile()
+        asyncio.get_running_loop().call_later(self.duration, self.stop)
+        self.profile.enable()
+
+    def stop(self):
+        """Stop profiling and write the profile"""
+        if not self.profile:
+            return
+        self.profile.disable()
+        try:
+            self.profile.dump_stats(self.path)
+            logging.info("Profile written to %s", self.path)
+        except OSError as excp:
+            logging.error("Writing profile failed: %s", excp)
+        self.profile = None
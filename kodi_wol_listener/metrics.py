@@ -0,0 +1,219 @@
+"""Prometheus/OpenMetrics metrics and an asyncio HTTP endpoint exporting them
+
+Metrics are plain in-memory objects. Updating a metric is a dict lookup plus
+an addition (histograms add a bisect on the few bucket bounds), the text
+exposition is only generated when the endpoint is scraped.
+
+Metrics are usually created at module level on the default registry:
+    PACKETS = metrics.counter('kodi_wol_packets', 'Packets received', ['verdict'])
+    PACKETS.inc('accepted')
+"""
+import bisect
+import asyncio
+import logging
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+def _format_labels(names, values, extra=''):
+    labels = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric():
+    """Base class of all metric types
+
+    Args:
+        name (str) Metric name
+        documentation (str) Help text
+        labelnames (list[str]) Names of the labels, values are given on update
+    """
+    TYPE = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def clear(self):
+        """Drop all values"""
+        self.values.clear()
+
+    def render(self):
+        """Return the OpenMetrics text lines of this metric"""
+        lines = [f'# TYPE {self.name} {self.TYPE}',
+                 f'# HELP {self.name} {_escape(self.documentation)}']
+        for labels, value in sorted(self.values.items()):
+            lines.extend(self._render_sample(labels, value))
+        return lines
+
+    def _render_sample(self, labels, value):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Monotonically increasing counter"""
+    TYPE = 'counter'
+
+    def inc(self, *labels, amount=1):
+        """Increase the counter for the given label values"""
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, *labels):
+        """Return the current value for the given label values"""
+        return self.values.get(labels, 0)
+
+    def _render_sample(self, labels, value):
+        return [f'{self.name}_total{_format_labels(self.labelnames, labels)} '
+                f'{_format_value(value)}']
+
+
+class Gauge(Metric):
+    """Value that can go up and down"""
+    TYPE = 'gauge'
+
+    def set(self, value, *labels):
+        """Set the gauge for the given label values"""
+        self.values[labels] = value
+
+    def get(self, *labels):
+        """Return the current value for the given label values"""
+        return self.values.get(labels, 0)
+
+    def _render_sample(self, labels, value):
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}']
+
+
+class Histogram(Metric):
+    """Distribution of observed values in buckets
+
+    Args:
+        buckets (list[float]) Sorted upper bounds of the buckets, an +Inf
+            bucket is always added
+    """
+    TYPE = 'histogram'
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        """Add an observation for the given label values"""
+        sample = self.values.get(labels)
+        if sample is None:
+            # Non-cumulative bucket counts (+Inf last), sum
+            sample = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        sample[0][bisect.bisect_left(self.buckets, value)] += 1
+        sample[1] += value
+
+    def get(self, *labels):
+        """Return (count, sum) for the given label values"""
+        sample = self.values.get(labels)
+        return (sum(sample[0]), sample[1]) if sample else (0, 0.0)
+
+    def _render_sample(self, labels, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        bounds = [_format_value(float(bound)) for bound in self.buckets] + ['+Inf']
+        for bound, count in zip(bounds, counts):
+            cumulative += count
+            le_label = _format_labels(self.labelnames, labels, f'le="{bound}"')
+            lines.append(f'{self.name}_bucket{le_label} {cumulative}')
+        label_str = _format_labels(self.labelnames, labels)
+        lines.append(f'{self.name}_count{label_str} {cumulative}')
+        lines.append(f'{self.name}_sum{label_str} {_format_value(total)}')
+        return lines
+
+
+class Registry():
+    """A set of metrics exported together"""
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        """Add a metric, return it. A metric of the same name is replaced"""
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        """Return the OpenMetrics text exposition of all metrics"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+def counter(name, documentation, labelnames=(), registry=REGISTRY):
+    """Create a counter on the (default) registry"""
+    return registry.register(Counter(name, documentation, labelnames))
+
+def gauge(name, documentation, labelnames=(), registry=REGISTRY):
+    """Create a gauge on the (default) registry"""
+    return registry.register(Gauge(name, documentation, labelnames))
+
+def histogram(name, documentation, labelnames=(), buckets=Histogram.DEFAULT_BUCKETS,
+              registry=REGISTRY):
+    """Create a histogram on the (default) registry"""
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+
+class MetricsServer():
+    """Minimal HTTP server answering GET /metrics with the registry contents"""
+
+    def __init__(self, registry=REGISTRY):
+        self.registry = registry
+        self.server = None
+
+    async def init(self, port=0, host='0.0.0.0'):
+        """Start serving
+
+        Args:
+            port (int) TCP port to listen on, 0 for any free port
+            host (str) Address to listen on
+        Returns:
+            (int) The port actually taken
+        """
+        self.server = await asyncio.start_server(self._client, host, port)
+        port = self.server.sockets[0].getsockname()[1]
+        logging.debug("Metrics endpoint running on port %d", port)
+        return port
+
+    def close(self):
+        """Stop serving"""
+        if self.server:
+            self.server.close()
+            self.server = None
+
+    async def _client(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 5)
+            method, path = (request.split(b' ', 2) + [b'', b''])[:2]
+            if method not in (b'GET', b'HEAD'):
+                status, body, content_type = '405 Method Not Allowed', b'', 'text/plain'
+            elif path.split(b'?')[0] != b'/metrics':
+                status, body, content_type = '404 Not Found', b'', 'text/plain'
+            else:
+                status, body, content_type = '200 OK', self.registry.render().encode(), CONTENT_TYPE
+            header = (f'HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n'
+                      f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n')
+            writer.write(header.encode() + (body if method == b'GET' else b''))
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
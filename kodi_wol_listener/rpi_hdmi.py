@@ -4,18 +4,29 @@
 
 import logging
 from kodi_wol_listener.async_subprocess import AsyncSubprocess
+from kodi_wol_listener import metrics
+
+HDMI_TOGGLES = metrics.counter('kodi_wol_listener_hdmi_toggles', 'HDMI output state changes',
+                               ['state'])
 
 class RaspberryPiHdmi():
     """Frontend to vcgencmd for getting/setting HDMI state
 
     This class is Raspberry PI specific
     """
-    def __init__(self):
-        self.vcgencmd = AsyncSubprocess(b'/usr/bin/vcgencmd display_power')
+    def __init__(self, vcgencmd=b'/usr/bin/vcgencmd'):
+        self.vcgencmd = AsyncSubprocess(vcgencmd + b' display_power')
+        # Last known state, None if unknown
+        self.state = None
+
+    def set_vcgencmd(self, vcgencmd):
+        """Change the path of the vcgencmd executable"""
+        self.vcgencmd.set_command(vcgencmd + b' display_power')
 
     async def get_state(self):
         """Return the HDMI output state as bool"""
         state = b'=1' in (await self.vcgencmd.run_wait())[1]
+        self.state = state
         logging.debug("HDMI is currently %sabled", 'en' if state else 'dis')
         return state
 
@@ -23,4 +34,6 @@ class RaspberryPiHdmi():
         """Set the HDMI output state"""
         arg = b'1' if state else b'0'
         await self.vcgencmd.run_wait(arg)
+        HDMI_TOGGLES.inc('on' if state else 'off')
+        self.state = state
         logging.debug("HDMI port %sabled sucessfully", 'en' if state else 'dis')
@@ -0,0 +1,127 @@
+"""Lower the priority of the rsync daemon while kodi plays
+
+Uploads into the video directory compete with playback for the disk, the
+network and the CPU. While throttled, the processes of the daemon are reniced
+and ioniced. The CPU and IO weights of the systemd unit running the daemon
+are lowered as well, they cover the transfer processes forked later on. The
+weights are no replacement for renicing: they have no effect unless the cpu
+and io cgroup controllers are delegated to the unit, which is not the case
+for user units on many systems.
+"""
+import os
+import time
+import asyncio
+import logging
+
+from kodi_wol_listener.dbus_systemd import DbusSystemd, SystemdManager
+
+def find_processes(name):
+    """Return the pids of the processes of this user with the given name
+
+    Args:
+        name (str) The process name as in /proc/<pid>/comm
+    """
+    uid = os.getuid()
+    pids = []
+    for entry in os.scandir('/proc'):
+        if not entry.name.isdigit():
+            continue
+        try:
+            if entry.stat().st_uid != uid:
+                continue
+            with open(f'/proc/{entry.name}/comm') as comm:
+                if comm.read().rstrip('\n') == name:
+                    pids.append(int(entry.name))
+        except OSError:
+            # The process exited meanwhile
+            continue
+    return pids
+
+
+class RsyncThrottle():
+    """Switch the rsync daemon between low and normal priority
+
+    Args:
+        process (str) Name of the daemon processes
+        unit (str) systemd unit running the daemon, '' to change the
+            processes only
+    """
+
+    # Weights while throttled, the default weight is 100
+    WEIGHTS = {'CPUWeight': 10, 'IOWeight': 10}
+    # Weight value resetting a weight to the unit's configuration
+    WEIGHT_UNSET = 2 ** 64 - 1
+    # Nice value and ionice arguments of the processes while throttled
+    NICE = 19
+    IONICE_THROTTLED = ('-c', '2', '-n', '7')
+    IONICE_RESTORED = ('-c', '0')
+
+    def __init__(self, process='rsync', unit='rsync_user.service'):
+        self.process = process
+        self.unit = unit
+        self.throttled = False
+        self.manager = None
+        # Original nice value of each reniced process
+        self.niced = {}
+        # True if the weights of the unit were lowered
+        self.unit_throttled = False
+        self.lock = asyncio.Lock()
+
+    async def set_throttled(self, throttled):
+        """Throttle or restore the daemon, nothing is done if it is in that state"""
+        async with self.lock:
+            if throttled == self.throttled:
+                return
+            start = time.monotonic()
+            await self._set_processes(throttled)
+            if throttled:
+                self.unit_throttled = await self._set_unit(True)
+            elif self.unit_throttled:
+                await self._set_unit(False)
+                self.unit_throttled = False
+            self.throttled = throttled
+            logging.info("rsync %s in %.3fs", 'throttled' if throttled else 'restored',
+                         time.monotonic() - start)
+
+    async def _set_unit(self, throttled):
+        """Set the weights of the unit, return False if that is not possible"""
+        if not self.unit:
+            return False
+        try:
+            if not self.manager:
+                self.manager = await SystemdManager().init(await DbusSystemd().init())
+            await self.manager.set_unit_properties(
+                self.unit, {name: ('t', weight if throttled else self.WEIGHT_UNSET)
+                            for name, weight in self.WEIGHTS.items()})
+        except Exception as excp:  # pylint: disable=broad-except
+            logging.debug("Setting the weights of %s failed: %s", self.unit, excp)
+            return False
+        return True
+
+    async def _set_processes(self, throttled):
+        """Renice and ionice the processes"""
+        pids = find_processes(self.process)
+        # Processes forked while throttled inherited the nice value
+        default_nice = min(self.niced.values(), default=0)
+        for pid in pids:
+            try:
+                if throttled:
+                    self.niced.setdefault(pid, os.getpriority(os.PRIO_PROCESS, pid))
+                    os.setpriority(os.PRIO_PROCESS, pid, self.NICE)
+                else:
+                    os.setpriority(os.PRIO_PROCESS, pid, self.niced.get(pid, default_nice))
+            except ProcessLookupError:
+                pass
+            except PermissionError as excp:
+                # Raising the priority needs LimitNICE= of the daemon's service
+                logging.warning("Renicing %s (%d) failed: %s", self.process, pid, excp)
+        if not throttled:
+            self.niced = {}
+        if pids:
+            args = self.IONICE_THROTTLED if throttled else self.IONICE_RESTORED
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    'ionice', *args, '-p', *(str(pid) for pid in pids))
+                await proc.wait()
+            except OSError as excp:
+                logging.warning("Running ionice failed: %s", excp)
@@ -0,0 +1,265 @@
+"""VDR shutdown hook coordinating the suspend of the backend with the clients
+
+VDR runs its shutdown hooks before it shuts the backend down. This hook asks
+the listeners of the clients for their state first and defers the shutdown
+(TRY_AGAIN) while kodi is in use (running and not in standby) on one of them
+or one of them was woken recently, a client about to connect would otherwise
+have to wait for the backend to resume. Else it programs the RTC to wake the backend for the
+earliest of the next VDR timer, the next pre-wake of a client and any
+further wake time given, and tells VDR to suspend.
+
+Listeners are queried in parallel with a tight timeout, a listener not
+responding is considered asleep. They are given as host[:port] (UDP, see
+wol_receiver.STATUS_QUERY, the listener must have the backend among its
+status_hosts) or unix:<path> (the control socket of a listener on the backend
+itself).
+
+VDR calls the hook with the start time of the next timer, the seconds until
+it starts, its channel, the recording's file name and 1 if the shutdown was
+requested by the user. Install it in the hooks directory, e.g. as S90.custom:
+    exec kodi_wol_vdr_shutdown_hook --listener kodi-pi "$@"
+"""
+import json
+import math
+import time
+import errno
+import socket
+import logging
+import selectors
+from typing import List
+
+import typer
+
+from kodi_wol_listener.wol_receiver import STATUS_QUERY
+
+# Default UDP port of the listeners
+LISTENER_PORT = 42429
+WAKEALARM = '/sys/class/rtc/rtc0/wakealarm'
+SUSPEND_COMMAND = '/bin/systemctl --no-block suspend'
+
+
+def parse_listener(listener):
+    """Parse a listener address
+
+    Args:
+        listener (str) host, host:port, [IPv6 address]:port or unix:<path>
+    Returns:
+        (tuple) ('unix', path) or ('udp', (host, port))
+    """
+    if listener.startswith('unix:'):
+        return 'unix', listener[5:]
+    host, port = listener, LISTENER_PORT
+    if listener.startswith('['):
+        host, _, rest = listener[1:].partition(']')
+        if rest:
+            port = int(rest.lstrip(':'))
+    elif listener.count(':') == 1:
+        host, port = listener.split(':')
+        port = int(port)
+    return 'udp', (host, port)
+
+
+def _open_query(listener):
+    """Return a non-blocking socket with the status query sent"""
+    kind, address = parse_listener(listener)
+    if kind == 'unix':
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Local, connecting does not block noticeably
+        sock.connect(address)
+        sock.sendall(b'status\n')
+    else:
+        family, _, _, _, sockaddr = socket.getaddrinfo(*address, type=socket.SOCK_DGRAM)[0]
+        sock = socket.socket(family, socket.SOCK_DGRAM)
+        sock.connect(sockaddr)
+        sock.send(STATUS_QUERY)
+    sock.setblocking(False)
+    return sock
+
+
+def query_listeners(listeners, timeout=0.5):
+    """Query the state of the listeners in parallel
+
+    Args:
+        listeners (list of str) Addresses of the listeners, see parse_listener()
+        timeout (float) Seconds to wait for the responses
+    Returns:
+        (dict) The state (dict) of each listener that responded in time
+    """
+    deadline = time.monotonic() + timeout
+    statuses = {}
+    with selectors.DefaultSelector() as selector:
+        for listener in listeners:
+            try:
+                selector.register(_open_query(listener), selectors.EVENT_READ,
+                                  [listener, b''])
+            except (OSError, ValueError) as excp:
+                logging.info("Listener %s not reachable: %s", listener, excp)
+        while selector.get_map() and time.monotonic() < deadline:
+            for key, _ in selector.select(deadline - time.monotonic()):
+                listener, received = key.data
+                try:
+                    data = key.fileobj.recv(65536)
+                except OSError as excp:
+                    # E.g. ICMP port unreachable, the listener is not running
+                    logging.info("Listener %s not reachable: %s", listener, excp)
+                    data = b''
+                received += data
+                # Datagrams are complete, stream responses end with a newline
+                if data and key.fileobj.type == socket.SOCK_STREAM and b'\n' not in received:
+                    key.data[1] = received
+                    continue
+                selector.unregister(key.fileobj)
+                key.fileobj.close()
+                try:
+                    statuses[listener] = json.loads(received.split(b'\n')[0])
+                except ValueError:
+                    if received:
+                        logging.warning("Invalid response of listener %s", listener)
+        for key in list(selector.get_map().values()):
+            logging.info("Listener %s did not respond", key.data[0])
+            key.fileobj.close()
+    return statuses
+
+
+def defer_minutes(statuses, now, recent=600, retry=5, user=False):
+    """Return the minutes to defer the shutdown by, None to allow it
+
+    Args:
+        statuses (dict) The state of each listener, see query_listeners()
+        now (float) The current time
+        recent (int) Seconds after a wake the shutdown is deferred
+        retry (int) Minutes to defer while kodi is running
+        user (bool) The shutdown was requested by the user, recent wakes
+            do not defer it
+    """
+    minutes = None
+    for listener, status in statuses.items():
+        if status.get('kodi_running') and not status.get('standby'):
+            logging.info("Kodi is running on %s", listener)
+            minutes = max(minutes or 0, retry)
+            continue
+        last_wake = status.get('last_wake')
+        if user or not last_wake:
+            continue
+        # Use the clock of the listener if reported
+        age = status.get('time', now) - last_wake['time']
+        if age < recent:
+            logging.info("%s was woken %.0fs ago", listener, age)
+            minutes = max(minutes or 0, math.ceil((recent - age) / 60))
+    return minutes
+
+
+def next_wakeup(now, next_timer=0, timer_lead=300, statuses=None, wake_times=()):
+    """Return the earliest time the backend has to be awake, None if never
+
+    Args:
+        now (float) The current time
+        next_timer (int) Start time of the next VDR timer, 0 if none
+        timer_lead (int) Seconds to wake ahead of a timer
+        statuses (dict) The state of each listener, see query_listeners()
+        wake_times (iterable of int) Further times to wake at
+    """
+    candidates = list(wake_times)
+    if next_timer > 0:
+        candidates.append(next_timer - timer_lead)
+    for status in (statuses or {}).values():
+        if status.get('next_wake'):
+            candidates.append(status['next_wake'])
+    candidates = [int(timestamp) for timestamp in candidates if timestamp > now]
+    return min(candidates) if candidates else None
+
+
+def _write(path, value):
+    with open(path, 'w') as wakealarm:
+        wakealarm.write(f'{value}\n')
+
+
+def set_wakealarm(timestamp, path=WAKEALARM):
+    """Program the RTC wake alarm
+
+    The alarm is written once. The kernel refuses to overwrite a pending
+    alarm (EBUSY), only then it is cleared first.
+
+    Args:
+        timestamp (int) Time to wake at, None to clear the alarm
+        path (str) The wakealarm file of the RTC
+    Returns:
+        (bool) True if the alarm was written, False if it was set already
+    """
+    try:
+        with open(path) as wakealarm:
+            current = int(wakealarm.read().strip() or 0)
+    except (OSError, ValueError):
+        current = 0
+    if current == (timestamp or 0):
+        return False
+    if timestamp is None:
+        _write(path, 0)
+        return True
+    try:
+        _write(path, timestamp)
+    except OSError as excp:
+        if excp.errno != errno.EBUSY:
+            raise
+        _write(path, 0)
+        _write(path, timestamp)
+    return True
+
+
+def run_hook(next_timer=0, user=False, listeners=(), timeout=0.5, recent=600, retry=5,
+             timer_lead=300, wake_times=(), wakealarm=WAKEALARM,
+             shutdown_command=SUSPEND_COMMAND):
+    """Decide on the shutdown and print the result for VDR
+
+    Returns:
+        (int) The exit code, not 0 aborts the shutdown
+    """
+    statuses = query_listeners(listeners, timeout) if listeners else {}
+    now = time.time()
+    minutes = defer_minutes(statuses, now, recent, retry, user)
+    if minutes is not None:
+        print(f'TRY_AGAIN={minutes}')
+        return 0
+    wakeup = next_wakeup(now, next_timer, timer_lead, statuses, wake_times)
+    try:
+        if set_wakealarm(wakeup, wakealarm):
+            logging.info("Wake alarm set to %s", 'none' if wakeup is None
+                         else time.strftime('%c', time.localtime(wakeup)))
+    except OSError as excp:
+        logging.error("Setting the wake alarm failed: %s", excp)
+        print('ABORT_MESSAGE="Setting the wake alarm failed"')
+        return 1
+    print(f'SHUTDOWNCMD="{shutdown_command}"')
+    return 0
+
+
+def _typer_hook(next_timer: int = typer.Argument(0, help="Start time of the next timer"),
+                timer_seconds: int = typer.Argument(0, help="Seconds until the next timer"),
+                channel: str = typer.Argument('', help="Channel of the next timer"),
+                recording: str = typer.Argument('', help="File name of the next recording"),
+                user: int = typer.Argument(0, help="1 if the shutdown was requested by the user"),
+                listener: List[str] = typer.Option(
+                    [], help="Listener to query, host[:port] or unix:<path>"),
+                timeout: float = typer.Option(0.5, help="Seconds to wait for the listeners"),
+                recent: int = typer.Option(
+                    10, help="Minutes after a wake of a client to defer the shutdown"),
+                retry: int = typer.Option(5, help="Minutes to defer while kodi is running"),
+                timer_lead: int = typer.Option(5, help="Minutes to wake ahead of a timer"),
+                wake_at: List[int] = typer.Option([], help="Further time to wake at"),
+                wakealarm: str = typer.Option(WAKEALARM, help="wakealarm file of the RTC"),
+                shutdown_command: str = typer.Option(
+                    SUSPEND_COMMAND, help="Command VDR shall run to shut down")):
+    # pylint: disable=unused-argument,too-many-arguments
+    raise typer.Exit(run_hook(next_timer, user == 1, listener, timeout, recent * 60, retry,
+                              timer_lead * 60, wake_at, wakealarm, shutdown_command))
+
+
+def main():
+    """Entry point of the shutdown hook"""
+    # stdout is evaluated by VDR, log to stderr
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s %(message)s')
+    typer.run(_typer_hook)
+
+
+if __name__ == '__main__':
+    main()
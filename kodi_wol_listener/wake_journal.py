@@ -0,0 +1,251 @@
+"""Binary journal of the wakes and kodi sessions
+
+Every wake starting or resuming kodi and every kodi session is appended to
+the journal as a fixed size record of 48 bytes:
+    time        float64   Time of the wake, start of the session
+    kind        uint8     WAKE or SESSION
+    verdict     uint8     Of a wake, one of VERDICTS
+    source_kind uint8     SOURCE_IPV4, SOURCE_IPV6, SOURCE_TEXT, 0 if none
+    exit_code   int16     Of a session, negative: killed by a signal
+    duplicates  uint16    Of a session, wakes received while kodi was running
+    source      16 bytes  Address or name of the waking host
+    ready       float32   Seconds from the wake until kodi answered
+    hdmi        float32   Seconds to query and enable HDMI at the start
+    teardown    float32   Seconds to restore the desktop and HDMI at the end
+    duration    float32   Seconds kodi ran
+Unknown durations are NaN. A session is recorded as kodi exited, a resumed
+wake as kodi is back from standby, a starting wake immediately. Duplicate
+wakes are only counted, a chatty client does not grow the journal.
+
+As the journal reaches max_bytes, it is renamed to <path>.1, replacing the
+previous one, so at most twice max_bytes are used. Queries map both files
+into memory, see WakeJournal.records(). analyze() summarizes them, the
+pre-wake model learns from WakeJournal.wakes().
+"""
+import os
+import time
+import mmap
+import math
+import signal
+import socket
+import struct
+import collections
+from array import array
+
+import typer
+
+WAKE = 1
+SESSION = 2
+# prelaunched: kodi was started or resumed ahead of a wake (see hotplug.py),
+# claimed: the first wake of a prelaunched kodi session
+VERDICTS = ('', 'started', 'resumed', 'prelaunched', 'claimed')
+SOURCE_IPV4 = 1
+SOURCE_IPV6 = 2
+SOURCE_TEXT = 3
+NAN = float('nan')
+# Verdicts of the wakes the pre-wake model learns from
+USAGE_VERDICTS = (VERDICTS.index('started'), VERDICTS.index('resumed'),
+                  VERDICTS.index('claimed'))
+# Exit codes of sessions ending regularly, any other one is a crash
+CLEAN_EXITS = (0, -signal.SIGTERM)
+
+RECORD = struct.Struct('<dBBBxhH16sffff')
+JournalRecord = collections.namedtuple(
+    'JournalRecord',
+    'time kind verdict source_kind exit_code duplicates source ready hdmi teardown duration')
+
+
+def default_journal_path():
+    """Return the default path of the journal"""
+    data_home = os.environ.get('XDG_DATA_HOME', os.path.expanduser('~/.local/share'))
+    return os.path.join(data_home, 'kodi_wol_listener', 'wake_journal.bin')
+
+def pack_source(source):
+    """Return the source_kind and source fields of a source address or name"""
+    if not source:
+        return 0, b''
+    for family, kind in ((socket.AF_INET, SOURCE_IPV4), (socket.AF_INET6, SOURCE_IPV6)):
+        try:
+            return kind, socket.inet_pton(family, source)
+        except OSError:
+            continue
+    return SOURCE_TEXT, source.encode(errors='replace')[:16]
+
+def unpack_source(source_kind, source):
+    """Return the source address or name of a record, the reverse of pack_source()"""
+    if source_kind == SOURCE_IPV4:
+        return socket.inet_ntop(socket.AF_INET, source[:4])
+    if source_kind == SOURCE_IPV6:
+        return socket.inet_ntop(socket.AF_INET6, source)
+    if source_kind == SOURCE_TEXT:
+        return source.rstrip(b'\0').decode(errors='replace')
+    return None
+
+def percentile(samples, pct):
+    """Return the pct (0-100) percentile of the sorted samples, None if empty"""
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))]
+
+
+class WakeJournal():
+    """Append-only file of fixed size wake and session records
+
+    Args:
+        path (str) Path of the journal, see default_journal_path()
+        max_bytes (int) Size the journal is rotated at
+    """
+
+    def __init__(self, path=None, max_bytes=1 << 20):
+        self.path = path or default_journal_path()
+        self.max_bytes = max_bytes
+        # Kept open for appending, opened on the first record
+        self.file = None
+        self.size = 0
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Unbuffered, each record is written by a single write()
+        self.file = open(self.path, 'ab', buffering=0)  # pylint: disable=consider-using-with
+        self.size = self.file.tell()
+        if self.size % RECORD.size:
+            # Cut a record torn by a crash, the following ones stay aligned
+            self.size -= self.size % RECORD.size
+            self.file.truncate(self.size)
+
+    def close(self):
+        """Close the journal, it is reopened by the next record"""
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def append(self, timestamp, kind, verdict='', source=None, exit_code=0, duplicates=0,
+               ready=NAN, hdmi=NAN, teardown=NAN, duration=NAN):
+        """Append a record, see the module documentation for the fields"""
+        # pylint: disable=too-many-arguments
+        source_kind, source = pack_source(source)
+        record = RECORD.pack(timestamp, kind, VERDICTS.index(verdict), source_kind, exit_code,
+                             min(duplicates, 0xffff), source, ready, hdmi, teardown, duration)
+        if not self.file:
+            self._open()
+        self.file.write(record)
+        self.size += RECORD.size
+        if self.size >= self.max_bytes:
+            self.close()
+            os.replace(self.path, self.path + '.1')
+
+    def add_wake(self, timestamp, source, verdict, ready=NAN):
+        """Record a wake, verdict is one of VERDICTS"""
+        self.append(timestamp, WAKE, verdict, source, ready=ready)
+
+    def add_session(self, timestamp, source, exit_code, duration, duplicates=0, ready=NAN,
+                    hdmi=NAN, teardown=NAN):
+        """Record a finished kodi session"""
+        # pylint: disable=too-many-arguments
+        self.append(timestamp, SESSION, '', source, exit_code, duplicates, ready, hdmi,
+                    teardown, duration)
+
+    def records(self, since=0):
+        """Return the records, the rotated ones first
+
+        Args:
+            since (float) Only records at or after this time are returned
+        Returns:
+            (list of JournalRecord) The records in recording order
+        """
+        records = []
+        for path in (self.path + '.1', self.path):
+            try:
+                with open(path, 'rb') as journal:
+                    length = os.fstat(journal.fileno()).st_size // RECORD.size * RECORD.size
+                    if not length:
+                        continue
+                    with mmap.mmap(journal.fileno(), length, access=mmap.ACCESS_READ) as mapped:
+                        with memoryview(mapped) as view:
+                            records.extend(JournalRecord._make(fields)
+                                           for fields in RECORD.iter_unpack(view)
+                                           if fields[0] >= since)
+            except FileNotFoundError:
+                continue
+        return records
+
+    def wakes(self, since=0):
+        """Return the times of the wakes starting, resuming or claiming kodi
+
+        Args:
+            since (float) Only wakes at or after this time are returned
+        Returns:
+            (array.array) The timestamps in recording order, see
+                wake_predictor.evaluate()
+        """
+        return array('I', (int(record.time) for record in self.records(since)
+                           if record.kind == WAKE and record.verdict in USAGE_VERDICTS))
+
+
+def analyze(records):
+    """Summarize the wakes and sessions
+
+    Args:
+        records (iterable of JournalRecord) The records, see WakeJournal.records()
+    Returns:
+        (dict) days: wakes, sessions and usage (seconds of sessions started)
+            per local date (str), ready: sorted wake-to-ready seconds, wakes
+            and duplicates: number of wakes starting or resuming kodi and of
+            those received while it was running, sessions and crashes:
+            number of sessions and crashed ones
+    """
+    days = collections.defaultdict(lambda: {'wakes': 0, 'sessions': 0, 'usage': 0.0})
+    ready = []
+    wakes = duplicates = sessions = crashes = 0
+    # Local dates are computed once per day
+    day_start = day_end = 0
+    for record in records:
+        if not day_start <= record.time < day_end:
+            local = time.localtime(record.time)
+            day = time.strftime('%Y-%m-%d', local)
+            day_start = record.time - (local.tm_hour * 3600 + local.tm_min * 60 + local.tm_sec
+                                       + record.time % 1)
+            # Off by the DST shift at most, the next record then recomputes
+            day_end = day_start + 24 * 3600
+        if record.kind == WAKE:
+            wakes += 1
+            days[day]['wakes'] += 1
+        elif record.kind == SESSION:
+            sessions += 1
+            days[day]['sessions'] += 1
+            duplicates += record.duplicates
+            if not math.isnan(record.duration):
+                days[day]['usage'] += record.duration
+            if record.exit_code not in CLEAN_EXITS:
+                crashes += 1
+        else:
+            continue
+        if not math.isnan(record.ready):
+            ready.append(record.ready)
+    ready.sort()
+    return {'days': dict(days), 'ready': ready, 'wakes': wakes, 'duplicates': duplicates,
+            'sessions': sessions, 'crashes': crashes}
+
+
+def analyze_command(journal: str = typer.Option(default_journal_path(),
+                                                help="Path of the journal"),
+                    days: int = typer.Option(0, help="Analyze the last days only, 0 for all")):
+    """Report the usage, wake-to-ready times, duplicate wakes and crashes"""
+    since = time.time() - days * 24 * 3600 if days else 0
+    result = analyze(WakeJournal(journal).records(since))
+    for day, usage in sorted(result['days'].items()):
+        typer.echo(f"{day}  {usage['wakes']:4d} wakes  {usage['sessions']:3d} sessions  "
+                   f"{usage['usage'] / 3600:5.1f}h")
+    ready = result['ready']
+    if ready:
+        typer.echo("Wake to ready: " + ', '.join(
+            f"p{pct} {percentile(ready, pct):.2f}s" for pct in (50, 90, 99)))
+    all_wakes = result['wakes'] + result['duplicates']
+    if all_wakes:
+        typer.echo(f"Duplicate wakes: {result['duplicates']} of {all_wakes} "
+                   f"({100 * result['duplicates'] / all_wakes:.1f}%)")
+    if result['sessions']:
+        typer.echo(f"Crashes: {result['crashes']} of {result['sessions']} sessions "
+                   f"({100 * result['crashes'] / result['sessions']:.1f}%)")
+    if not result['wakes'] and not result['sessions']:
+        typer.echo("No wakes recorded")
@@ -0,0 +1,256 @@
+"""Predict upcoming wakes from the recorded wakes and pre-wake the backend
+
+The model learns from the wakes starting or resuming kodi, as recorded in the
+wake journal, see WakeJournal.wakes(). A session starts with a wake that
+follows the previous one after at least session_gap seconds. For each 15
+minute slot of the week, the model keeps an exponentially weighted moving
+average over the weeks of whether a session started within that slot. The average is decayed lazily,
+so an update is O(1) and the model has a fixed size of two arrays with one
+entry per slot.
+
+If the probability for an upcoming slot reaches a threshold, a magic packet
+is sent to the backend lead seconds before the slot starts, hiding the
+backend resume latency from the user.
+
+The prediction can be evaluated against the recorded wakes by replaying
+them, see evaluate().
+"""
+import time
+import logging
+import asyncio
+import bisect
+from array import array
+
+import typer
+
+from kodi_wol_listener.wol_sender import send_magic_packet
+
+SLOT_SECONDS = 15 * 60
+WEEK_SECONDS = 7 * 24 * 3600
+SLOTS_PER_WEEK = WEEK_SECONDS // SLOT_SECONDS
+
+# The epoch is a thursday, shift weeks to start on mondays
+_WEEK_OFFSET = 3 * 24 * 3600
+
+def _local_seconds(timestamp):
+    """Return the timestamp shifted to local time, monday based weeks"""
+    return int(timestamp) + time.localtime(timestamp).tm_gmtoff + _WEEK_OFFSET
+
+def slot_of(timestamp):
+    """Return the slot of the week (local time) the timestamp is in"""
+    return _local_seconds(timestamp) % WEEK_SECONDS // SLOT_SECONDS
+
+def week_of(timestamp):
+    """Return the number of the week (local time) the timestamp is in"""
+    return _local_seconds(timestamp) // WEEK_SECONDS
+
+def session_starts(timestamps, session_gap):
+    """Return the timestamps that start a new session
+
+    Args:
+        timestamps (iterable[int]) Sorted wake timestamps
+        session_gap (int) Seconds between wakes that separate two sessions
+    """
+    starts = []
+    last = None
+    for timestamp in timestamps:
+        if last is None or timestamp - last >= session_gap:
+            starts.append(timestamp)
+        last = timestamp
+    return starts
+
+
+class WakeModel():
+    """Per slot of the week probability that a session starts within it
+
+    Args:
+        decay (float) Weight of the past weeks in the moving average
+        session_gap (int) Seconds between wakes that separate two sessions
+    """
+    def __init__(self, decay=0.75, session_gap=2 * 3600):
+        self.decay = decay
+        self.session_gap = session_gap
+        # Moving average after the week given in self.weeks for each slot
+        self.averages = array('f', [0.0]) * SLOTS_PER_WEEK
+        self.weeks = array('l', [0]) * SLOTS_PER_WEEK
+        self.last_wake = None
+
+    def add_wake(self, timestamp):
+        """Record a wake
+
+        Args:
+            timestamp (float) Time of the wake
+        Returns:
+            (bool) True if the wake started a new session
+        """
+        new_session = self.last_wake is None or timestamp - self.last_wake >= self.session_gap
+        self.last_wake = timestamp
+        if new_session:
+            slot, week = slot_of(timestamp), week_of(timestamp)
+            # Multiple sessions within the same slot and week count once
+            if self.weeks[slot] != week:
+                self.averages[slot] = (self.probability(slot, week) * self.decay
+                                       + 1.0 - self.decay)
+                self.weeks[slot] = week
+        return new_session
+
+    def probability(self, slot, week):
+        """Return the probability that a session starts in the slot of the week
+
+        Only wakes of weeks before the given one are taken into account.
+        """
+        last_week = self.weeks[slot]
+        if self.averages[slot] == 0.0:
+            return 0.0
+        if last_week >= week:
+            # Already updated with the given week, remove that update
+            return (self.averages[slot] - 1.0 + self.decay) / self.decay
+        return self.averages[slot] * self.decay ** (week - 1 - last_week)
+
+    def next_slot(self, now, lead, threshold):
+        """Return the start of the next slot likely to see a session start
+
+        Only slots starting later than now + lead are considered, up to one
+        week ahead.
+
+        Returns:
+            (int) Start time of the slot, None if there is none
+        """
+        start = (int(now + lead) // SLOT_SECONDS + 1) * SLOT_SECONDS
+        for slot_start in range(start, start + WEEK_SECONDS, SLOT_SECONDS):
+            if self.probability(slot_of(slot_start), week_of(slot_start)) >= threshold:
+                return slot_start
+        return None
+
+
+class PreWakeScheduler():
+    """Send magic packets to the backend ahead of predicted wakes
+
+    A pre-wake is omitted if a wake or pre-wake happened within the session
+    gap before, the backend is expected to be awake already.
+
+    Args:
+        model (WakeModel) The model, kept up to date by the caller
+        mac (str) MAC address of the backend
+        lead (int) Seconds to wake the backend before the predicted wake
+        threshold (float) Minimal probability of a wake to pre-wake the backend
+        address (str) Destination address of the magic packets
+    """
+
+    # Maximum sleep time, the schedule is re-evaluated at least this often
+    MAX_SLEEP = 3600
+
+    def __init__(self, model, mac, lead=300, threshold=0.5, address='255.255.255.255'):
+        self.model = model
+        self.mac = mac
+        self.lead = lead
+        self.threshold = threshold
+        self.address = address
+        self.last_prewake = None
+
+    def _recently_awake(self, now):
+        gap = self.model.session_gap
+        return ((self.model.last_wake is not None and now - self.model.last_wake < gap)
+                or (self.last_prewake is not None and now - self.last_prewake < gap))
+
+    async def run(self):
+        """Run the scheduler forever"""
+        while True:
+            now = time.time()
+            slot_start = self.model.next_slot(now, self.lead, self.threshold)
+            if slot_start is None:
+                await asyncio.sleep(self.MAX_SLEEP)
+                continue
+            prewake = slot_start - self.lead
+            if prewake - now > self.MAX_SLEEP:
+                await asyncio.sleep(self.MAX_SLEEP)
+                continue
+            await asyncio.sleep(max(prewake - now, 0))
+            now = time.time()
+            if not self._recently_awake(now):
+                logging.info("Pre-waking backend %s for predicted wake at %s", self.mac,
+                             time.strftime('%a %H:%M', time.localtime(slot_start)))
+                try:
+                    send_magic_packet(self.mac, self.address)
+                    # Only a sent pre-wake suppresses the following ones
+                    self.last_prewake = now
+                except OSError as excp:
+                    logging.warning("Sending magic packet failed: %s", excp)
+            # Continue with the slots after the one just handled
+            await asyncio.sleep(max(slot_start - self.lead - time.time(), 0) + 1)
+
+
+def evaluate(timestamps, lead=300, threshold=0.5, decay=0.75, session_gap=2 * 3600):
+    """Replay recorded wakes and rate the pre-wakes the model would have made
+
+    The model is trained incrementally, a pre-wake decision only uses wakes
+    before the pre-wake time. A session start is a hit if it falls into the
+    window [pre-wake, slot end] of a pre-wake. A pre-wake without any wake in
+    its window is an extra wake-up of the backend.
+
+    Args:
+        timestamps (iterable[int]) Recorded wake timestamps
+        lead (int) Seconds between pre-wake and the predicted slot start
+        threshold (float) Minimal probability of a wake to pre-wake the backend
+        decay (float) Decay of the moving average, see WakeModel
+        session_gap (int) Seconds between wakes that separate two sessions
+    Returns:
+        (dict) Evaluation results
+    """
+    timestamps = sorted(timestamps)
+    result = {'wakes': len(timestamps), 'sessions': 0, 'hits': 0, 'hit_rate': 0.0,
+              'prewakes': 0, 'extra': 0, 'weeks': 0.0}
+    if not timestamps:
+        return result
+    model = WakeModel(decay, session_gap)
+    windows = []
+    index = 0
+    last_prewake = None
+    first_slot = timestamps[0] // SLOT_SECONDS * SLOT_SECONDS
+    for slot_start in range(first_slot, timestamps[-1] + SLOT_SECONDS, SLOT_SECONDS):
+        prewake = slot_start - lead
+        while index < len(timestamps) and timestamps[index] < prewake:
+            model.add_wake(timestamps[index])
+            index += 1
+        probability = model.probability(slot_of(slot_start), week_of(slot_start))
+        if probability < threshold:
+            continue
+        if model.last_wake is not None and prewake - model.last_wake < session_gap:
+            continue
+        if last_prewake is not None and prewake - last_prewake < session_gap:
+            continue
+        last_prewake = prewake
+        windows.append((prewake, slot_start + SLOT_SECONDS))
+
+    starts = session_starts(timestamps, session_gap)
+    hits = sum(1 for start in starts if _in_windows(windows, start))
+    extra = sum(1 for window in windows if not _any_in(timestamps, *window))
+    result.update(sessions=len(starts), hits=hits, hit_rate=hits / len(starts),
+                  prewakes=len(windows), extra=extra,
+                  weeks=(timestamps[-1] - timestamps[0]) / WEEK_SECONDS)
+    return result
+
+def _in_windows(windows, timestamp):
+    """True if timestamp is within one of the sorted, disjoint windows"""
+    index = bisect.bisect_right(windows, (timestamp, float('inf'))) - 1
+    return index >= 0 and windows[index][0] <= timestamp < windows[index][1]
+
+def _any_in(timestamps, start, end):
+    """True if any of the sorted timestamps is within [start, end)"""
+    index = bisect.bisect_left(timestamps, start)
+    return index < len(timestamps) and timestamps[index] < end
+
+
+def print_evaluation(journal, lead=300, threshold=0.5):
+    """Evaluate the prediction against the recorded wakes and print the results
+
+    Args:
+        journal (WakeJournal) The recorded wakes
+        lead (int) Seconds between pre-wake and the predicted slot start
+        threshold (float) Minimal probability of a wake to pre-wake the backend
+    """
+    result = evaluate(journal.wakes(), lead, threshold)
+    typer.echo(f"{result['wakes']} wakes, {result['sessions']} sessions "
+               f"in {result['weeks']:.1f} weeks")
+    typer.echo(f"{result['prewakes']} pre-wakes, {result['hits']} hits "
+               f"(hit rate {result['hit_rate']:.1%}), {result['extra']} extra wake-ups")
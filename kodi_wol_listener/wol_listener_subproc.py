@@ -10,19 +10,43 @@ a user space application as they are based on UDP/IP communication.
 """
 import sys
 import os
+import gc
+import time
 import asyncio
 import logging
 import signal
 import functools
 import enum
 from typing import Optional
-import coloredlogs
 import typer
 
 from kodi_wol_listener.async_subprocess import AsyncSubprocess
 from kodi_wol_listener.rpi_hdmi import RaspberryPiHdmi
+from kodi_wol_listener.hdmi_cec import CecClient, CecError
 from kodi_wol_listener.wol_receiver import WolReceiver
 from kodi_wol_listener.dbus_systemd import DbusSystemd, SystemdManager
+from kodi_wol_listener.kodi_jsonrpc import KodiJsonRpc, KodiJsonRpcError
+from kodi_wol_listener.kodi_idle import KodiIdleMonitor
+from kodi_wol_listener.rsync_throttle import RsyncThrottle
+from kodi_wol_listener.library_watcher import LibraryWatcher, coalesce
+from kodi_wol_listener.hotplug import HotplugMonitor
+from kodi_wol_listener.metrics import MetricsServer
+from kodi_wol_listener.control_socket import ControlServer, default_socket_path
+from kodi_wol_listener.loop_monitor import LoopLagMonitor, Profiler
+from kodi_wol_listener.event_loop import EventLoop, install_event_loop
+from kodi_wol_listener.config import Config, default_config_path
+from kodi_wol_listener import metrics, journald
+from kodi_wol_listener.wake_predictor import WakeModel, PreWakeScheduler, print_evaluation
+from kodi_wol_listener import wol_sender
+from kodi_wol_listener.wake_journal import WakeJournal, NAN, analyze_command
+
+LAUNCHES = metrics.counter('kodi_wol_listener_launches', 'Kodi start requests', ['verdict'])
+LAUNCH_PHASE_SECONDS = metrics.histogram('kodi_wol_listener_launch_phase_seconds',
+                                         'Duration of the phases around a kodi run', ['phase'])
+KODI_EXITS = metrics.counter('kodi_wol_listener_kodi_exits', 'Kodi exits', ['code'])
+SESSION_SECONDS = metrics.histogram('kodi_wol_listener_session_seconds', 'Kodi run time',
+                                    buckets=(60, 300, 900, 1800, 3600, 7200, 14400, 28800))
+KODI_RUNNING = metrics.gauge('kodi_wol_listener_kodi_running', '1 while kodi is running')
 
 class KodiManager():
     """Application that runs kodi as a subprocess on an incoming WOL pattern
@@ -33,6 +57,18 @@ class KodiManager():
 
     SYSTEMD_SERVICE = 'kodi_wol_listener.service'
 
+    # Seconds to wait for kodi to exit after asking it to quit
+    KODI_QUIT_TIMEOUT = 20.0
+    # Seconds between polls of a starting kodi, see _wait_ready()
+    KODI_READY_POLL = 0.25
+
+    # The PVR add-on connecting kodi to VDR, disabled during standby
+    PVR_ADDON = 'pvr.vdr.vnsi'
+
+    # Kodi notifications starting and ending playback
+    PLAYBACK_STARTED = ('Player.OnPlay', 'Player.OnResume', 'Player.OnAVStart')
+    PLAYBACK_ENDED = ('Player.OnStop', 'Player.OnPause')
+
     class DebugLevel(enum.Enum):
         """Enumeration for logging related cli handling"""
         NOTSET = 'notset'
@@ -45,10 +81,62 @@ class KodiManager():
 
     def __init__(self):
         self.hdmi = RaspberryPiHdmi()
-        self.kodi = AsyncSubprocess(b'/usr/bin/kodi', abort_on_fail=False)
-        self.wol_receiver = WolReceiver(self.kodi_start)
+        # Kodi's session is terminated as a whole, the shell may not exec it
+        self.kodi = AsyncSubprocess(b'/usr/bin/kodi', abort_on_fail=False, new_session=True)
+        self.desktop_restart_command = b'/usr/bin/sudo systemctl restart sddm'
+        # TV control via HDMI-CEC, None if disabled
+        self.cec = None
+        self.wol_receiver = WolReceiver(self.kodi_start, status_callback=self.status)
+        # Settings, reloaded from config_path on SIGHUP. The overrides given on
+        # the command line take precedence over the file.
+        self.config = Config()
+        self.config_path = None
+        self.config_overrides = {}
         self.kodi_running = False
+        self.kodi_task = None
         self.exit_future = None
+        self.rpc = KodiJsonRpc(notification_callback=self._kodi_notification)
+        # Seconds of inactivity until kodi is stopped, 0 to keep it running
+        self.idle_timeout = 0
+        self.idle_monitor = None
+        self.idle_task = None
+        # True while kodi is kept running in standby, see kodi_standby()
+        self.standby = False
+        # Backend pre-wake, learns from the wakes in the journal
+        self.wake_model = None
+        # Records the wakes and kodi sessions, None to disable
+        self.journal = None
+        # Wakes received while the current kodi session was running
+        self.duplicate_wakes = 0
+        # True while kodi runs due to a prelaunch and no wake arrived yet
+        self.prelaunched = False
+        self.backend_mac = None
+        self.prewake_lead = 300
+        self.prewake_threshold = 0.5
+        self.prewake_scheduler = None
+        self.prewake_task = None
+        # TCP port of the metrics endpoint, 0 to disable it
+        self.metrics_port = 0
+        self.metrics_server = None
+        # Lowers the priority of the rsync daemon while kodi plays, None if disabled
+        self.rsync_throttle = None
+        # Watches for new videos, the directories kodi shall scan on its next run
+        self.library_watcher = None
+        self.pending_scans = set()
+        self.scan_task = None
+        # Starts kodi as a display gets connected, None if disabled
+        self.hotplug_monitor = None
+        # Path of the control socket, None to disable it
+        self.control_socket = None
+        self.control_server = None
+        self.state_listeners = []
+        self.start_time = time.time()
+        self.last_wake = None
+        # Event loop instrumentation
+        self.loop_monitor = False
+        self.profile_dir = None
+        # Coroutine function selected by the command line, run by run()
+        self.entry = None
 
     def _exit(self, signame, loop):
         if self.exit_future:
@@ -57,19 +145,342 @@ class KodiManager():
             loop.stop()
 
     def _typer_run(self,
-                   port: int = typer.Option(42429, help = "UDP/IP port to listen for WOL pattern"),
-                   debug_level: DebugLevel = 'warning',
+                   port: Optional[int] = typer.Option(
+                       None, help = "UDP/IP port to listen for WOL pattern [default: 42429]"),
+                   debug_level: Optional[DebugLevel] = typer.Option(
+                       None, help = "Logging level [default: warning]"),
                    install: Optional[bool] = typer.Option(
                        None, "--install", help = "Activate autostart via systemd user session"),
                    uninstall: Optional[bool] = typer.Option(
-                       None, "--uninstall", help = "Remove autostart configuration")):
-        coloredlogs.install(debug_level.value)
-        if install:
-            asyncio.run(self.install())
+                       None, "--uninstall", help = "Remove autostart configuration"),
+                   idle_timeout: Optional[int] = typer.Option(
+                       None, help = "Minutes without usage until kodi is stopped, 0 to disable"),
+                   backend_mac: Optional[str] = typer.Option(
+                       None, help = "MAC of the backend to pre-wake ahead of predicted usage"),
+                   prewake_lead: Optional[int] = typer.Option(
+                       None, help = "Minutes to pre-wake the backend ahead of predicted usage"),
+                   evaluate_prewake: Optional[bool] = typer.Option(
+                       None, "--evaluate-prewake",
+                       help = "Rate the pre-wake prediction on the recorded wakes"),
+                   metrics_port: Optional[int] = typer.Option(
+                       None, help = "TCP port of the Prometheus metrics endpoint, 0 to disable"),
+                   control_socket: str = typer.Option(
+                       default_socket_path(), help = "Path of the control socket, empty to disable"),
+                   loop_monitor: Optional[bool] = typer.Option(
+                       None, "--loop-monitor", help = "Report the event loop lag"),
+                   profile_dir: Optional[str] = typer.Option(
+                       None, help = "Write a 30s profile to this directory on SIGUSR2"),
+                   loop: EventLoop = typer.Option(
+                       'asyncio', help = "Event loop implementation, uvloop if installed"),
+                   config: str = typer.Option(
+                       default_config_path(), help = "Path of the configuration file"),
+                   ctx: typer.Context = None):
+        """Run the listener, see the commands for further functions"""
+        if ctx is not None and ctx.invoked_subcommand:
+            return
+        cli_settings = {('listener', 'port'): port,
+                        ('listener', 'debug_level'): debug_level and debug_level.value,
+                        ('listener', 'metrics_port'): metrics_port,
+                        ('kodi', 'idle_timeout'): idle_timeout,
+                        ('prewake', 'backend_mac'): backend_mac,
+                        ('prewake', 'lead'): prewake_lead}
+        self.config_overrides = {key: value for key, value in cli_settings.items()
+                                 if value is not None}
+        self.config_path = config
+        try:
+            settings = Config.load(config, self.config_overrides)
+        except ValueError as excp:
+            typer.echo(f"{config}: {excp}", err=True)
+            raise typer.Exit(1)
+        if journald.journal_stream_connected():
+            journald.install(settings['listener', 'debug_level'])
+        else:
+            import coloredlogs  # pylint: disable=import-outside-toplevel
+            coloredlogs.install(settings['listener', 'debug_level'])
+        install_event_loop(loop)
+        self.apply_config(settings)
+        self.control_socket = control_socket
+        self.loop_monitor = loop_monitor
+        self.profile_dir = profile_dir
+        if evaluate_prewake:
+            if not self.journal:
+                typer.echo("The journal is disabled, no wakes are recorded", err=True)
+                raise typer.Exit(1)
+            print_evaluation(self.journal, self.prewake_lead)
+        elif install:
+            self.entry = self.install
         elif uninstall:
-            asyncio.run(self.uninstall())
+            self.entry = self.uninstall
         else:
-            asyncio.run(self.main(port))
+            self.entry = functools.partial(self.main, self.config['listener', 'port'])
+
+    @staticmethod
+    def _set_debug_level(level):
+        root = logging.getLogger()
+        root.setLevel(level.upper())
+        for handler in root.handlers:
+            handler.setLevel(level.upper())
+
+    def _set_jsonrpc_port(self, port):
+        # Takes effect as the connection is opened for the next kodi run
+        self.rpc.port = port
+
+    def _set_desktop_restart_command(self, command):
+        self.desktop_restart_command = command.encode()
+
+    def _set_journal(self, path, max_bytes):
+        # The file is opened by the first record
+        if self.journal:
+            self.journal.close()
+        self.journal = WakeJournal(os.path.expanduser(path), max_bytes) if path else None
+
+    def apply_config(self, config, changed=None):
+        """Take over settings that are applied without the event loop
+
+        Objects in use are updated in place, a running kodi is not affected.
+        Ports and the pre-wake scheduler are handled by reload(). Settings
+        failing to apply are logged.
+
+        Args:
+            config (Config) The new settings
+            changed (set) Keys of the settings to apply, None for all
+        Returns:
+            (set) Keys of the settings that failed to apply
+        """
+        if changed is None:
+            changed = set(config.DEFAULTS)
+        appliers = {
+            ('listener', 'debug_level'): self._set_debug_level,
+            ('listener', 'interface'): self.wol_receiver.set_interface,
+            ('listener', 'status_hosts'): lambda hosts: self.wol_receiver.set_status_hosts(
+                hosts.split()),
+            ('kodi', 'command'): lambda command: self.kodi.set_command(command.encode()),
+            ('kodi', 'jsonrpc_port'): self._set_jsonrpc_port,
+            ('kodi', 'desktop_restart_command'): self._set_desktop_restart_command,
+            ('hdmi', 'vcgencmd'): lambda command: self.hdmi.set_vcgencmd(command.encode()),
+        }
+        failed = set()
+        for key, apply in appliers.items():
+            if key in changed:
+                try:
+                    apply(config[key])
+                except (OSError, ValueError) as excp:
+                    logging.error("Applying setting %s.%s failed: %s", *key, excp)
+                    failed.add(key)
+        if changed & {('journal', 'path'), ('journal', 'max_bytes')}:
+            self._set_journal(config['journal', 'path'], config['journal', 'max_bytes'])
+        self.config = config
+        self.idle_timeout = config['kodi', 'idle_timeout'] * 60
+        if self.idle_monitor and self.idle_timeout:
+            self.idle_monitor.idle_timeout = self.idle_timeout
+        self.metrics_port = config['listener', 'metrics_port']
+        self.backend_mac = config['prewake', 'backend_mac'] or None
+        self.prewake_lead = config['prewake', 'lead'] * 60
+        self.prewake_threshold = config['prewake', 'threshold']
+        return failed
+
+    async def reload(self):
+        """Reload the configuration file and apply the changed settings
+
+        The WOL receiver is rebound only if its port changed, a running kodi
+        is never touched. An invalid file is reported and ignored. Settings
+        that failed to apply keep their previous value in self.config, so the
+        next reload retries them. Settings of the file shadowed by the
+        command line are reported.
+        """
+        try:
+            file_config = Config.load(self.config_path)
+        except (ValueError, OSError) as excp:
+            logging.error("Configuration not reloaded: %s", excp)
+            return
+        shadowed = sorted(f'{section}.{option}'
+                          for (section, option), value in self.config_overrides.items()
+                          if file_config[section, option] not in (value,
+                                                                  Config.DEFAULTS[section, option]))
+        if shadowed:
+            logging.warning("The command line takes precedence over %s of the file",
+                            ', '.join(shadowed))
+        config = Config({**file_config.values, **self.config_overrides})
+        changed = config.diff(self.config)
+        if not changed:
+            logging.info("Configuration reloaded, no changes")
+            return
+        logging.info("Configuration reloaded, changed: %s",
+                     ', '.join(sorted(f'{section}.{option}' for section, option in changed)))
+        previous = self.config
+        failed = self.apply_config(config, changed)
+        restarts = (
+            ({('listener', 'port')}, "Rebinding the WOL port",
+             lambda: self.wol_receiver.rebind(config['listener', 'port'])),
+            ({('listener', 'metrics_port')}, "Restarting the metrics endpoint",
+             self._start_metrics),
+            ({('cec', 'command')}, "Restarting cec-client", self._start_cec),
+            ({('rsync', 'process'), ('rsync', 'unit')}, "Restarting the rsync throttle",
+             self._start_rsync_throttle),
+            ({('hotplug', 'prelaunch'), ('hotplug', 'throttle'), ('hotplug', 'tvservice')},
+             "Restarting the hotplug monitor", self._start_hotplug_monitor))
+        for keys, action, restart in restarts:
+            if changed & keys:
+                try:
+                    await restart()
+                except OSError as excp:
+                    logging.error("%s failed: %s", action, excp)
+                    failed |= changed & keys
+        if changed & {('prewake', 'backend_mac'), ('prewake', 'lead'), ('prewake', 'threshold')}:
+            self._start_prewake()
+        if changed & {('library', 'watch'), ('library', 'settle')}:
+            self._start_library_watcher()
+        if failed:
+            self.config = Config({key: (previous if key in failed else config)[key]
+                                  for key in config.values})
+
+    async def _start_metrics(self):
+        """(Re)start the metrics endpoint on metrics_port"""
+        if self.metrics_server:
+            self.metrics_server.close()
+            self.metrics_server = None
+        if self.metrics_port:
+            self.metrics_server = MetricsServer()
+            await self.metrics_server.init(self.metrics_port)
+
+    async def _start_cec(self):
+        """(Re)start the CEC co-process in the background"""
+        if self.cec:
+            await self.cec.close()
+            self.cec = None
+        if self.config['cec', 'command']:
+            self.cec = CecClient(self.config['cec', 'command'].encode())
+            asyncio.get_running_loop().create_task(self._cec_call(self.cec.start))
+
+    async def _start_rsync_throttle(self):
+        """(Re)create the rsync throttle, throttle rsync if kodi is running"""
+        if self.rsync_throttle:
+            await self.rsync_throttle.set_throttled(False)
+            self.rsync_throttle = None
+        if self.config['rsync', 'process']:
+            self.rsync_throttle = RsyncThrottle(self.config['rsync', 'process'],
+                                                self.config['rsync', 'unit'])
+            if self.kodi_running:
+                await self.rsync_throttle.set_throttled(True)
+
+    def _start_library_watcher(self):
+        """(Re)start watching the video directory"""
+        if self.library_watcher:
+            self.library_watcher.close()
+            self.library_watcher = None
+        if self.config['library', 'watch']:
+            watcher = LibraryWatcher(os.path.expanduser(self.config['library', 'watch']),
+                                     self._library_changed, self.config['library', 'settle'])
+            try:
+                self.library_watcher = watcher.start()
+            except OSError as excp:
+                logging.error("Watching the library failed: %s", excp)
+
+    async def _start_hotplug_monitor(self):
+        """(Re)start monitoring the HDMI hotplug"""
+        if self.hotplug_monitor:
+            await self.hotplug_monitor.close()
+            self.hotplug_monitor = None
+        if self.config['hotplug', 'prelaunch']:
+            monitor = HotplugMonitor(lambda: self.kodi_start(('hotplug', 0), prelaunch=True),
+                                     self.config['hotplug', 'throttle'],
+                                     self.config['hotplug', 'tvservice'].encode())
+            try:
+                self.hotplug_monitor = await monitor.start()
+            except OSError as excp:
+                logging.error("Monitoring the HDMI hotplug failed: %s", excp)
+
+    def _library_changed(self, directories):
+        """Let kodi scan the changed directories, on its next start if not running"""
+        self.pending_scans = set(coalesce(self.pending_scans.union(directories)))
+        if self.kodi_running and not self.scan_task:
+            self.scan_task = asyncio.get_running_loop().create_task(self._scan_library())
+
+    async def _scan_library(self):
+        """Ask kodi to scan the pending directories while it is running
+
+        Kodi needs some time until it accepts JSON-RPC calls after its start,
+        failing calls are repeated.
+        """
+        try:
+            while self.pending_scans and self.kodi_running:
+                directory = min(self.pending_scans)
+                try:
+                    # Kodi identifies directories by the trailing separator
+                    await self.rpc.call('VideoLibrary.Scan', {
+                        'directory': os.path.join(directory, ''), 'showdialogs': False})
+                    logging.info("Kodi scans %s", directory)
+                except (OSError, asyncio.TimeoutError):
+                    await asyncio.sleep(1)
+                    continue
+                except KodiJsonRpcError as excp:
+                    logging.warning("Kodi refused to scan %s: %s", directory, excp)
+                self.pending_scans.discard(directory)
+        finally:
+            self.scan_task = None
+
+    def _throttle_rsync(self, throttled):
+        """Throttle or restore rsync in the background"""
+        if self.rsync_throttle:
+            asyncio.get_running_loop().create_task(
+                self.rsync_throttle.set_throttled(throttled))
+
+    def _kodi_notification(self, method, params):  # pylint: disable=unused-argument
+        """Throttle rsync during playback"""
+        if method in self.PLAYBACK_STARTED:
+            self._throttle_rsync(True)
+        elif method in self.PLAYBACK_ENDED:
+            self._throttle_rsync(False)
+
+    async def _watch_playback(self):
+        """Keep a JSON-RPC connection to kodi open to receive player notifications"""
+        while True:
+            if not self.rpc.connected:
+                try:
+                    await self.rpc.connect()
+                except (OSError, asyncio.TimeoutError):
+                    # Kodi is still starting up
+                    pass
+            await asyncio.sleep(1)
+
+    @staticmethod
+    async def _cec_call(coro_fn):
+        """Await a CEC coroutine function, log instead of raising errors"""
+        try:
+            await coro_fn()
+        except CecError as excp:
+            logging.warning("HDMI-CEC failed: %s", excp)
+            return False
+        return True
+
+    async def _cec_wake_tv(self):
+        """Switch the TV on and over to this device"""
+        start = time.monotonic()
+        if await self._cec_call(self.cec.wake_tv):
+            self._phase_done('cec_wake', start)
+
+    def _start_prewake(self):
+        """(Re)start the pre-wake scheduler with the current settings"""
+        if self.prewake_task:
+            self.prewake_task.cancel()
+            self.prewake_task = None
+        if not (self.journal and self.backend_mac):
+            return
+        if not self.wake_model:
+            self.wake_model = WakeModel()
+            try:
+                wakes = self.journal.wakes()
+            except OSError as excp:
+                logging.warning("Reading the wakes failed: %s", excp)
+                wakes = ()
+            for timestamp in wakes:
+                self.wake_model.add_wake(timestamp)
+        if not self.prewake_scheduler:
+            self.prewake_scheduler = PreWakeScheduler(self.wake_model, self.backend_mac)
+        self.prewake_scheduler.mac = self.backend_mac
+        self.prewake_scheduler.lead = self.prewake_lead
+        self.prewake_scheduler.threshold = self.prewake_threshold
+        self.prewake_task = asyncio.get_running_loop().create_task(self.prewake_scheduler.run())
 
     async def install(self):
         """Install listener as a systemd service"""
@@ -79,6 +490,7 @@ class KodiManager():
         await manager.reload()
         await manager.enable_unit(self.SYSTEMD_SERVICE)
         await manager.start_unit(self.SYSTEMD_SERVICE)
+        manager.close()
 
     async def uninstall(self):
         """Uninstall listener from systemd"""
@@ -87,10 +499,29 @@ class KodiManager():
         await manager.stop_unit(self.SYSTEMD_SERVICE)
         await manager.disable_unit(self.SYSTEMD_SERVICE)
         await manager.reload()
+        manager.close()
 
     def run(self):
-        """Execute the application. Returns as application exits"""
-        typer.run(self._typer_run)
+        """Execute the application. Returns as application exits
+
+        The command line is parsed first. The application runs after the
+        parser returned, so the CLI objects are not kept alive meanwhile.
+        Without a command the listener runs, the options are those of the
+        callback.
+        """
+        cli = typer.Typer(add_completion=False)
+        cli.callback(invoke_without_command=True)(self._typer_run)
+        cli.command('send')(wol_sender.send_command)
+        cli.command('analyze')(analyze_command)
+        try:
+            cli()
+        except SystemExit as excp:
+            if excp.code:
+                raise
+        entry, self.entry = self.entry, None
+        if entry:
+            gc.collect()
+            asyncio.run(entry())
 
     async def main(self, port):
         """The asyncio based application main()"""
@@ -100,12 +531,38 @@ class KodiManager():
             loop.add_signal_handler(
                 getattr(signal, signame),
                 functools.partial(self._exit, signame, loop))
+        loop.add_signal_handler(signal.SIGHUP, lambda: loop.create_task(self.reload()))
+        if self.loop_monitor:
+            loop.create_task(LoopLagMonitor().run())
+        if self.profile_dir:
+            Profiler(self.profile_dir).install()
         # Initialize WOL receiver. Any activity will be triggerd by this
         # WOL protocol
         await self.wol_receiver.init(port)
+        await self._start_metrics()
+        await self._start_cec()
+        await self._start_rsync_throttle()
+        self._start_library_watcher()
+        await self._start_hotplug_monitor()
+        if self.control_socket:
+            try:
+                self.control_server = await ControlServer(self).init(self.control_socket)
+            except OSError as excp:
+                logging.error("Opening the control socket failed: %s", excp)
+        self._start_prewake()
         # Wait for a never completing future - forever
         self.exit_future = loop.create_future()
         ret = await self.exit_future
+        if self.control_server:
+            self.control_server.close()
+        if self.cec:
+            await self.cec.close()
+        if self.rsync_throttle:
+            await self.rsync_throttle.set_throttled(False)
+        if self.hotplug_monitor:
+            await self.hotplug_monitor.close()
+        if self.journal:
+            self.journal.close()
         if isinstance(ret, Exception):
             raise ValueError(ret) from ret
 
@@ -116,33 +573,233 @@ class KodiManager():
         before.
         """
         try:
+            wake = self.last_wake or {'time': time.time(), 'source': None}
+            start = exec_start = time.monotonic()
+            if self.cec:
+                # The TV starts up in parallel to kodi
+                asyncio.get_running_loop().create_task(self._cec_wake_tv())
+            ready_task = asyncio.get_running_loop().create_task(self._wait_ready(exec_start))
             display_state = await self.hdmi.get_state()
+            start = self._phase_done('hdmi_query', start)
             if not display_state:
                 await self.hdmi.set_state(True)
+                start = self._phase_done('hdmi_enable', start)
+                self.state_changed()
+            hdmi = start - exec_start
             logging.debug("Running Kodi")
+            if self.idle_timeout:
+                self._start_idle_monitor()
+            if self.pending_scans:
+                self._library_changed(())
+            playback_task = None
+            if self.rsync_throttle:
+                # rsync is throttled from kodi's startup until playback ends
+                self._throttle_rsync(True)
+                playback_task = asyncio.get_running_loop().create_task(self._watch_playback())
+            KODI_RUNNING.set(1)
             result = await self.kodi.run_wait()
+            KODI_RUNNING.set(0)
+            duration = time.monotonic() - start
+            SESSION_SECONDS.observe(duration)
+            logging.info("Kodi exited with code %d after %.0fs", result[0], duration,
+                         extra={'KODI_PID': self.kodi.pid, 'DURATION_MS': int(duration * 1000)})
+            KODI_EXITS.inc(str(result[0]))
+            ready = NAN
+            if ready_task.done() and not ready_task.cancelled():
+                if ready_task.exception():
+                    logging.warning("Waiting for kodi failed: %r", ready_task.exception())
+                else:
+                    ready = ready_task.result()
+            ready_task.cancel()
+            if self.idle_task:
+                self.idle_task.cancel()
+                self.idle_task = None
+                self.idle_monitor = None
+            if playback_task:
+                playback_task.cancel()
+            if self.rsync_throttle:
+                await self.rsync_throttle.set_throttled(False)
+            self.rpc.close()
+            start = exit_time = time.monotonic()
             if result[0] == 0:
                 logging.debug("Kodi finshed successfully")
             else:
                 logging.debug("Kodi finshed with error, restarting Desktop")
                 await AsyncSubprocess(
-                    b'/usr/bin/sudo systemctl restart sddm', 
+                    self.desktop_restart_command,
                     abort_on_fail=False
                 ).run_wait()
+                start = self._phase_done('desktop_restart', start)
 
-            if not display_state:
+            if not display_state or self.standby:
+                self.standby = False
                 await self.hdmi.set_state(display_state)
+                self._phase_done('hdmi_restore', start)
+                self.state_changed()
+            self._journal('add_session', wake['time'], wake['source'], result[0], duration,
+                          self.duplicate_wakes, ready, hdmi, time.monotonic() - exit_time)
         except OSError as excp:
             logging.error("Running external commands caused an exception:", exc_info=excp)
             sys.exit(1)
 
+    def _start_idle_monitor(self):
+        """Monitor the running kodi, stop it or put it into standby once idle"""
+        self.idle_monitor = KodiIdleMonitor(self.rpc, self.idle_timeout, self._kodi_idle)
+        self.idle_task = asyncio.get_running_loop().create_task(self.idle_monitor.run())
+
+    async def _kodi_idle(self):
+        """Idle callback of the idle monitor"""
+        if self.config['kodi', 'idle_action'] == 'standby':
+            await self.kodi_standby()
+        else:
+            await self.kodi_stop()
+
+    async def kodi_standby(self):
+        """Keep kodi running, but release the backend and switch HDMI off
+
+        The VDR add-on holds a connection to the backend that keeps it awake,
+        it is disabled. The next wake resumes kodi, see kodi_resume(). If kodi
+        does not disable the add-on, it is stopped instead.
+        """
+        if not self.kodi_running or self.standby:
+            return
+        try:
+            await self.rpc.call('Addons.SetAddonEnabled',
+                                {'addonid': self.PVR_ADDON, 'enabled': False})
+        except (OSError, asyncio.TimeoutError, KodiJsonRpcError) as excp:
+            logging.warning("Kodi did not disable %s, stopping it: %r", self.PVR_ADDON, excp)
+            await self.kodi_stop()
+            return
+        logging.info("Kodi in standby")
+        self.standby = True
+        self._throttle_rsync(False)
+        if self.cec:
+            asyncio.get_running_loop().create_task(self._cec_call(self.cec.standby))
+        await self.hdmi.set_state(False)
+        self.state_changed()
+
+    async def kodi_resume(self, source=None, verdict='resumed'):
+        """Resume kodi from standby, the counterpart of kodi_standby()
+
+        Args:
+            source (str) The host requesting the resume, for the journal
+            verdict (str) The journal verdict of the resume
+        """
+        wake_time = time.time()
+        start = time.monotonic()
+        if self.cec:
+            asyncio.get_running_loop().create_task(self._cec_wake_tv())
+        self._throttle_rsync(True)
+        await self.hdmi.set_state(True)
+        try:
+            await self.rpc.call('Addons.SetAddonEnabled',
+                                {'addonid': self.PVR_ADDON, 'enabled': True})
+        except (OSError, asyncio.TimeoutError, KodiJsonRpcError) as excp:
+            logging.warning("Kodi did not enable %s: %r", self.PVR_ADDON, excp)
+        ready = self._phase_done('standby_resume', start) - start
+        self._journal('add_wake', wake_time, source, verdict, ready)
+        if self.idle_timeout and self.kodi_running:
+            self._start_idle_monitor()
+        self.state_changed()
+
+    async def _wait_ready(self, start):
+        """Poll the starting kodi until it answers, return the seconds since start"""
+        while True:
+            try:
+                await self.rpc.call('JSONRPC.Ping')
+                break
+            except (OSError, asyncio.TimeoutError, KodiJsonRpcError):
+                await asyncio.sleep(self.KODI_READY_POLL)
+        return self._phase_done('kodi_ready', start) - start
+
+    def _journal(self, method, *args):
+        """Call a recording method of the journal, log instead of raising errors"""
+        if self.journal:
+            try:
+                getattr(self.journal, method)(*args)
+            except OSError as excp:
+                logging.warning("Recording to the journal failed: %s", excp)
+
+    @staticmethod
+    def _phase_done(phase, start):
+        """Record the duration of a kodi_exec() phase, return the current time"""
+        now = time.monotonic()
+        LAUNCH_PHASE_SECONDS.observe(now - start, phase)
+        logging.debug("Phase %s took %.3fs", phase, now - start,
+                      extra={'PHASE': phase, 'DURATION_MS': int((now - start) * 1000)})
+        return now
+
+    async def kodi_stop(self):
+        """Quit a running kodi gracefully
+
+        Kodi is asked to quit via JSON-RPC. If it does not exit in time, the
+        kodi process is terminated. Returns as kodi_exec() has finished.
+        """
+        if not self.kodi_running:
+            return
+        logging.debug("Stopping Kodi")
+        try:
+            await self.rpc.call('Application.Quit')
+        except (OSError, asyncio.TimeoutError, KodiJsonRpcError) as excp:
+            logging.warning("Kodi did not accept quit request: %r", excp)
+        try:
+            await asyncio.wait_for(asyncio.shield(self.kodi_task), self.KODI_QUIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            logging.warning("Kodi did not quit in time, terminating it")
+            self.kodi.terminate()
+            await asyncio.shield(self.kodi_task)
+
     def kodi_done_cb(self, fut):
         """Callback called as kodi_exec() coroutine has finished"""
         # All excpetion are expected to be handled....
         fut.result()
         self.kodi_running = False
+        self.kodi_task = None
+        self.standby = False
+        self.prelaunched = False
+        self.state_changed()
+
+    def status(self):
+        """Return the application state
 
-    def kodi_start(self, addr):
+        Returns:
+            (dict) kodi_running, standby (kodi is running in standby), hdmi
+                (None if unknown), uptime in seconds,
+                last_wake (dict with time and source, None if no wake yet),
+                next_wake (time the backend is pre-woken next, None if
+                pre-waking is off or no usage is predicted)
+        """
+        return {'kodi_running': self.kodi_running,
+                'standby': self.standby,
+                'hdmi': self.hdmi.state,
+                'uptime': round(time.time() - self.start_time, 3),
+                'last_wake': self.last_wake,
+                'next_wake': self.next_wake()}
+
+    def next_wake(self):
+        """Return the time the backend is pre-woken next, None if unknown"""
+        if not (self.prewake_task and self.wake_model):
+            return None
+        slot_start = self.wake_model.next_slot(time.time(), self.prewake_lead,
+                                               self.prewake_threshold)
+        return None if slot_start is None else slot_start - self.prewake_lead
+
+    def add_state_listener(self, listener):
+        """Register a callable called with status() on each state change"""
+        self.state_listeners.append(listener)
+
+    def remove_state_listener(self, listener):
+        """Unregister a listener registered by add_state_listener"""
+        self.state_listeners.remove(listener)
+
+    def state_changed(self):
+        """Inform all state listeners about a state change"""
+        if self.state_listeners:
+            status = self.status()
+            for listener in list(self.state_listeners):
+                listener(status)
+
+    def kodi_start(self, addr, prelaunch=False):
         """API to trigger start of kodi
 
         Creates an asyncio task that will run kodi. Returns immediately.
@@ -150,13 +807,49 @@ class KodiManager():
 
         In case Kodi was started already, another start is omitted until prev.
         started kodi process has finished.
+
+        Args:
+            addr (tuple) Address of the host requesting the start
+            prelaunch (bool) Start ahead of a wake, e.g. as a display got
+                connected. A prelaunch is not a wake, the pre-wake model does
+                not learn from it and the next wake is no duplicate.
         """
+        now = time.time()
+        self.last_wake = {'time': now, 'source': addr[0]}
+        # Only wakes starting, resuming or claiming kodi are recorded, the
+        # model learns from the same wakes as replayed from the journal
+        if self.wake_model and not prelaunch and (
+                not self.kodi_running or self.standby or self.prelaunched):
+            self.wake_model.add_wake(now)
         if not self.kodi_running:
-            logging.debug("Kodi start requested by %s:%d", addr[0], addr[1])
+            LAUNCHES.inc('prelaunched' if prelaunch else 'started')
+            logging.info("Kodi start requested by %s:%d", addr[0], addr[1],
+                         extra={'WOL_SOURCE': addr[0]})
             self.kodi_running = True
-            start_task = asyncio.get_running_loop().create_task(self.kodi_exec())
-            start_task.add_done_callback(self.kodi_done_cb)
-
+            self.duplicate_wakes = 0
+            self.prelaunched = prelaunch
+            self.kodi_task = asyncio.get_running_loop().create_task(self.kodi_exec())
+            self.kodi_task.add_done_callback(self.kodi_done_cb)
+            self.state_changed()
+            self._journal('add_wake', now, addr[0], 'prelaunched' if prelaunch else 'started')
+        elif self.standby:
+            LAUNCHES.inc('prelaunched' if prelaunch else 'resumed')
+            logging.info("Kodi resume requested by %s:%d", addr[0], addr[1],
+                         extra={'WOL_SOURCE': addr[0]})
+            self.standby = False
+            self.prelaunched = prelaunch
+            asyncio.get_running_loop().create_task(
+                self.kodi_resume(addr[0], 'prelaunched' if prelaunch else 'resumed'))
+        elif prelaunch:
+            logging.debug("Kodi prelaunch omitted, kodi is running already")
+        elif self.prelaunched:
+            # The wake kodi was prelaunched for
+            LAUNCHES.inc('claimed')
+            self.prelaunched = False
+            self._journal('add_wake', now, addr[0], 'claimed')
         else:
+            LAUNCHES.inc('duplicate')
+            # Counted only, written with the session
+            self.duplicate_wakes += 1
             logging.debug("Kodi start requested by %s:%d but kodi is running already",
-                          addr[0], addr[1])
+                          addr[0], addr[1], extra={'WOL_SOURCE': addr[0]})
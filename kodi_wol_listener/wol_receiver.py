@@ -1,19 +1,101 @@
-"""Provides a Wake-On-LAN pattern receiver that triggers a callback"""
+"""Provides a Wake-On-LAN pattern receiver that triggers a callback
+
+Besides WOL patterns the receiver answers status queries on the same port, a
+datagram starting with STATUS_QUERY is answered by a single datagram holding
+the state of the listener as JSON object, see KodiManager.status(). The
+shutdown hook of the backend uses it to find out whether a client is in use.
+
+The reply is several times larger than the query and tells about the usage
+of the client. So only queries of the configured status hosts are answered,
+none by default, and at most one per STATUS_INTERVAL. Spoofed queries can't
+turn the listener into a traffic amplifier this way.
+"""
+import json
+import time
+import socket
 import asyncio
 import logging
-import getmac
+
+from kodi_wol_listener import metrics
+
+# Not labelled by source, any host could create series without bounds. The
+# sources are logged with the WOL_SOURCE field instead.
+PACKETS = metrics.counter('kodi_wol_listener_packets', 'UDP packets received by the WOL listener',
+                          ['verdict'])
+
+STATUS_QUERY = b'kodi_wol_listener status'
+# Minimum seconds between two status replies
+STATUS_INTERVAL = 0.1
+
+def interface_mac(interface):
+    """Return the MAC address of a network interface
+
+    The address is read from sysfs, getmac is only loaded on systems
+    without it.
+
+    Args:
+        interface (str) Name of the interface, e.g. 'eth0'
+    Returns:
+        (bytes) The 6 bytes MAC address
+    """
+    try:
+        with open(f'/sys/class/net/{interface}/address') as address:
+            mac_hex = address.read().strip()
+    except OSError:
+        import getmac  # pylint: disable=import-outside-toplevel
+        mac_hex = getmac.get_mac_address(interface=interface)
+    if not mac_hex:
+        raise OSError(f"No MAC address found for interface {interface}")
+    return bytes.fromhex(mac_hex.replace(':', ''))
 
 class WolReceiver(asyncio.DatagramProtocol):
     """Asyncio based Wake On LAN receiver listening on UDP port"""
 
-    def __init__(self, wol_callback):
+    def __init__(self, wol_callback, interface='eth0', status_callback=None, status_hosts=()):
         super().__init__()
-        # TODO: Fetch MACs from all the present interfaces
-        mac_hex = getmac.get_mac_address(interface="eth0")
-        self.mymac_bytes = bytes.fromhex(mac_hex.replace(':', ''))
+        # The MAC is looked up by init(), the interface may be configured
+        # before that
+        self.interface = interface
+        self.mymac_bytes = None
         self.wol_callback = wol_callback
+        # Returns the state (dict) reported on status queries, None to ignore them
+        self.status_callback = status_callback
+        self.status_hosts = frozenset()
+        self.set_status_hosts(status_hosts)
+        # Monotonic time of the last status reply
+        self.last_status = None
         self.transport = None
 
+    def set_interface(self, interface):
+        """Accept the WOL pattern of the given network interface's MAC
+
+        Before init(), the interface is only taken over.
+
+        Raises:
+            OSError The interface has no MAC address
+        """
+        # TODO: Fetch MACs from all the present interfaces
+        if self.mymac_bytes is None:
+            self.interface = interface
+            return
+        self.mymac_bytes = interface_mac(interface)
+        self.interface = interface
+
+    def set_status_hosts(self, hosts):
+        """Answer the status queries of the given IPv4 addresses only
+
+        Args:
+            hosts (iterable of str) The addresses, none to ignore all queries
+        Raises:
+            ValueError An address is invalid
+        """
+        for host in hosts:
+            try:
+                socket.inet_aton(host)
+            except OSError:
+                raise ValueError(f"Invalid status host address {host}") from None
+        self.status_hosts = frozenset(hosts)
+
     def connection_made(self, transport):
         super().connection_made(transport)
         self.transport = transport
@@ -21,12 +103,37 @@ class WolReceiver(asyncio.DatagramProtocol):
     def datagram_received(self, data, addr):
         super().datagram_received(data, addr)
         accepted = b'\xff'*6 + self.mymac_bytes == data[:12]
+        if not accepted and self.status_callback and data.startswith(STATUS_QUERY):
+            now = time.monotonic()
+            if addr[0] not in self.status_hosts:
+                PACKETS.inc('query_denied')
+            elif self.last_status is not None and now - self.last_status < STATUS_INTERVAL:
+                PACKETS.inc('query_throttled')
+            else:
+                PACKETS.inc('query')
+                self.last_status = now
+                self._reply_status(addr)
+            return
+        PACKETS.inc('accepted' if accepted else 'rejected')
         if accepted:
             self.wol_callback(addr)
-        logging.debug("WOL listener %s from %s:%d: %s",
-                      'accepted' if accepted else 'rejected',
-                      addr[0], addr[1],
-                      data.hex())
+        # Hexdump the packet only if it is logged
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("WOL listener %s from %s:%d: %s",
+                          'accepted' if accepted else 'rejected',
+                          addr[0], addr[1],
+                          data.hex(), extra={'WOL_SOURCE': addr[0]})
+
+    def _reply_status(self, addr):
+        # The time of the listener allows the client to evaluate timestamps
+        # independent of clock differences
+        status = dict(self.status_callback(), time=time.time())
+        try:
+            self.transport.sendto(json.dumps(status).encode(), addr)
+        except OSError as excp:
+            logging.warning("Replying status to %s failed: %s", addr[0], excp)
+        logging.debug("Status query from %s:%d", addr[0], addr[1],
+                      extra={'WOL_SOURCE': addr[0]})
 
     async def init(self, port=0):
         """Async initialization method
@@ -35,10 +142,35 @@ class WolReceiver(asyncio.DatagramProtocol):
             port (int) UDP port the receiver shall be listening
         Returns:
             (int) The port actually taken (in case of 0 port argument)
+        Raises:
+            OSError The port is in use or the interface has no MAC address
         """
+        if self.mymac_bytes is None:
+            self.mymac_bytes = interface_mac(self.interface)
         loop = asyncio.get_running_loop()
         await loop.create_datagram_endpoint(lambda: self, local_addr=('0.0.0.0', port))
         sock = self.transport.get_extra_info('socket')
         port = sock.getsockname()[1]
         logging.debug("WOL listener running on port %d", port)
         return port
+
+    async def rebind(self, port):
+        """Move the receiver to another port
+
+        The current socket is closed only after the new one has been bound,
+        so the receiver keeps running on the old port if binding fails.
+
+        Args:
+            port (int) New UDP port
+        Returns:
+            (int) The port actually taken
+        """
+        old_transport = self.transport
+        try:
+            port = await self.init(port)
+        except OSError:
+            self.transport = old_transport
+            raise
+        if old_transport:
+            old_transport.close()
+        return port
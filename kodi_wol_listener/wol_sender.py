@@ -0,0 +1,235 @@
+"""Build and send Wake-On-LAN magic packets
+
+Besides single packets (send_magic_packet()), WolSender sends the packets of
+many hosts to many destinations, e.g. to wake the backend and all clients or
+to load-test listeners. All packets are built upfront and written in batches
+from one non-blocking socket per address family, the event loop is not
+involved. Destinations are given as:
+    broadcast               255.255.255.255, the local network
+    192.168.1.255           a subnet broadcast or a unicast IPv4 address
+    host:port               a host name or IPv4 address with port
+    fe80::1%eth0            an IPv6 address, e.g. ff02::1%eth0 (all nodes)
+    [fe80::1%eth0]:port     an IPv6 address with port
+"""
+import time
+import socket
+import logging
+import selectors
+import collections
+from typing import List, Optional
+
+import typer
+
+# UDP port commonly used for magic packets (discard service)
+WOL_PORT = 9
+BROADCAST = '255.255.255.255'
+
+SendResult = collections.namedtuple('SendResult', 'sent failed seconds')
+
+
+def _parse_password(password):
+    """Return the bytes of a SecureOn password
+
+    Args:
+        password (str) 6 bytes in MAC notation or 4 bytes in dotted decimal
+            (IPv4) notation
+    """
+    if password.count('.') == 3:
+        try:
+            return socket.inet_aton(password)
+        except OSError:
+            raise ValueError(f"Invalid SecureOn password {password}") from None
+    try:
+        password_bytes = bytes.fromhex(password.replace(':', '').replace('-', ''))
+    except ValueError:
+        password_bytes = b''
+    if len(password_bytes) not in (4, 6):
+        raise ValueError(f"Invalid SecureOn password {password}")
+    return password_bytes
+
+def magic_packet(mac, password=None):
+    """Return the magic packet waking the given MAC address
+
+    Args:
+        mac (str) MAC address, e.g. 'b8:27:eb:01:02:03'
+        password (str) SecureOn password appended to the packet, e.g.
+            '01:02:03:04:05:06' or '192.168.1.1', None for none
+    Returns:
+        (bytes) The 102 bytes magic packet, 106 or 108 bytes with password
+    """
+    try:
+        mac_bytes = bytes.fromhex(mac.replace(':', '').replace('-', ''))
+    except ValueError:
+        mac_bytes = b''
+    if len(mac_bytes) != 6:
+        raise ValueError(f"Invalid MAC address {mac}")
+    packet = b'\xff' * 6 + mac_bytes * 16
+    if password:
+        packet += _parse_password(password)
+    return packet
+
+def parse_target(target, port=WOL_PORT):
+    """Resolve a destination, see the module documentation for the notation
+
+    Args:
+        target (str) The destination
+        port (int) UDP port if the destination does not include one
+    Returns:
+        (tuple) Address family and socket address
+    Raises:
+        OSError The host name could not be resolved
+    """
+    host = target
+    if target == 'broadcast':
+        host = BROADCAST
+    elif target.startswith('['):
+        host, _, rest = target[1:].partition(']')
+        if rest:
+            port = int(rest.lstrip(':'))
+    elif target.count(':') == 1:
+        host, port = target.split(':')
+        port = int(port)
+    family, _, _, _, sockaddr = socket.getaddrinfo(host, port, type=socket.SOCK_DGRAM)[0]
+    return family, sockaddr
+
+def send_magic_packet(mac, address='255.255.255.255', port=WOL_PORT):
+    """Send a single magic packet for the given MAC address
+
+    Args:
+        mac (str) MAC address of the host to wake
+        address (str) Destination address, broadcast by default
+        port (int) Destination UDP port
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sock.sendto(magic_packet(mac), (address, port))
+    logging.debug("Magic packet for %s sent to %s:%d", mac, address, port)
+
+
+class WolSender():
+    """Send magic packets to many destinations at a high rate
+
+    Args:
+        timeout (float) Seconds to wait for a full socket buffer to drain
+            before a packet is counted as failed
+    """
+
+    def __init__(self, timeout=1.0):
+        self.timeout = timeout
+        # The socket of each address family
+        self.sockets = {}
+        # A selector of each socket, waiting for a full socket must not
+        # return early because another one is writable
+        self.selectors = {}
+
+    def _socket(self, family):
+        """Return the non-blocking socket of the address family"""
+        sock = self.sockets.get(family)
+        if sock is None:
+            sock = socket.socket(family, socket.SOCK_DGRAM)
+            if family == socket.AF_INET:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            sock.setblocking(False)
+            selector = selectors.DefaultSelector()
+            selector.register(sock, selectors.EVENT_WRITE)
+            self.selectors[sock] = selector
+            self.sockets[family] = sock
+        return sock
+
+    def close(self):
+        """Close the sockets"""
+        for sock in self.sockets.values():
+            self.selectors.pop(sock).close()
+            sock.close()
+        self.sockets.clear()
+
+    def send(self, packets, targets, repeat=1, spacing=0.0, rate=0.0, batch=64):
+        """Send each packet to each destination
+
+        Args:
+            packets (list of bytes) The magic packets, see magic_packet()
+            targets (list of tuple) The destinations, see parse_target()
+            repeat (int) Rounds of sending all packets, magic packets are
+                commonly sent several times as they may get lost
+            spacing (float) Seconds from the start of a round to the next one
+            rate (float) Maximum packets per second, 0 for unlimited
+            batch (int) Packets written without checking the rate
+        Returns:
+            (SendResult) Packets sent and failed, seconds taken
+        """
+        items = [(self._socket(family), packet, sockaddr)
+                 for packet in packets for family, sockaddr in targets]
+        sent = failed = 0
+        start = time.perf_counter()
+        for round_index in range(repeat):
+            if round_index and spacing:
+                self._sleep_until(start + round_index * spacing)
+            for offset in range(0, len(items), batch):
+                if rate:
+                    self._sleep_until(start + (sent + failed) / rate)
+                batch_sent = self._send_batch(items[offset:offset + batch])
+                sent += batch_sent
+                failed += min(batch, len(items) - offset) - batch_sent
+        return SendResult(sent, failed, time.perf_counter() - start)
+
+    @staticmethod
+    def _sleep_until(deadline):
+        delay = deadline - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _send_batch(self, items):
+        """Write the packets, return the number sent"""
+        sent = 0
+        for sock, packet, sockaddr in items:
+            deadline = None
+            while True:
+                try:
+                    sock.sendto(packet, sockaddr)
+                    sent += 1
+                    break
+                except BlockingIOError:
+                    # The socket buffer is full, wait until it drained. The
+                    # deadline ends retrying sockets reported writable while
+                    # the destination still refuses (e.g. a full unix socket)
+                    now = time.monotonic()
+                    if deadline is None:
+                        deadline = now + self.timeout
+                    if now >= deadline or not self.selectors[sock].select(deadline - now):
+                        logging.warning("Sending to %s timed out", sockaddr[0])
+                        break
+                except OSError as excp:
+                    logging.warning("Sending to %s failed: %s", sockaddr[0], excp)
+                    break
+        return sent
+
+
+def send_command(macs: List[str] = typer.Argument(..., help="MAC addresses of the hosts to wake"),
+                 target: List[str] = typer.Option(
+                     ['broadcast'], help="Destination: broadcast, host[:port], IPv6 address "
+                     "or [IPv6 address]:port"),
+                 port: int = typer.Option(WOL_PORT, help="UDP port if the target has none"),
+                 password: Optional[str] = typer.Option(
+                     None, help="SecureOn password, 6 bytes as MAC or 4 bytes as a.b.c.d"),
+                 repeat: int = typer.Option(1, help="Rounds of sending all packets"),
+                 spacing: float = typer.Option(0.0, help="Seconds between the rounds"),
+                 rate: float = typer.Option(0.0, help="Packets per second, 0 for unlimited"),
+                 batch: int = typer.Option(64, min=1, help="Packets written without checking "
+                                           "the rate")):
+    """Send magic packets to wake hosts, report the rate achieved"""
+    try:
+        packets = [magic_packet(mac, password) for mac in macs]
+        targets = [parse_target(name, port) for name in target]
+    except (ValueError, OSError) as excp:
+        typer.echo(str(excp), err=True)
+        raise typer.Exit(2)
+    sender = WolSender()
+    try:
+        result = sender.send(packets, targets, repeat, spacing, rate, batch)
+    finally:
+        sender.close()
+    achieved = result.sent / result.seconds if result.seconds else 0
+    typer.echo(f"{result.sent} packets sent in {result.seconds:.3f}s "
+               f"({achieved:.0f} packets/s), {result.failed} failed")
+    if result.failed:
+        raise typer.Exit(1)
@@ -0,0 +1,46 @@
+"""Helpers for the benchmark tests
+
+Benchmarks are regular tests: they report their figures to stdout (use
+pytest -s to see them) and fail when a generous threshold is exceeded.
+"""
+import time
+import statistics
+
+
+class Timings():
+    """Collects durations and summarizes them"""
+    def __init__(self, name):
+        self.name = name
+        self.samples = []
+
+    def add(self, seconds):
+        """Add a single duration in seconds"""
+        self.samples.append(seconds)
+
+    async def measure(self, coro_fn, *args, **kwargs):
+        """Await coro_fn(*args, **kwargs), record its duration, return its result"""
+        start = time.perf_counter()
+        result = await coro_fn(*args, **kwargs)
+        self.add(time.perf_counter() - start)
+        return result
+
+    def percentile(self, pct):
+        """Return the pct (0-100) percentile in seconds"""
+        samples = sorted(self.samples)
+        index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    @property
+    def median(self):
+        """Median duration in seconds"""
+        return statistics.median(self.samples)
+
+    def report(self):
+        """Print a single line summary and return it"""
+        line = (f"{self.name}: n={len(self.samples)} "
+                f"min={min(self.samples) * 1e3:.3f}ms "
+                f"median={self.median * 1e3:.3f}ms "
+                f"p95={self.percentile(95) * 1e3:.3f}ms "
+                f"max={max(self.samples) * 1e3:.3f}ms")
+        print(line)
+        return line
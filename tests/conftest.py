@@ -20,3 +20,31 @@ def mock_coroutine(mocker, monkeypatch):
             monkeypatch.setattr(*args, _coroutine)
         return _coroutine, coro_mock
     return _create_coro_patch
+
+@pytest.fixture
+def private_dbus(monkeypatch):
+    """A private dbus-daemon, configured as session bus for the test"""
+    from fake_systemd import PrivateDbus
+    dbus = PrivateDbus().start()
+    monkeypatch.setenv('DBUS_SESSION_BUS_ADDRESS', dbus.address)
+    yield dbus
+    dbus.cleanup()
+
+@pytest.fixture
+async def fake_systemd(private_dbus):
+    """Fake systemd service exported on the private session bus"""
+    from fake_systemd import FakeSystemdManager
+    from kodi_wol_listener.dbus_systemd import DbusSystemd
+    manager = await FakeSystemdManager().init(private_dbus.address)
+    yield manager
+    DbusSystemd.connections.disconnect()
+    manager.disconnect()
+
+@pytest.fixture
+async def fake_kodi():
+    """Fake Kodi JSON-RPC server on a free local port"""
+    from fake_kodi import FakeKodi
+    kodi = FakeKodi()
+    await kodi.start()
+    yield kodi
+    kodi.close()
@@ -0,0 +1,55 @@
+"""A fake cec-client for tests
+
+Emulates the interactive stdin protocol of cec-client for a TV at logical
+address 0: after a (configurable) bus scan delay it prints 'waiting for
+input', then processes the commands on, standby, as, pow and q.
+
+Usage:
+    python fake_cec_client.py [--delay SECONDS] [--fail] [--log FILE]
+--fail emulates a missing adapter, --log appends each command to FILE.
+"""
+import sys
+import time
+import argparse
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--delay', type=float, default=0.0)
+    parser.add_argument('--fail', action='store_true')
+    parser.add_argument('--log')
+    args = parser.parse_args()
+    print("opening a connection to the CEC adapter...", flush=True)
+    time.sleep(args.delay)
+    if args.fail:
+        print("ERROR:   could not open a connection (try 1)", flush=True)
+        return 1
+    print("waiting for input", flush=True)
+    power = 'standby'
+    for line in sys.stdin:
+        command = line.strip()
+        if args.log:
+            with open(args.log, 'a') as log:
+                log.write(command + '\n')
+        words = command.split()
+        if not words:
+            continue
+        if words[0] == 'q':
+            break
+        if words[0] == 'on':
+            power = 'on'
+            print(f"TRAFFIC: [ {time.monotonic():.0f}]\t>> 10:04", flush=True)
+        elif words[0] == 'standby':
+            power = 'standby'
+            print(f"TRAFFIC: [ {time.monotonic():.0f}]\t>> 10:36", flush=True)
+        elif words[0] == 'as':
+            print(f"TRAFFIC: [ {time.monotonic():.0f}]\t>> 1f:82:10:00", flush=True)
+        elif words[0] == 'pow':
+            print(f"power status: {power}", flush=True)
+        else:
+            print(f"unknown command '{command}'", flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""A fake Kodi JSON-RPC server on the raw TCP interface
+
+Emulates the small part of the Kodi JSON-RPC API used by kodi_wol_listener.
+The state (active players, screensaver, user input) is set by the test.
+
+Run as script, it is a fake kodi binary that opens the JSON-RPC port after
+a startup delay and exits once Application.Quit is called:
+    python fake_kodi.py [--port 9090] [--delay SECONDS]
+"""
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+
+class FakeKodi():
+    """Fake Kodi JSON-RPC TCP server"""
+
+    def __init__(self):
+        self.server = None
+        self.port = None
+        self.writers = set()
+        self.calls = []
+        self.players = []
+        self.screensaver = False
+        self.last_input = time.monotonic()
+        self.quit_requested = None
+        # Enabled state of the add-ons changed by Addons.SetAddonEnabled
+        self.addons = {}
+
+    async def start(self, host='127.0.0.1', port=0):
+        """Start listening, return the port"""
+        self.quit_requested = asyncio.Event()
+        self.server = await asyncio.start_server(self._client, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+
+    def close(self):
+        """Stop listening and drop all clients"""
+        for writer in list(self.writers):
+            writer.close()
+        if self.server:
+            self.server.close()
+            self.server = None
+
+    def user_input(self):
+        """Emulate a key press"""
+        self.last_input = time.monotonic()
+
+    def methods(self, name):
+        """Return the list of parameters of all calls of given method"""
+        return [params for method, params in self.calls if method == name]
+
+    def notify(self, method, params=None):
+        """Send a notification to all clients"""
+        message = {'jsonrpc': '2.0', 'method': method, 'params': params or {}}
+        for writer in self.writers:
+            writer.write(json.dumps(message).encode())
+
+    def _handle(self, method, params):
+        if method == 'JSONRPC.Ping':
+            return 'pong'
+        if method == 'Player.GetActivePlayers':
+            return [{'playerid': pid, 'type': 'video'} for pid in self.players]
+        if method == 'XBMC.GetInfoBooleans':
+            result = {}
+            idle = time.monotonic() - self.last_input
+            for name in params['booleans']:
+                match = re.match(r'System\.IdleTime\((\d+)\)', name)
+                if match:
+                    result[name] = idle >= int(match.group(1))
+                elif name == 'System.ScreenSaverActive':
+                    result[name] = self.screensaver
+                else:
+                    result[name] = False
+            return result
+        if method == 'Addons.SetAddonEnabled':
+            self.addons[params['addonid']] = params['enabled']
+            return 'OK'
+        if method == 'VideoLibrary.Scan':
+            return 'OK'
+        if method == 'Application.Quit':
+            self.quit_requested.set()
+            return 'OK'
+        raise KeyError(method)
+
+    async def _client(self, reader, writer):
+        self.writers.add(writer)
+        decoder = json.JSONDecoder()
+        buf = ''
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                buf += data.decode()
+                while buf.strip():
+                    buf = buf.lstrip()
+                    try:
+                        request, end = decoder.raw_decode(buf)
+                    except ValueError:
+                        break
+                    buf = buf[end:]
+                    method = request['method']
+                    params = request.get('params')
+                    self.calls.append((method, params))
+                    response = {'jsonrpc': '2.0', 'id': request.get('id')}
+                    try:
+                        response['result'] = self._handle(method, params)
+                    except KeyError:
+                        response['error'] = {'code': -32601, 'message': 'Method not found.'}
+                    writer.write(json.dumps(response).encode())
+        except ConnectionError:
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+
+async def run_fake_kodi(port, delay):
+    """Emulate kodi starting up, serving until asked to quit"""
+    await asyncio.sleep(delay)
+    kodi = FakeKodi()
+    await kodi.start(port=port)
+    await kodi.quit_requested.wait()
+    # Let the response to Application.Quit go out
+    await asyncio.sleep(0.01)
+    kodi.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=9090)
+    parser.add_argument('--delay', type=float, default=0.0)
+    args = parser.parse_args()
+    asyncio.run(run_fake_kodi(args.port, args.delay))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,32 @@
+"""A fake rsync daemon
+
+Names itself rsync (as shown in /proc/<pid>/comm) and forks a child named
+rsync as well, like the daemon does for a transfer. Prints the pids of both as
+a line, then sleeps until terminated.
+
+Usage:
+    python fake_rsync.py
+"""
+import os
+import sys
+import time
+import ctypes
+import signal
+
+PR_SET_NAME = 15
+
+def main():
+    ctypes.CDLL(None).prctl(PR_SET_NAME, b'rsync', 0, 0, 0)
+    child = os.fork()
+    if child == 0:
+        time.sleep(60)
+        os._exit(0)  # pylint: disable=protected-access
+    signal.signal(signal.SIGTERM, lambda *args: os.kill(child, signal.SIGTERM) or sys.exit(0))
+    print(os.getpid(), child, flush=True)
+    time.sleep(60)
+    os.kill(child, signal.SIGTERM)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
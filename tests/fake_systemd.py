@@ -0,0 +1,223 @@
+"""In-process stand-in for the systemd D-Bus service
+
+Implements the subset of org.freedesktop.systemd1 used by
+kodi_wol_listener.dbus_systemd on top of the dbus_next service API. The
+service is meant to be exported on a private dbus-daemon (see PrivateDbus),
+so tests and benchmarks run on any Linux box, with real PropertiesChanged
+signals and an adjustable artificial latency per method call.
+"""
+import os
+import asyncio
+import subprocess
+import tempfile
+import shutil
+
+from dbus_next.aio import MessageBus
+from dbus_next.service import ServiceInterface, method, dbus_property
+from dbus_next.constants import PropertyAccess
+from dbus_next.errors import DBusError
+
+
+class PrivateDbus():
+    """A dbus-daemon instance on a private unix socket
+
+    The socket path stays the same across restart(), which allows testing
+    reconnects of clients.
+    """
+    def __init__(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='fake_dbus_')
+        self.address = f'unix:path={self.tmp_dir}/bus'
+        self.proc = None
+
+    def start(self):
+        """Start the daemon, return as soon as it accepts connections"""
+        self.proc = subprocess.Popen(
+            ['dbus-daemon', '--session', '--nofork', '--print-address',
+             f'--address={self.address}'],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        # The address is printed once the socket is listening
+        self.proc.stdout.readline()
+        return self
+
+    def stop(self):
+        """Terminate the daemon"""
+        if self.proc:
+            self.proc.terminate()
+            self.proc.wait()
+            self.proc.stdout.close()
+            self.proc = None
+
+    def restart(self):
+        """Restart the daemon on the same address"""
+        self.stop()
+        if os.path.exists(f'{self.tmp_dir}/bus'):
+            os.unlink(f'{self.tmp_dir}/bus')
+        return self.start()
+
+    def cleanup(self):
+        """Stop the daemon and remove the socket directory"""
+        self.stop()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+def mangle_unit_name(name):
+    """Return the systemd object path element for a unit name"""
+    return ''.join(c if c.isalnum() else f'_{ord(c):02x}' for c in name)
+
+
+class FakeUnit(ServiceInterface):
+    """org.freedesktop.systemd1.Unit for a single unit"""
+
+    def __init__(self, manager, name, state='inactive'):
+        super().__init__('org.freedesktop.systemd1.Unit')
+        self.manager = manager
+        self.unit_name = name
+        self.path = '/org/freedesktop/systemd1/unit/' + mangle_unit_name(name)
+        self.state = state
+        # Properties set by SetUnitProperties
+        self.properties = {}
+
+    @dbus_property(access=PropertyAccess.READ)
+    def Id(self) -> 's':  # pylint: disable=invalid-name
+        return self.unit_name
+
+    @dbus_property(access=PropertyAccess.READ)
+    def ActiveState(self) -> 's':  # pylint: disable=invalid-name
+        return self.state
+
+    def set_state(self, state):
+        """Change the unit state and signal the change on the bus"""
+        if state != self.state:
+            self.state = state
+            self.emit_properties_changed({'ActiveState': state})
+
+    async def start(self):
+        """Run a start job for the unit"""
+        await self.manager.delay()
+        self.set_state('active')
+        return self.manager.new_job()
+
+    async def stop(self):
+        """Run a stop job for the unit"""
+        await self.manager.delay()
+        self.set_state('inactive')
+        return self.manager.new_job()
+
+    @method(name='Start')
+    async def _start(self, mode: 's') -> 'o':
+        return await self.start()
+
+    @method(name='Stop')
+    async def _stop(self, mode: 's') -> 'o':
+        return await self.stop()
+
+
+class FakeSystemdManager(ServiceInterface):
+    """org.freedesktop.systemd1.Manager holding a set of FakeUnit
+
+    Args:
+        latency (float) Artificial delay in seconds added to each method call
+    """
+
+    SERVICE_NAME = 'org.freedesktop.systemd1'
+    OBJECT_PATH = '/org/freedesktop/systemd1'
+
+    def __init__(self, latency=0.0):
+        super().__init__('org.freedesktop.systemd1.Manager')
+        self.latency = latency
+        self.bus = None
+        self.units = {}
+        self.enabled = set()
+        self.reload_count = 0
+        self.job_id = 0
+
+    async def init(self, bus_address):
+        """Connect to the bus at bus_address and export the service"""
+        self.bus = await MessageBus(bus_address=bus_address).connect()
+        self.bus.export(self.OBJECT_PATH, self)
+        for unit in self.units.values():
+            self.bus.export(unit.path, unit)
+        await self.bus.request_name(self.SERVICE_NAME)
+        return self
+
+    def disconnect(self):
+        """Drop the bus connection"""
+        if self.bus:
+            self.bus.disconnect()
+            self.bus = None
+
+    async def delay(self):
+        """Apply the configured latency"""
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def new_job(self):
+        """Return the object path of a new (already finished) job"""
+        self.job_id += 1
+        return f'/org/freedesktop/systemd1/job/{self.job_id}'
+
+    def add_unit(self, name, state='inactive'):
+        """Register a unit, export it if the service is connected already"""
+        if name not in self.units:
+            unit = FakeUnit(self, name, state)
+            self.units[name] = unit
+            if self.bus:
+                self.bus.export(unit.path, unit)
+        return self.units[name]
+
+    def _unit(self, name):
+        try:
+            return self.units[name]
+        except KeyError:
+            raise DBusError('org.freedesktop.systemd1.NoSuchUnit',
+                            f'Unit {name} not loaded.') from None
+
+    @method()
+    async def Reload(self):  # pylint: disable=invalid-name
+        await self.delay()
+        self.reload_count += 1
+
+    @method()
+    async def LinkUnitFiles(self, files: 'as', runtime: 'b', force: 'b') -> 'a(sss)':  # pylint: disable=invalid-name
+        await self.delay()
+        changes = []
+        for path in files:
+            name = os.path.basename(path)
+            self.add_unit(name)
+            changes.append(['symlink', '/fake/systemd/user/' + name, path])
+        return changes
+
+    @method()
+    async def EnableUnitFiles(self, files: 'as', runtime: 'b', force: 'b') -> 'ba(sss)':  # pylint: disable=invalid-name
+        await self.delay()
+        for name in files:
+            self._unit(name)
+            self.enabled.add(name)
+        return [False, []]
+
+    @method()
+    async def DisableUnitFiles(self, files: 'as', runtime: 'b') -> 'a(sss)':  # pylint: disable=invalid-name
+        await self.delay()
+        for name in files:
+            self.enabled.discard(name)
+        return []
+
+    @method()
+    async def GetUnit(self, name: 's') -> 'o':  # pylint: disable=invalid-name
+        await self.delay()
+        return self._unit(name).path
+
+    @method()
+    async def StartUnit(self, name: 's', mode: 's') -> 'o':  # pylint: disable=invalid-name
+        return await self._unit(name).start()
+
+    @method()
+    async def StopUnit(self, name: 's', mode: 's') -> 'o':  # pylint: disable=invalid-name
+        return await self._unit(name).stop()
+
+    @method()
+    async def SetUnitProperties(self, name: 's', runtime: 'b', properties: 'a(sv)'):  # pylint: disable=invalid-name
+        await self.delay()
+        unit = self._unit(name)
+        for prop, value in properties:
+            unit.properties[prop] = value.value
@@ -0,0 +1,28 @@
+"""A fake vcgencmd supporting the display_power command
+
+The display state is kept in a file, each call takes a configurable time:
+    python fake_vcgencmd.py STATE_FILE DELAY display_power [0|1]
+"""
+import sys
+import time
+
+
+def main(state_file, delay, command, state=None):
+    time.sleep(float(delay))
+    if command != 'display_power':
+        print(f"Command not registered: {command}", file=sys.stderr)
+        return 255
+    if state is not None:
+        with open(state_file, 'w') as state_out:
+            state_out.write(state)
+    try:
+        with open(state_file) as state_in:
+            state = state_in.read().strip() or '0'
+    except FileNotFoundError:
+        state = '0'
+    print(f"display_power={state}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*sys.argv[1:]))
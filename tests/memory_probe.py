@@ -0,0 +1,121 @@
+"""Measure the memory footprint of the listener
+
+Starts the listener like the command line does (as if running under
+systemd), then reports the memory usage after startup and after a number of
+wake cycles. A wake cycle is a WOL packet that starts a fake kodi, which exits
+immediately. Each report is a JSON line on stdout:
+    {"phase": "startup", "rss": ..., "uss": ..., "traced": ..., "top": [...],
+     "modules": [...]}
+rss/uss are in bytes, traced and top (tracemalloc) only with --tracemalloc.
+top lists the top allocators, after startup the top growing ones.
+
+Usage:
+    python memory_probe.py <work dir> [--cycles 1000] [--tracemalloc]
+"""
+import os
+import sys
+import json
+import argparse
+import tracemalloc
+
+# Modules the listener shall not load in the steady state
+AVOIDED_MODULES = ('coloredlogs', 'dbus_next', 'getmac')
+
+
+def memory_usage():
+    """Return (RSS, USS) of this process in bytes"""
+    fields = {}
+    with open('/proc/self/smaps_rollup') as smaps:
+        for line in smaps:
+            name, _, value = line.partition(':')
+            if value.strip().endswith('kB'):
+                fields[name] = int(value.split()[0]) * 1024
+    return fields['Rss'], fields['Private_Clean'] + fields['Private_Dirty']
+
+
+# The snapshot of the first report, later reports show the growth since
+_first_snapshot = None
+
+def report(phase):
+    """Print the memory usage as JSON line"""
+    global _first_snapshot  # pylint: disable=global-statement
+    rss, uss = memory_usage()
+    result = {'phase': phase, 'rss': rss, 'uss': uss,
+              'modules': sorted(name for name in sys.modules
+                                if name.partition('.')[0] in AVOIDED_MODULES)}
+    if tracemalloc.is_tracing():
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)])
+        # Not get_traced_memory(), that includes the snapshots themselves
+        result['traced'] = sum(stat.size for stat in snapshot.statistics('filename'))
+        if _first_snapshot is None:
+            _first_snapshot = snapshot
+            stats = snapshot.statistics('lineno')
+        else:
+            stats = snapshot.compare_to(_first_snapshot, 'lineno')
+        result['top'] = [str(stat) for stat in stats[:10]]
+    print(json.dumps(result), flush=True)
+
+
+def write_fakes(work_dir):
+    """Write the configuration and a fake vcgencmd, return the config path"""
+    vcgencmd = os.path.join(work_dir, 'vcgencmd')
+    with open(vcgencmd, 'w') as script:
+        script.write('#!/bin/sh\necho display_power=1\n')
+    os.chmod(vcgencmd, 0o755)
+    config = os.path.join(work_dir, 'kodi_wol_listener.conf')
+    with open(config, 'w') as config_file:
+        config_file.write(f"[listener]\nport = 0\ninterface = lo\n"
+                          f"[kodi]\ncommand = true\n"
+                          f"[hdmi]\nvcgencmd = {vcgencmd}\n")
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('work_dir')
+    parser.add_argument('--cycles', type=int, default=1000)
+    parser.add_argument('--tracemalloc', action='store_true')
+    args = parser.parse_args()
+    if args.tracemalloc:
+        tracemalloc.start()
+    config = write_fakes(args.work_dir)
+    os.environ['XDG_DATA_HOME'] = args.work_dir
+    # Pretend running under systemd, stderr is the journal stream
+    stat = os.fstat(2)
+    os.environ['JOURNAL_STREAM'] = f'{stat.st_dev}:{stat.st_ino}'
+
+    import socket
+    import asyncio
+    from kodi_wol_listener.wol_listener_subproc import KodiManager
+
+    class ProbedManager(KodiManager):
+        """Runs the wake cycles while the application is running"""
+        async def main(self, port):
+            loop = asyncio.get_running_loop()
+            app = loop.create_task(super().main(port))
+            while self.exit_future is None:
+                await asyncio.sleep(0.01)
+            report('startup')
+            kodi_done = asyncio.Event()
+            def state_changed(status):
+                if not status['kodi_running']:
+                    kodi_done.set()
+            self.add_state_listener(state_changed)
+            address = ('127.0.0.1', self.wol_receiver.transport.get_extra_info('sockname')[1])
+            packet = b'\xff' * 6 + self.wol_receiver.mymac_bytes * 16
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                for _ in range(args.cycles):
+                    kodi_done.clear()
+                    sock.sendto(packet, address)
+                    await asyncio.wait_for(kodi_done.wait(), 5)
+            report('cycles')
+            self.exit_future.set_result('SIGTERM')
+            await app
+
+    sys.argv = ['kodi_wol_listener', '--config', config, '--control-socket', '']
+    ProbedManager().run()
+
+
+if __name__ == '__main__':
+    main()
@@ -21,3 +21,16 @@ async def test_exec_bad():
         await python.run_wait(b"-c \"" + prog + b"\"")
     python = AsyncSubprocess(bytes(sys.executable, 'ASCII'), abort_on_fail=False)
     await python.run_wait(b"-c \"" + prog + b"\"")
+
+@pytest.mark.asyncio
+async def test_terminate_session():
+    from kodi_wol_listener.async_subprocess import AsyncSubprocess
+    import asyncio
+    # The shell does not exec the command, it outlives a terminated shell
+    sleep = AsyncSubprocess(b'sleep 30; true', abort_on_fail=False, new_session=True)
+    await sleep.run()
+    await asyncio.sleep(0.1)
+    sleep.terminate()
+    returncode, _, _ = await asyncio.wait_for(sleep.wait_completed(), 2)
+    assert returncode == -15
+    sleep.terminate()
@@ -0,0 +1,38 @@
+import os
+import time
+from benchmark import Timings
+
+CHANNELS_CONF = os.path.join(os.path.dirname(__file__), '..', 'vdr_system_konfig', 'channels.conf')
+
+# Limit for the median, far above the typical figure of a PC. A Raspberry Pi
+# takes about five times as long.
+RUNS = 20
+MEDIAN_LIMIT = 0.1
+
+def test_parse():
+    from kodi_wol_listener.channels import Channels
+    timings = Timings('Channels.load')
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        Channels.load(CHANNELS_CONF)
+        timings.add(time.perf_counter() - start)
+    timings.report()
+    assert timings.median < MEDIAN_LIMIT
+
+def test_diff_merge():
+    import random
+    from kodi_wol_listener.channels import Channels, diff, merge
+    ours = Channels.load(CHANNELS_CONF)
+    lines = list(ours.lines)
+    random.Random(1).shuffle(lines)
+    scan = Channels(lines)
+    timings = Timings('diff and merge')
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        changes = diff(ours, scan)
+        merged = merge(ours, scan)
+        timings.add(time.perf_counter() - start)
+    timings.report()
+    assert not (changes.added or changes.removed or changes.retuned or changes.renamed)
+    assert merged.text() == ours.text()
+    assert timings.median < MEDIAN_LIMIT
@@ -0,0 +1,65 @@
+import os
+import pytest
+from benchmark import Timings
+
+pytestmark = pytest.mark.skipif(not os.path.exists('/usr/bin/dbus-daemon'),
+                                reason='dbus-daemon required')
+
+# Runs per benchmark and the limit for the median at zero fake latency.
+# The limits are far above typical figures, they only catch regressions
+# like additional round trips or reconnects per operation.
+RUNS = 50
+MEDIAN_LIMIT = 0.05
+
+@pytest.fixture
+async def systemd(fake_systemd):
+    from kodi_wol_listener.dbus_systemd import DbusSystemd
+    fake_systemd.add_unit('bench.service')
+    return await DbusSystemd().init()
+
+@pytest.mark.asyncio
+async def test_unit_init(systemd):
+    from kodi_wol_listener.dbus_systemd import SystemdUnit
+    timings = Timings('SystemdUnit.init')
+    for _ in range(RUNS):
+        await timings.measure(SystemdUnit('bench.service').init, systemd)
+    timings.report()
+    assert timings.median < MEDIAN_LIMIT
+
+@pytest.mark.parametrize('latency', [0, 0.005])
+@pytest.mark.asyncio
+async def test_start_stop_round_trip(fake_systemd, systemd, latency):
+    import asyncio
+    from kodi_wol_listener.dbus_systemd import SystemdUnit
+    fake_systemd.latency = latency
+    states = asyncio.Queue()
+    unit = await SystemdUnit('bench.service', states.put_nowait).init(systemd)
+    timings = Timings(f'SystemdUnit start/stop latency={latency}')
+
+    async def round_trip():
+        # A round trip ends as the state change signal has been received
+        unit.start()
+        await unit.wait_for_job()
+        assert await asyncio.wait_for(states.get(), 1) == 'active'
+        unit.stop()
+        await unit.wait_for_job()
+        assert await asyncio.wait_for(states.get(), 1) == 'inactive'
+
+    for _ in range(RUNS):
+        await timings.measure(round_trip)
+    timings.report()
+    assert timings.median >= 2 * latency
+    assert timings.median < MEDIAN_LIMIT + 2 * latency
+
+@pytest.mark.asyncio
+async def test_install(mocker, fake_systemd):
+    from kodi_wol_listener.wol_listener_subproc import KodiManager
+    mocker.patch('kodi_wol_listener.wol_listener_subproc.WolReceiver')
+    app = KodiManager()
+    timings = Timings('KodiManager.install')
+    for _ in range(RUNS):
+        await timings.measure(app.install)
+    timings.report()
+    assert fake_systemd.units[KodiManager.SYSTEMD_SERVICE].state == 'active'
+    assert KodiManager.SYSTEMD_SERVICE in fake_systemd.enabled
+    assert timings.median < MEDIAN_LIMIT
@@ -0,0 +1,30 @@
+import time
+from benchmark import Timings
+
+# Half a year of heavy use: 5 sessions a day, 15 further wakes a day. The median limit is
+# far above the typical figure of a PC, a Raspberry Pi takes about five times
+# as long.
+DAYS = 183
+RUNS = 5
+MEDIAN_LIMIT = 0.1
+
+def test_analyze(tmp_path):
+    from kodi_wol_listener.wake_journal import WakeJournal, analyze
+    journal = WakeJournal(str(tmp_path / 'journal.bin'), max_bytes=1 << 30)
+    start = time.time() - DAYS * 86400
+    for day in range(DAYS):
+        for session in range(5):
+            journal.add_wake(start + day * 86400 + session * 2400, '10.0.0.2', 'started')
+            journal.add_session(start + day * 86400 + session * 2400, '10.0.0.2', 0, 1800.0,
+                                duplicates=3, ready=3.0 + session)
+    journal.close()
+    timings = Timings('WakeJournal analyze')
+    for _ in range(RUNS):
+        begin = time.perf_counter()
+        result = analyze(journal.records())
+        timings.add(time.perf_counter() - begin)
+    timings.report()
+    assert result['wakes'] == DAYS * 5
+    assert result['duplicates'] == DAYS * 15
+    assert result['sessions'] == DAYS * 5
+    assert timings.median < MEDIAN_LIMIT
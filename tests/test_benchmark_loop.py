@@ -0,0 +1,141 @@
+"""Compare the asyncio and uvloop event loops on the hot paths of the listener
+
+Each benchmark runs on its own loop created by event_loop.new_event_loop().
+The uvloop runs are skipped if uvloop is not installed. Use pytest -s to see
+the figures of both loops side by side.
+"""
+import os
+import time
+import socket
+import asyncio
+import pytest
+from benchmark import Timings
+from kodi_wol_listener.event_loop import EventLoop, new_event_loop, install_event_loop
+
+try:
+    import uvloop  # pylint: disable=unused-import
+    HAVE_UVLOOP = True
+except ImportError:
+    HAVE_UVLOOP = False
+
+LOOPS = [EventLoop.ASYNCIO,
+         pytest.param(EventLoop.UVLOOP,
+                      marks=pytest.mark.skipif(not HAVE_UVLOOP, reason='uvloop not installed'))]
+
+# Sizes and limits of the benchmarks. The limits are far from typical figures,
+# they only catch gross regressions.
+PACKETS = 5000
+PACKET_BATCH = 50
+MIN_PACKET_RATE = 1000
+SPAWNS = 50
+SPAWN_MEDIAN_LIMIT = 0.1
+ROUND_TRIPS = 200
+ROUND_TRIP_MEDIAN_LIMIT = 0.01
+
+
+def run_on(loop_type, coro_fn):
+    """Run coro_fn() on a new loop of the given type, return its result"""
+    loop, actual = new_event_loop(loop_type)
+    assert actual == loop_type
+    try:
+        return loop.run_until_complete(coro_fn())
+    finally:
+        loop.close()
+
+
+@pytest.mark.parametrize('loop_type', LOOPS)
+def test_new_event_loop(loop_type):
+    async def loop_class():
+        return type(asyncio.get_running_loop()).__module__
+    module = run_on(loop_type, loop_class)
+    assert module.startswith(loop_type.value)
+
+def test_fallback(monkeypatch):
+    import sys
+    monkeypatch.setitem(sys.modules, 'uvloop', None)
+    loop, actual = new_event_loop(EventLoop.UVLOOP)
+    loop.close()
+    assert actual == EventLoop.ASYNCIO
+    assert install_event_loop(EventLoop.UVLOOP) == EventLoop.ASYNCIO
+
+@pytest.mark.parametrize('loop_type', LOOPS)
+def test_install_event_loop(loop_type):
+    async def loop_class():
+        return type(asyncio.get_running_loop()).__module__
+    try:
+        assert install_event_loop(loop_type) == loop_type
+        assert asyncio.run(loop_class()).startswith(loop_type.value)
+    finally:
+        asyncio.set_event_loop_policy(None)
+
+@pytest.mark.parametrize('loop_type', LOOPS)
+def test_udp_receive(loop_type):
+    from kodi_wol_listener.wol_receiver import WolReceiver
+
+    async def receive():
+        received = 0
+        batch_done = asyncio.Event()
+        def wol_callback(_addr):
+            nonlocal received
+            received += 1
+            if received % PACKET_BATCH == 0:
+                batch_done.set()
+        receiver = WolReceiver(wol_callback)
+        port = await receiver.init()
+        packet = b'\xff' * 6 + receiver.mymac_bytes * 16
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            start = time.perf_counter()
+            # Send in batches, so the socket buffer does not overflow
+            for _ in range(PACKETS // PACKET_BATCH):
+                batch_done.clear()
+                for _ in range(PACKET_BATCH):
+                    sock.sendto(packet, ('127.0.0.1', port))
+                await asyncio.wait_for(batch_done.wait(), 5)
+            elapsed = time.perf_counter() - start
+        receiver.transport.close()
+        return received / elapsed
+
+    rate = run_on(loop_type, receive)
+    print(f"WolReceiver {loop_type.value}: {rate:.0f} packets/s")
+    assert rate > MIN_PACKET_RATE
+
+@pytest.mark.parametrize('loop_type', LOOPS)
+def test_subprocess_spawn(loop_type):
+    from kodi_wol_listener.async_subprocess import AsyncSubprocess
+
+    async def spawn():
+        timings = Timings(f'AsyncSubprocess spawn/reap {loop_type.value}')
+        proc = AsyncSubprocess(b'true')
+        for _ in range(SPAWNS):
+            assert (await timings.measure(proc.run_wait))[0] == 0
+        return timings
+
+    timings = run_on(loop_type, spawn)
+    timings.report()
+    assert timings.median < SPAWN_MEDIAN_LIMIT
+
+@pytest.mark.skipif(not os.path.exists('/usr/bin/dbus-daemon'), reason='dbus-daemon required')
+@pytest.mark.parametrize('loop_type', LOOPS)
+def test_dbus_round_trip(private_dbus, loop_type):
+    from fake_systemd import FakeSystemdManager
+    from kodi_wol_listener.dbus_systemd import DbusSystemd, SystemdUnit
+
+    async def round_trips():
+        fake = await FakeSystemdManager().init(private_dbus.address)
+        fake.add_unit('bench.service')
+        try:
+            systemd = await DbusSystemd().init()
+            unit = await SystemdUnit('bench.service').init(systemd)
+            timings = Timings(f'D-Bus property round trip {loop_type.value}')
+            for _ in range(ROUND_TRIPS):
+                await timings.measure(unit.properties_if.call_get,
+                                      SystemdUnit.DBUS_INTERFACE_UNIT, 'ActiveState')
+            unit.close()
+            return timings
+        finally:
+            DbusSystemd.connections.disconnect()
+            fake.disconnect()
+
+    timings = run_on(loop_type, round_trips)
+    timings.report()
+    assert timings.median < ROUND_TRIP_MEDIAN_LIMIT
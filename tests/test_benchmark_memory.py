@@ -0,0 +1,51 @@
+"""Memory footprint of the listener, see memory_probe.py
+
+The thresholds are generous for a 64 bit desktop python, they catch
+regressions like dependencies loaded again in the steady state or memory
+growing per wake.
+"""
+import os
+import sys
+import json
+import subprocess
+import pytest
+
+pytestmark = pytest.mark.skipif(not os.path.exists('/proc/self/smaps_rollup'),
+                                reason='/proc/self/smaps_rollup required')
+
+CYCLES = 1000
+# Limits in bytes
+STARTUP_RSS_LIMIT = 32 << 20
+RSS_GROWTH_LIMIT = 1 << 20
+TRACED_GROWTH_LIMIT = 256 << 10
+
+def probe(work_dir, *args):
+    """Run the memory probe, return its reports by phase"""
+    package_dir = os.path.join(os.path.dirname(__file__), '..')
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(package_dir))
+    result = subprocess.run(
+        [sys.executable, os.path.join(os.path.dirname(__file__), 'memory_probe.py'),
+         str(work_dir), '--cycles', str(CYCLES)] + list(args),
+        stdout=subprocess.PIPE, env=env, check=True, timeout=120)
+    reports = {}
+    for line in result.stdout.decode().splitlines():
+        report = json.loads(line)
+        reports[report['phase']] = report
+        print(f"{report['phase']}: RSS {report['rss'] / 2**20:.1f}MiB "
+              f"USS {report['uss'] / 2**20:.1f}MiB")
+        for stat in report.get('top', ()):
+            print('   ', stat)
+    return reports['startup'], reports['cycles']
+
+def test_rss(tmp_path):
+    startup, cycles = probe(tmp_path)
+    assert not startup['modules']
+    assert not cycles['modules']
+    assert startup['rss'] < STARTUP_RSS_LIMIT
+    assert cycles['rss'] - startup['rss'] < RSS_GROWTH_LIMIT
+
+def test_tracemalloc(tmp_path):
+    startup, cycles = probe(tmp_path, '--tracemalloc')
+    print(f"traced: startup {startup['traced'] >> 10}KiB, "
+          f"after {CYCLES} wakes {cycles['traced'] >> 10}KiB")
+    assert cycles['traced'] - startup['traced'] < TRACED_GROWTH_LIMIT
@@ -0,0 +1,29 @@
+"""End-to-end wake pipeline benchmark, see wake_pipeline.py"""
+import pytest
+
+CYCLES = 5
+KODI_DELAY = 0.2
+VCGENCMD_DELAY = 0.02
+# Allowed overhead on top of the fake delays (process startup included)
+OVERHEAD_LIMIT = 1.0
+
+@pytest.fixture
+async def pipeline(tmp_path):
+    from wake_pipeline import WakePipeline
+    pipeline = await WakePipeline(str(tmp_path), KODI_DELAY, VCGENCMD_DELAY).start()
+    yield pipeline
+    await pipeline.stop()
+
+@pytest.mark.parametrize('duplicates', [1, 4])
+@pytest.mark.asyncio
+async def test_wake_cycles(pipeline, duplicates):
+    launches = await pipeline.run(CYCLES, duplicates)
+    pipeline.wake_timings.report()
+    pipeline.quit_timings.report()
+    # Duplicate wakes do not start another kodi
+    assert launches == {'started': CYCLES, 'duplicate': CYCLES * (duplicates - 1)}
+    # HDMI query and enable happen before kodi is started
+    minimum = KODI_DELAY + 2 * VCGENCMD_DELAY
+    assert min(pipeline.wake_timings.samples) >= minimum
+    assert pipeline.wake_timings.median < minimum + OVERHEAD_LIMIT
+    assert pipeline.quit_timings.median < OVERHEAD_LIMIT
@@ -0,0 +1,24 @@
+import socket
+
+# Limit far below the typical figure of a PC (above 100000 packets/s), a
+# Raspberry Pi achieves about a fifth of it
+PACKETS = 20000
+RATE_LIMIT = 10000
+
+def test_send_rate():
+    from kodi_wol_listener.wol_sender import WolSender, magic_packet
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    macs = [f'b8:27:eb:00:{index // 256:02x}:{index % 256:02x}' for index in range(1000)]
+    sender = WolSender()
+    try:
+        result = sender.send([magic_packet(mac) for mac in macs],
+                             [(socket.AF_INET, receiver.getsockname())],
+                             repeat=PACKETS // len(macs))
+    finally:
+        sender.close()
+        receiver.close()
+    rate = result.sent / result.seconds
+    print(f"WolSender: {result.sent} packets in {result.seconds:.3f}s, {rate:.0f} packets/s")
+    assert result.sent == PACKETS
+    assert rate > RATE_LIMIT
@@ -0,0 +1,178 @@
+import os
+import pytest
+
+CHANNELS_CONF = os.path.join(os.path.dirname(__file__), '..', 'vdr_system_konfig', 'channels.conf')
+
+SAMPLE = (
+    ':@1 Public\n'
+    'Das Erste;ARD:11836:HC34M2S0:S19.2E:27500:101=2:102=deu@3:104:0:28106:1:1101:0\n'
+    'SWR Fernsehen BW;ARD:11836:HC34M2S0:S19.2E:27500:801=2:802=deu@3:804:0:28113:1:1101:0\n'
+    'ZDF HD;ZDFvision:11361:HC23M5O35P0S1:S19.2E:22000:6110=27:6120=deu@3:6130:0:11110:1:1011:0\n'
+    '\n'
+    ':Private\n'
+    'RTL Television,RTL;CBC:12187:VC34M2S0:S19.2E:27500:163=2:104=deu@3:105:0:12003:1:1089:0\n'
+    'Sky 22|45:11758:HC34M2S0:S19.2E:27500:5119=27:5120=deu@3:0:9C4,98C:331:133:17:0')
+
+def test_round_trip(tmp_path):
+    from kodi_wol_listener.channels import Channels
+
+    channels = Channels.load(CHANNELS_CONF)
+    assert len(channels.channel_rows()) == 2230
+    path = tmp_path / 'channels.conf'
+    channels.save(str(path))
+    with open(CHANNELS_CONF, 'rb') as original:
+        assert path.read_bytes() == original.read()
+    # CR/LF line breaks and a missing final line break are kept
+    sample = SAMPLE.replace('\n', '\r\n')
+    assert Channels(sample.splitlines(keepends=True)).text() == sample
+
+def test_parse():
+    from kodi_wol_listener.channels import Channels, GROUP, BLANK
+
+    channels = Channels(SAMPLE.splitlines(keepends=True))
+    assert len(channels) == 8
+    assert channels.kinds[0] == GROUP and channels.names[0] == 'Public'
+    assert channels.kinds[4] == BLANK
+    assert channels.names[7] == 'Sky 22:45'
+    rtl = channels.channel(6)
+    assert (rtl.name, rtl.short_name, rtl.provider) == ('RTL Television', 'RTL', 'CBC')
+    assert (rtl.frequency, rtl.srate, rtl.sid, rtl.nid, rtl.tid, rtl.rid) == (12187, 27500, 12003, 1, 1089, 0)
+    assert rtl.apid == '104=deu@3'
+    assert channels.channel(7).provider == ''
+    # Repeating strings are stored once
+    assert channels.strings.count('S19.2E') == 1
+    assert channels.providers[1] == channels.providers[2]
+    with pytest.raises(ValueError):
+        channels.channel(0)
+
+def test_indexes():
+    from kodi_wol_listener.channels import Channels
+
+    channels = Channels(SAMPLE.splitlines(keepends=True))
+    assert channels.find('RTL') == channels.find('RTL Television') == [6]
+    assert channels.find('missing') == []
+    assert channels.on_transponder('S19.2E', 11836, 'H') == [1, 2]
+    assert channels.on_transponder('S19.2E', 12187, 'H') == []
+    assert channels.transponder(6) == ('S19.2E', 12187, 'V')
+    assert channels.service(1, 1011, 11110) == [3]
+    assert list(channels.transponders()) == [('S19.2E', 11836, 'H'), ('S19.2E', 11361, 'H'),
+                                             ('S19.2E', 12187, 'V'), ('S19.2E', 11758, 'H')]
+    assert channels.groups() == [('Public', [1, 2, 3]), ('Private', [6, 7])]
+
+def test_invalid():
+    from kodi_wol_listener.channels import Channels
+
+    with pytest.raises(ValueError, match='line 2'):
+        Channels([':Group\n', 'Das Erste;ARD:11836:HC34M2S0:S19.2E\n'])
+    with pytest.raises(ValueError, match='line 1'):
+        Channels(['Das Erste;ARD:x:HC34M2S0:S19.2E:27500:101=2:102=deu@3:104:0:28106:1:1101:0\n'])
+    # Numbers not fitting the table
+    for numbers in ('70000:1:1101', '28106:1:-1'):
+        with pytest.raises(ValueError, match='line 1'):
+            Channels([f'Das Erste;ARD:11836:HC34M2S0:S19.2E:27500:101=2:102=deu@3:104:0:{numbers}:0\n'])
+    with pytest.raises(ValueError, match='line 1'):
+        Channels(['Das Erste;ARD:-1:HC34M2S0:S19.2E:27500:101=2:102=deu@3:104:0:28106:1:1101:0\n'])
+
+def test_numbers():
+    from kodi_wol_listener.channels import Channels
+
+    channels = Channels(SAMPLE.replace(':Private', ':@10 Private').splitlines(keepends=True))
+    assert channels.numbers() == {1: 1, 2: 2, 3: 3, 10: 6, 11: 7}
+    channels = Channels(SAMPLE.replace(':Private', ':@x Private').splitlines(keepends=True))
+    with pytest.raises(ValueError, match='line 6'):
+        channels.numbers()
+
+ZAPPING = (
+    'A:11836:H:S19.2E:27500:0:0:0:0:1:1:1:0\n'
+    'B:11361:H:S19.2E:27500:0:0:0:0:2:1:2:0\n'
+    'C:11836:H:S19.2E:27500:0:0:0:0:3:1:1:0\n'
+    'D:11361:H:S19.2E:27500:0:0:0:0:4:1:2:0\n'
+    'E:11836:V:S19.2E:27500:0:0:0:0:5:1:3:0\n'
+    ':Group\n'
+    'F:11361:H:S19.2E:27500:0:0:0:0:6:1:2:0\n'
+    'G:11836:H:S19.2E:27500:0:0:0:0:7:1:1:0\n'
+    'H:11361:H:S19.2E:27500:0:0:0:0:8:1:2:0\n')
+
+def test_transponder_order():
+    from kodi_wol_listener.channels import Channels, transponder_order, zap_retunes
+
+    channels = Channels(ZAPPING.splitlines(keepends=True))
+    order = transponder_order(channels)
+    result = channels.reordered(order)
+    assert ''.join(result.names) == 'ACBDEGroupFHG'
+    # Deterministic and stable
+    assert transponder_order(result) == list(range(len(result)))
+    assert zap_retunes(channels) == 7
+    assert zap_retunes(result) == 4
+    assert zap_retunes(channels, [1, 3, 2, 4]) == 1
+    assert zap_retunes(result, [1, 2, 3, 4]) == 1
+    # Pinned channels keep their position
+    order = transponder_order(channels, pinned=set(channels.find('B')))
+    assert ''.join(channels.reordered(order).names) == 'ABCDEGroupFHG'
+
+def test_reorder(tmp_path, capsys):
+    from kodi_wol_listener.channels import Channels, reorder
+
+    path = tmp_path / 'channels.conf'
+    path.write_text(ZAPPING)
+    zap_log = tmp_path / 'zap.log'
+    zap_log.write_text('1\n2\n3\n\n4\n')
+    output = tmp_path / 'output.conf'
+    reorder(str(path), str(output), pin=['E'], pin_group=['Group'], zap_log=str(zap_log))
+    assert capsys.readouterr().out == 'Retunes of the zapping log: 3 before, 1 after\n'
+    assert ''.join(Channels.load(str(output)).names) == 'ACBDEGroupFGH'
+
+OURS = (
+    ':Favourites\n'
+    'My ZDF;ZDFvision:11953:HC34M2S0:S19.2E:27500:110=2:120=deu@3:130:0:28006:1:1079:0\n'
+    'Das Erste;ARD:11836:HC34M2S0:S19.2E:27500:101=2:102=deu@3:104:0:28106:1:1101:0\n'
+    'Gone;ARD:10743:HC56M2S0:S19.2E:22000:301=2:302=deu@3:0:0:28723:1:1051:0\n'
+    'RTL;CBC:12187:HC34M2S0:S19.2E:27500:163=2:104=deu@3:105:0:12003:1:1089:0\n')
+SCAN = (
+    'RTL Television,RTL;CBC:12187:HC34M2S0:S19.2E:27500:163=2:104=deu@3:105:0:12003:1:1089:0\n'
+    'New;ARD:10743:HC56M2S0:S19.2E:22000:501=2:502=deu@3:504:0:28725:1:1051:0\n'
+    'Das Erste;ARD:11836:HC34M2S0:S19.2E:27500:101=2:102=deu@3:104:0:28106:1:1101:0\n'
+    'ZDF;ZDFvision:11953:HC34M5S1:S19.2E:27500:110=2:120=deu@3:130:0:28006:1:1079:0\n')
+
+def test_diff():
+    from kodi_wol_listener.channels import Channels, diff
+
+    ours = Channels(OURS.splitlines(keepends=True))
+    scan = Channels(SCAN.splitlines(keepends=True))
+    changes = diff(ours, scan)
+    assert changes.added == [1]
+    assert changes.removed == [3]
+    assert changes.retuned == [(1, 3)]
+    assert changes.renamed == [(1, 3), (4, 0)]
+
+def test_merge():
+    from kodi_wol_listener.channels import Channels, merge
+
+    ours = Channels(OURS.splitlines(keepends=True))
+    scan = Channels(SCAN.splitlines(keepends=True))
+    merged = merge(ours, scan, new_group='New channels')
+    assert merged.text() == (
+        ':Favourites\n'
+        'My ZDF;ZDFvision:11953:HC34M5S1:S19.2E:27500:110=2:120=deu@3:130:0:28006:1:1079:0\n'
+        'Das Erste;ARD:11836:HC34M2S0:S19.2E:27500:101=2:102=deu@3:104:0:28106:1:1101:0\n'
+        'RTL;CBC:12187:HC34M2S0:S19.2E:27500:163=2:104=deu@3:105:0:12003:1:1089:0\n'
+        ':New channels\n'
+        'New;ARD:10743:HC56M2S0:S19.2E:22000:501=2:502=deu@3:504:0:28725:1:1051:0\n')
+    merged = merge(ours, scan, keep_removed=True)
+    assert [name for name in merged.names] == ['Favourites', 'My ZDF', 'Das Erste', 'Gone', 'RTL', 'New']
+    # Merging the scan again changes nothing
+    assert merge(merged, scan, keep_removed=True).text() == merged.text()
+
+def test_diff_command(tmp_path, capsys):
+    from kodi_wol_listener.channels import diff_command, merge_command
+
+    ours = tmp_path / 'channels.conf'
+    ours.write_text(OURS)
+    scan = tmp_path / 'scan.conf'
+    scan.write_text(SCAN)
+    diff_command(str(ours), str(scan))
+    assert capsys.readouterr().out.splitlines()[-1] == '1 added, 1 removed, 1 retuned, 2 renamed'
+    merge_command(str(ours), str(scan), str(tmp_path / 'merged.conf'), False, None)
+    merged = tmp_path / 'merged.conf'
+    diff_command(str(merged), str(scan))
+    assert capsys.readouterr().out.splitlines()[-1] == '0 added, 0 removed, 0 retuned, 2 renamed'
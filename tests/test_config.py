@@ -0,0 +1,57 @@
+import pytest
+
+@pytest.fixture
+def config_path(tmp_path):
+    return str(tmp_path / 'kodi_wol_listener.conf')
+
+def write(path, text):
+    with open(path, 'w') as config_file:
+        config_file.write(text)
+
+def test_defaults(config_path):
+    from kodi_wol_listener.config import Config
+    config = Config.load(config_path)
+    assert config['listener', 'port'] == 42429
+    assert config['listener', 'interface'] == 'eth0'
+    assert config['kodi', 'command'] == '/usr/bin/kodi'
+    assert not config.diff(Config())
+
+def test_load(config_path):
+    from kodi_wol_listener.config import Config
+    write(config_path, "[listener]\nport = 4000\ninterface = wlan0\n"
+                       "[prewake]\nthreshold = 0.25\nbackend_mac = 00:11:22:33:44:55\n")
+    config = Config.load(config_path, {('listener', 'interface'): 'eth1'})
+    assert config['listener', 'port'] == 4000
+    assert config['listener', 'interface'] == 'eth1'
+    assert config['prewake', 'threshold'] == 0.25
+    assert config['prewake', 'backend_mac'] == '00:11:22:33:44:55'
+    assert config.diff(Config()) == {('listener', 'port'), ('listener', 'interface'),
+                                     ('prewake', 'threshold'), ('prewake', 'backend_mac')}
+
+def test_choices(config_path):
+    from kodi_wol_listener.config import Config
+    write(config_path, "[listener]\ndebug_level = INFO\n[kodi]\nidle_action = Standby\n"
+                       "[hotplug]\nprelaunch = yes\n")
+    config = Config.load(config_path)
+    assert config['listener', 'debug_level'] == 'info'
+    assert config['kodi', 'idle_action'] == 'standby'
+    assert config['hotplug', 'prelaunch'] is True
+    write(config_path, "[hotplug]\nprelaunch = off\n")
+    assert Config.load(config_path)['hotplug', 'prelaunch'] is False
+    write(config_path, "[journal]\npath =\nmax_bytes = 4800\n")
+    assert Config.load(config_path)['journal', 'path'] == ''
+    assert Config.load(config_path)['journal', 'max_bytes'] == 4800
+
+@pytest.mark.parametrize('text, error', [
+    ("[listener]\nport = none\n", 'Invalid value'),
+    ("[listener]\nfoo = 1\n", 'Unknown setting'),
+    ("[foo]\nport = 1\n", 'Unknown setting'),
+    ("[listener]\ndebug_level = verbose\n", 'expected one of'),
+    ("[kodi]\nidle_action = sleep\n", 'expected one of'),
+    ("[hotplug]\nprelaunch = maybe\n", 'Invalid value'),
+    ("port = 1\n", 'Invalid configuration file')])
+def test_invalid(config_path, text, error):
+    from kodi_wol_listener.config import Config
+    write(config_path, text)
+    with pytest.raises(ValueError, match=error):
+        Config.load(config_path)
@@ -0,0 +1,131 @@
+import json
+import pytest
+
+class FakeManager():
+    def __init__(self):
+        self.kodi_running = False
+        self.state_listeners = []
+
+    def status(self):
+        return {'kodi_running': self.kodi_running}
+
+    def kodi_start(self, addr):
+        assert addr == ('unix', 0)
+        self.set_running(True)
+
+    async def kodi_stop(self):
+        self.set_running(False)
+
+    def set_running(self, running):
+        self.kodi_running = running
+        for listener in list(self.state_listeners):
+            listener(self.status())
+
+    def add_state_listener(self, listener):
+        self.state_listeners.append(listener)
+
+    def remove_state_listener(self, listener):
+        self.state_listeners.remove(listener)
+
+@pytest.fixture
+async def control(tmp_path):
+    from kodi_wol_listener.control_socket import ControlServer
+    manager = FakeManager()
+    server = await ControlServer(manager).init(str(tmp_path / 'run' / 'control.sock'))
+    yield manager, server
+    server.close()
+
+async def request(reader, writer, command):
+    writer.write(command + b'\n')
+    return json.loads(await reader.readline())
+
+@pytest.mark.asyncio
+async def test_commands(control):
+    import os
+    import asyncio
+    manager, server = control
+    assert oct(os.stat(server.path).st_mode & 0o777) == '0o600'
+    reader, writer = await asyncio.open_unix_connection(server.path)
+    assert await request(reader, writer, b'status') == {'kodi_running': False}
+    assert await request(reader, writer, b'START') == {'kodi_running': True}
+    assert await request(reader, writer, b'stop') == {'kodi_running': False}
+    assert 'error' in await request(reader, writer, b'reboot')
+    writer.close()
+
+@pytest.mark.asyncio
+async def test_subscribe(control):
+    import asyncio
+    manager, server = control
+    reader, writer = await asyncio.open_unix_connection(server.path)
+    assert await request(reader, writer, b'subscribe') == {'kodi_running': False}
+    manager.set_running(True)
+    manager.set_running(False)
+    assert json.loads(await reader.readline()) == {'kodi_running': True}
+    assert json.loads(await reader.readline()) == {'kodi_running': False}
+    writer.close()
+    await asyncio.sleep(0.05)
+    assert not manager.state_listeners
+
+@pytest.mark.asyncio
+async def test_slow_subscriber(control):
+    import asyncio
+    manager, server = control
+    reader, writer = await asyncio.open_unix_connection(server.path)
+    assert await request(reader, writer, b'subscribe') == {'kodi_running': False}
+    manager.status = lambda: {'kodi_running': manager.kodi_running, 'padding': 'x' * 10000}
+    # The client does not read, it is dropped instead of buffering forever
+    for _ in range(500):
+        manager.set_running(not manager.kodi_running)
+        if not manager.state_listeners:
+            break
+        await asyncio.sleep(0)
+    await asyncio.sleep(0.05)
+    assert not manager.state_listeners
+    writer.close()
+
+@pytest.mark.asyncio
+async def test_overlong_line(control):
+    import asyncio
+    manager, server = control
+    reader, writer = await asyncio.open_unix_connection(server.path)
+    writer.write(b'x' * 100000 + b'\n')
+    assert await asyncio.wait_for(reader.read(), 1) == b''
+    writer.close()
+    # Other clients are served
+    reader, writer = await asyncio.open_unix_connection(server.path)
+    assert await request(reader, writer, b'status') == {'kodi_running': False}
+    writer.close()
+
+@pytest.mark.asyncio
+async def test_stale_socket(tmp_path):
+    import os
+    from kodi_wol_listener.control_socket import ControlServer
+    path = tmp_path / 'control.sock'
+    path.write_bytes(b'')
+    server = await ControlServer(FakeManager()).init(str(path))
+    server.close()
+    assert not os.path.exists(path)
+
+def test_default_path(monkeypatch):
+    from kodi_wol_listener.control_socket import default_socket_path
+    monkeypatch.setenv('XDG_RUNTIME_DIR', '/run/user/1000')
+    assert default_socket_path() == '/run/user/1000/kodi_wol_listener.sock'
+
+def test_check_private_dir(tmp_path):
+    import os
+    from kodi_wol_listener.control_socket import check_private_dir
+    private = tmp_path / 'private'
+    private.mkdir(mode=0o700)
+    check_private_dir(str(private))
+    private.chmod(0o755)
+    with pytest.raises(OSError):
+        check_private_dir(str(private))
+    link = tmp_path / 'link'
+    link.symlink_to(private)
+    private.chmod(0o700)
+    with pytest.raises(OSError):
+        check_private_dir(str(link))
+    if os.geteuid() == 0:
+        os.chown(private, 1000, -1)
+        with pytest.raises(OSError):
+            check_private_dir(str(private))
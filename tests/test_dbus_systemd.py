@@ -1,13 +1,12 @@
 import os
 import pytest
 
-# Only execute tests in this module if systemd and dbus are available
-pytestmark = [
-    pytest.mark.skipif(not os.environ.get('XDG_RUNTIME_DIR'), reason='Systemd environment required'),
-    pytest.mark.skipif(not os.environ.get('DBUS_SESSION_BUS_ADDRESS'), reason='DBUS environment required')]
+# All tests run against the fake systemd service on a private dbus-daemon
+pytestmark = pytest.mark.skipif(not os.path.exists('/usr/bin/dbus-daemon'),
+                                reason='dbus-daemon required')
 
 @pytest.fixture
-async def systemd():
+async def systemd(fake_systemd):
     from kodi_wol_listener.dbus_systemd import DbusSystemd
     return await DbusSystemd().init()
 
@@ -29,35 +28,45 @@ async def test_dbus_systemd(systemd):
     await systemd.get_object('/org/freedesktop/systemd1')
 
 @pytest.mark.asyncio
-async def test_manager(manager):
+async def test_manager(fake_systemd, manager):
+    assert 'wol_listener_test.service' in fake_systemd.enabled
     await manager.start_unit('wol_listener_test.service')
+    assert fake_systemd.units['wol_listener_test.service'].state == 'active'
     await manager.get_unit('wol_listener_test.service')
     await manager.stop_unit('wol_listener_test.service')
+    assert fake_systemd.units['wol_listener_test.service'].state == 'inactive'
 
 @pytest.mark.asyncio
 async def test_unit(mocker, systemd, manager):
+    import asyncio
     from kodi_wol_listener.dbus_systemd import SystemdUnit
     await manager.start_unit('wol_listener_test.service')
-    mock_cb = mocker.Mock()
+    states = asyncio.Queue()
+    mock_cb = mocker.Mock(side_effect=states.put_nowait)
     dummy = await SystemdUnit('wol_listener_test.service', mock_cb).init(systemd)
     assert dummy.state == 'active'
     dummy.stop()
     await dummy.wait_for_job()
-    # Signals on units only work when systemd is PID1. So call cb manually
-    variant = mocker.Mock(value='inactive')
-    dummy.on_properties_changed_cb(mocker.sentinel.interface,
-                                   {'ActiveState' : variant}, {})
+    # The state change arrives as PropertiesChanged signal
+    assert await asyncio.wait_for(states.get(), 1) == 'inactive'
     mock_cb.assert_called_once_with('inactive')
     assert dummy.state == 'inactive'
     mock_cb.reset_mock()
     dummy.start()
     await dummy.wait_for_job()
-    # Signals on units only work when systemd is PID1. So call cb manually
-    variant.value='active'
-    dummy.on_properties_changed_cb(mocker.sentinel.interface,
-                                   {'ActiveState' : variant}, {})
+    assert await asyncio.wait_for(states.get(), 1) == 'active'
     mock_cb.assert_called_once_with('active')
-    variant = mocker.Mock(value='active')
+
+@pytest.mark.asyncio
+async def test_unit_latency(systemd, fake_systemd, manager):
+    import time
+    from kodi_wol_listener.dbus_systemd import SystemdUnit
+    dummy = await SystemdUnit('wol_listener_test.service').init(systemd)
+    fake_systemd.latency = 0.05
+    start = time.perf_counter()
+    dummy.start()
+    await dummy.wait_for_job()
+    assert time.perf_counter() - start >= 0.05
 
 @pytest.mark.asyncio
 async def test_unit_errors(mocker):
@@ -68,3 +77,34 @@ async def test_unit_errors(mocker):
     with pytest.raises(UserWarning):
         unit.service_status_changed(task)
     unit.on_properties_changed_cb(None, {}, {})
+
+@pytest.mark.asyncio
+async def test_shared_connection(fake_systemd, systemd):
+    from kodi_wol_listener.dbus_systemd import DbusSystemd, SystemdUnit
+    other = await DbusSystemd().init()
+    assert other.bus is systemd.bus
+    fake_systemd.add_unit('shared.service')
+    unit_a = await SystemdUnit('shared.service').init(systemd)
+    unit_b = await SystemdUnit('shared.service').init(other)
+    assert unit_a.service_if is unit_b.service_if
+
+@pytest.mark.asyncio
+async def test_reconnect(mocker, private_dbus, fake_systemd, systemd):
+    import asyncio
+    from kodi_wol_listener.dbus_systemd import DbusSystemd, SystemdUnit
+    fake_systemd.add_unit('reconnect.service')
+    states = asyncio.Queue()
+    unit = await SystemdUnit('reconnect.service', states.put_nowait).init(systemd)
+    old_bus = systemd.bus
+    # Restart the daemon, the service comes back in a different state
+    fake_systemd.disconnect()
+    private_dbus.restart()
+    fake_systemd.units['reconnect.service'].state = 'active'
+    await fake_systemd.init(private_dbus.address)
+    # The unit is re-bound transparently and reports the missed change
+    assert await asyncio.wait_for(states.get(), 5) == 'active'
+    assert (await DbusSystemd().init()).bus is not old_bus
+    unit.stop()
+    await unit.wait_for_job()
+    assert await asyncio.wait_for(states.get(), 1) == 'inactive'
+    unit.close()
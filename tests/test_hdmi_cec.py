@@ -0,0 +1,81 @@
+import os
+import sys
+import pytest
+
+FAKE_CEC_CLIENT = os.path.join(os.path.dirname(__file__), 'fake_cec_client.py')
+
+def cec_command(*args):
+    return ' '.join([sys.executable, FAKE_CEC_CLIENT] + list(args)).encode()
+
+@pytest.fixture
+async def cec(tmp_path):
+    from kodi_wol_listener.hdmi_cec import CecClient
+    log = tmp_path / 'commands.log'
+    client = CecClient(cec_command('--delay', '0.2', '--log', str(log)), timeout=2)
+    yield client, log
+    await client.close()
+
+@pytest.mark.asyncio
+async def test_power(cec):
+    cec, log = cec
+    assert await cec.power_status() == 'standby'
+    await cec.wake_tv()
+    assert await cec.power_status() == 'on'
+    await cec.standby()
+    assert await cec.power_status() == 'standby'
+    assert log.read_text().split('\n')[:-1] == ['pow 0', 'on 0', 'as', 'pow 0',
+                                                'standby 0', 'pow 0']
+
+@pytest.mark.asyncio
+async def test_single_process(cec):
+    import asyncio
+    cec, log = cec
+    # Concurrent commands are queued, the process is started once
+    results = await asyncio.gather(cec.power_on(), cec.power_status(), cec.active_source(),
+                                   cec.power_status())
+    assert results == [None, 'on', None, 'on']
+    pid = cec.proc.pid
+    await cec.power_status()
+    assert cec.proc.pid == pid
+
+@pytest.mark.asyncio
+async def test_restart(cec):
+    cec, _ = cec
+    await cec.start()
+    cec.proc.kill()
+    await cec.reader_task
+    assert not cec.running
+    assert await cec.power_status() == 'standby'
+    assert cec.running
+
+@pytest.mark.asyncio
+async def test_no_adapter():
+    from kodi_wol_listener.hdmi_cec import CecClient, CecError
+    cec = CecClient(cec_command('--fail'), timeout=2)
+    with pytest.raises(CecError, match='could not open'):
+        await cec.wake_tv()
+    cec = CecClient(b'/nonexistent/cec-client', timeout=2)
+    with pytest.raises(CecError):
+        await cec.wake_tv()
+
+@pytest.mark.asyncio
+async def test_timeout():
+    from kodi_wol_listener.hdmi_cec import CecClient, CecError
+    cec = CecClient(cec_command('--delay', '1'), timeout=0.1)
+    with pytest.raises(CecError, match='ready'):
+        await cec.start()
+    await cec.close()
+
+@pytest.mark.asyncio
+async def test_reply_timeout(cec):
+    import re
+    from kodi_wol_listener.hdmi_cec import CecError
+    cec, _ = cec
+    cec.timeout = 0.5
+    await cec.start()
+    # A reply that never arrives must not block the following replies
+    with pytest.raises(CecError, match='No reply'):
+        await cec.send('pow 0', re.compile(r'never seen (\S+)'))
+    assert not cec.replies
+    assert await cec.power_status() == 'standby'
+    assert await cec.power_status() == 'standby'
@@ -0,0 +1,127 @@
+import pytest
+
+HOTPLUG_UEVENT = (b'change@/devices/platform/gpu/drm/card1\0ACTION=change\0'
+                  b'DEVPATH=/devices/platform/gpu/drm/card1\0SUBSYSTEM=drm\0HOTPLUG=1\0'
+                  b'DEVNAME=dri/card1\0SEQNUM=2310\0')
+
+def test_parse_uevent():
+    from kodi_wol_listener.hotplug import parse_uevent
+    event = parse_uevent(HOTPLUG_UEVENT)
+    assert event['SUBSYSTEM'] == 'drm'
+    assert event['HOTPLUG'] == '1'
+    assert parse_uevent(b'libudev\0\xfe\xed\xca\xfe') is None
+
+def test_connector_status(tmp_path):
+    from kodi_wol_listener.hotplug import connector_status
+    assert connector_status(str(tmp_path)) is None
+    (tmp_path / 'card1-HDMI-A-1').mkdir()
+    (tmp_path / 'card1-HDMI-A-1' / 'status').write_text('disconnected\n')
+    (tmp_path / 'card1-HDMI-A-2').mkdir()
+    (tmp_path / 'card1-HDMI-A-2' / 'status').write_text('disconnected\n')
+    assert connector_status(str(tmp_path)) is False
+    (tmp_path / 'card1-HDMI-A-2' / 'status').write_text('connected\n')
+    assert connector_status(str(tmp_path)) is True
+
+@pytest.mark.asyncio
+async def test_uevents(tmp_path):
+    import socket
+    import asyncio
+    from kodi_wol_listener.hotplug import HotplugMonitor
+
+    status = tmp_path / 'card1-HDMI-A-1' / 'status'
+    status.parent.mkdir()
+    status.write_text('disconnected\n')
+    # A fake netlink source
+    kernel, sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    attached = []
+    monitor = await HotplugMonitor(lambda: attached.append(True), throttle=0.3,
+                                   drm_dir=str(tmp_path)).start(sock)
+    try:
+        assert monitor.connected is False
+        # Other uevents are ignored
+        status.write_text('connected\n')
+        kernel.send(b'add@/devices/usb1\0ACTION=add\0SUBSYSTEM=usb\0')
+        await asyncio.sleep(0.05)
+        assert not attached
+        kernel.send(HOTPLUG_UEVENT)
+        await asyncio.sleep(0.05)
+        assert attached == [True]
+        # Flapping within the throttle time
+        for state in ('disconnected', 'connected', 'disconnected', 'connected'):
+            status.write_text(state + '\n')
+            kernel.send(HOTPLUG_UEVENT)
+            await asyncio.sleep(0.02)
+        assert attached == [True]
+        await asyncio.sleep(0.3)
+        status.write_text('disconnected\n')
+        kernel.send(HOTPLUG_UEVENT)
+        await asyncio.sleep(0.02)
+        status.write_text('connected\n')
+        kernel.send(HOTPLUG_UEVENT)
+        await asyncio.sleep(0.05)
+        assert attached == [True, True]
+    finally:
+        await monitor.close()
+        kernel.close()
+
+@pytest.mark.asyncio
+async def test_uevent_errors(tmp_path):
+    import errno
+    import socket
+    import asyncio
+    from kodi_wol_listener.hotplug import HotplugMonitor
+
+    status = tmp_path / 'card1-HDMI-A-1' / 'status'
+    status.parent.mkdir()
+    status.write_text('disconnected\n')
+    kernel, sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    class FailingSocket():
+        """Fails receiving with the given errors, then passes through"""
+        def __init__(self, errors):
+            self.errors = errors
+        def recv(self, size):
+            if self.errors:
+                raise OSError(self.errors.pop(0), 'failed')
+            return sock.recv(size)
+        def __getattr__(self, name):
+            return getattr(sock, name)
+    attached = []
+    failing = FailingSocket([errno.ENOBUFS])
+    monitor = await HotplugMonitor(lambda: attached.append(True),
+                                   drm_dir=str(tmp_path)).start(failing)
+    try:
+        # Lost uevents are recovered from sysfs
+        status.write_text('connected\n')
+        kernel.send(b'add@/devices/usb1\0ACTION=add\0SUBSYSTEM=usb\0')
+        await asyncio.sleep(0.05)
+        assert attached == [True]
+        # Other errors stop monitoring instead of spinning
+        failing.errors.append(errno.EBADF)
+        kernel.send(HOTPLUG_UEVENT)
+        await asyncio.sleep(0.05)
+        assert monitor.sock is None
+    finally:
+        await monitor.close()
+        kernel.close()
+
+@pytest.mark.asyncio
+async def test_tvservice(tmp_path):
+    import asyncio
+    from kodi_wol_listener.hotplug import HotplugMonitor
+
+    script = tmp_path / 'tvservice'
+    script.write_text("#!/bin/sh\n"
+                      "echo 'Starting to monitor for HDMI events'\n"
+                      "echo '[I] HDMI cable is unplugged'\n"
+                      "echo '[I] HDMI is attached'\n"
+                      "exec sleep 30\n")
+    script.chmod(0o755)
+    attached = asyncio.Event()
+    # No drm connectors, tvservice is used
+    monitor = await HotplugMonitor(attached.set, tvservice=str(script).encode(),
+                                   drm_dir=str(tmp_path)).start()
+    try:
+        await asyncio.wait_for(attached.wait(), 2)
+        assert monitor.connected is True
+    finally:
+        await monitor.close()
@@ -0,0 +1,105 @@
+import os
+import socket
+import struct
+import logging
+import pytest
+
+def parse(datagram):
+    """Parse a datagram of the journal native protocol into a dict"""
+    fields = {}
+    while datagram:
+        line, _, rest = datagram.partition(b'\n')
+        if b'=' in line:
+            name, _, value = line.partition(b'=')
+            datagram = rest
+        else:
+            name = line
+            size = struct.unpack('<Q', rest[:8])[0]
+            value = rest[8:8 + size]
+            assert rest[8 + size:9 + size] == b'\n'
+            datagram = rest[9 + size:]
+        fields[name.decode()] = value.decode()
+    return fields
+
+@pytest.fixture
+def journal(tmp_path):
+    """Stand-in for the journald socket, returns (socket, handler, logger)"""
+    from kodi_wol_listener.journald import JournalHandler
+    path = str(tmp_path / 'socket')
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.bind(path)
+    sock.settimeout(1)
+    handler = JournalHandler('test_journald', path)
+    logger = logging.getLogger('test_journald')
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    yield sock, handler, logger
+    logger.removeHandler(handler)
+    handler.close()
+    sock.close()
+
+def test_record(journal):
+    sock, _, logger = journal
+    logger.warning("Kodi %s after %.1fs", 'exited', 1.25,
+                   extra={'KODI_PID': 1234, 'DURATION_MS': 1250, 'PHASE': 'run',
+                          'WOL_SOURCE': '192.168.1.2', 'lower_case': 'ignored'})
+    fields = parse(sock.recv(65536))
+    assert fields['MESSAGE'] == 'Kodi exited after 1.2s'
+    assert fields['PRIORITY'] == '4'
+    assert fields['SYSLOG_IDENTIFIER'] == 'test_journald'
+    assert fields['LOGGER'] == 'test_journald'
+    assert fields['CODE_FUNC'] == 'test_record'
+    assert fields['CODE_FILE'] == __file__
+    assert fields['KODI_PID'] == '1234'
+    assert fields['DURATION_MS'] == '1250'
+    assert fields['PHASE'] == 'run'
+    assert fields['WOL_SOURCE'] == '192.168.1.2'
+    assert 'lower_case' not in fields
+
+@pytest.mark.parametrize('level, priority', [
+    (logging.DEBUG, '7'), (logging.INFO, '6'), (logging.ERROR, '3'), (logging.CRITICAL, '2')])
+def test_priority(journal, level, priority):
+    sock, _, logger = journal
+    logger.log(level, "message")
+    assert parse(sock.recv(65536))['PRIORITY'] == priority
+
+def test_multiline(journal):
+    sock, _, logger = journal
+    try:
+        raise ValueError('failed')
+    except ValueError:
+        logger.exception("Line 1\nLine 2")
+    message = parse(sock.recv(65536))['MESSAGE']
+    assert message.startswith("Line 1\nLine 2\nTraceback")
+    assert message.endswith("ValueError: failed")
+
+def test_lazy_format(journal, mocker):
+    sock, handler, logger = journal
+    handler.setLevel(logging.INFO)
+    format_spy = mocker.spy(handler, 'format')
+    logger.debug("Not formatted %s", 'arg')
+    format_spy.assert_not_called()
+    sock.settimeout(0)
+    with pytest.raises(BlockingIOError):
+        sock.recv(65536)
+
+def test_congested(journal):
+    sock, handler, logger = journal
+    # Fill the socket buffer without receiving
+    while not handler.dropped:
+        logger.info("x" * 1000)
+    sock.settimeout(0)
+    assert sock.recv(65536)
+
+def test_journal_stream_connected(monkeypatch):
+    from kodi_wol_listener.journald import journal_stream_connected
+    stat = os.fstat(2)
+    monkeypatch.setenv('JOURNAL_STREAM', f'{stat.st_dev}:{stat.st_ino}')
+    assert journal_stream_connected()
+    monkeypatch.setenv('JOURNAL_STREAM', f'{stat.st_dev}:{stat.st_ino + 1}')
+    assert not journal_stream_connected()
+    monkeypatch.setenv('JOURNAL_STREAM', 'invalid')
+    assert not journal_stream_connected()
+    monkeypatch.delenv('JOURNAL_STREAM')
+    assert not journal_stream_connected()
@@ -0,0 +1,74 @@
+import pytest
+
+@pytest.fixture
+def monitor(mocker, fake_kodi):
+    from kodi_wol_listener.kodi_jsonrpc import KodiJsonRpc
+    from kodi_wol_listener.kodi_idle import KodiIdleMonitor
+    idle_callback = mocker.AsyncMock()
+    monitor = KodiIdleMonitor(KodiJsonRpc(port=fake_kodi.port), 1.0, idle_callback)
+    monitor.PLAYING_INTERVAL = 0.2
+    monitor.MIN_INTERVAL = 0.05
+    monitor.MAX_INTERVAL = 0.5
+    yield monitor
+    monitor.rpc.close()
+
+def test_next_interval(monitor):
+    monitor.PLAYING_INTERVAL = 300
+    monitor.MIN_INTERVAL = 5
+    monitor.MAX_INTERVAL = 120
+    monitor.idle_timeout = 600
+    monitor.idle_since = 1000
+    monitor.playing = True
+    assert monitor.next_interval(1000) == 300
+    monitor.playing = False
+    # Far from the deadline, the interval is limited
+    assert monitor.next_interval(1000) == 120
+    # Closer to the deadline it shrinks, but not below the minimum...
+    assert monitor.next_interval(1500) == 50
+    assert monitor.next_interval(1590) == 5
+    # ...unless the deadline is even closer
+    assert monitor.next_interval(1598) == pytest.approx(2)
+    assert monitor.next_interval(1600) == 0
+
+@pytest.mark.asyncio
+async def test_idle(monitor, fake_kodi):
+    import time
+    fake_kodi.last_input -= 10
+    start = time.monotonic()
+    await monitor.run()
+    assert time.monotonic() - start >= monitor.idle_timeout
+    monitor.idle_callback.assert_awaited_once_with()
+
+@pytest.mark.asyncio
+async def test_playing(monitor, fake_kodi):
+    import asyncio
+    fake_kodi.players = [1]
+    task = asyncio.get_running_loop().create_task(monitor.run())
+    await asyncio.sleep(1.5)
+    assert not task.done()
+    # Playback stopped, idle time starts counting
+    fake_kodi.players = []
+    fake_kodi.screensaver = True
+    await asyncio.wait_for(task, 2)
+    monitor.idle_callback.assert_awaited_once_with()
+
+@pytest.mark.asyncio
+async def test_user_input(monitor, fake_kodi):
+    import asyncio
+    task = asyncio.get_running_loop().create_task(monitor.run())
+    for _ in range(6):
+        await asyncio.sleep(0.25)
+        fake_kodi.user_input()
+    assert not task.done()
+    await asyncio.wait_for(task, 3)
+    monitor.idle_callback.assert_awaited_once_with()
+
+@pytest.mark.asyncio
+async def test_kodi_unreachable(monitor, fake_kodi):
+    import asyncio
+    fake_kodi.close()
+    task = asyncio.get_running_loop().create_task(monitor.run())
+    await asyncio.sleep(1.5)
+    # Errors neither count as usage nor as idleness
+    assert not task.done()
+    task.cancel()
@@ -0,0 +1,59 @@
+import pytest
+
+@pytest.mark.asyncio
+async def test_call(fake_kodi):
+    from kodi_wol_listener.kodi_jsonrpc import KodiJsonRpc
+    rpc = KodiJsonRpc(port=fake_kodi.port)
+    assert not rpc.connected
+    assert await rpc.call('JSONRPC.Ping') == 'pong'
+    assert rpc.connected
+    fake_kodi.players = [1]
+    assert await rpc.call('Player.GetActivePlayers') == [{'playerid': 1, 'type': 'video'}]
+    rpc.close()
+    assert not rpc.connected
+
+@pytest.mark.asyncio
+async def test_errors(fake_kodi):
+    import socket
+    from kodi_wol_listener.kodi_jsonrpc import KodiJsonRpc, KodiJsonRpcError
+    rpc = KodiJsonRpc(port=fake_kodi.port)
+    with pytest.raises(KodiJsonRpcError):
+        await rpc.call('No.Such.Method')
+    # Connection lost while waiting for a response
+    fake_kodi.close()
+    with pytest.raises(ConnectionError):
+        await rpc.call('JSONRPC.Ping')
+    # Nobody listening
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    rpc = KodiJsonRpc(port=sock.getsockname()[1])
+    with pytest.raises(OSError):
+        await rpc.call('JSONRPC.Ping')
+    sock.close()
+
+@pytest.mark.asyncio
+async def test_notification(mocker, fake_kodi):
+    import asyncio
+    from kodi_wol_listener.kodi_jsonrpc import KodiJsonRpc
+    callback = mocker.Mock()
+    rpc = KodiJsonRpc(port=fake_kodi.port, notification_callback=callback)
+    await rpc.connect()
+    await asyncio.sleep(0.01)
+    fake_kodi.notify('Player.OnPlay', {'data': 1})
+    # A call issued after the notification completes after its dispatch
+    await rpc.call('JSONRPC.Ping')
+    callback.assert_called_once_with('Player.OnPlay', {'data': 1})
+    rpc.close()
+
+@pytest.mark.asyncio
+async def test_concurrent_connect(fake_kodi):
+    import asyncio
+    from kodi_wol_listener.kodi_jsonrpc import KodiJsonRpc
+    rpc = KodiJsonRpc(port=fake_kodi.port)
+    results = await asyncio.gather(*(rpc.call('JSONRPC.Ping') for _ in range(4)))
+    assert results == ['pong'] * 4
+    # A single connection, kept open
+    await asyncio.sleep(0.01)
+    assert len(fake_kodi.writers) == 1
+    assert rpc.connected
+    rpc.close()
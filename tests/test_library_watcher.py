@@ -0,0 +1,57 @@
+import pytest
+
+def test_coalesce():
+    from kodi_wol_listener.library_watcher import coalesce
+    assert coalesce([]) == []
+    assert coalesce(['/v/b', '/v/a/x', '/v/a', '/v/ab', '/v/a/y/z']) == ['/v/a', '/v/ab', '/v/b']
+
+@pytest.mark.asyncio
+async def test_watch(tmp_path):
+    import os
+    import asyncio
+    from kodi_wol_listener.library_watcher import LibraryWatcher
+
+    (tmp_path / 'Movies').mkdir()
+    (tmp_path / 'Series' / 'Show').mkdir(parents=True)
+    reports = asyncio.Queue()
+    watcher = LibraryWatcher(str(tmp_path), reports.put_nowait, settle=0.2).start()
+    try:
+        assert len(watcher.watches) == 4
+        # rsync writes a temporary file and renames it
+        temp = tmp_path / 'Movies' / '.movie.mkv.Ab12Cd'
+        temp.write_bytes(b'movie')
+        os.rename(temp, tmp_path / 'Movies' / 'movie.mkv')
+        (tmp_path / 'Series' / 'Show' / 'e01.mkv').write_bytes(b'episode')
+        await asyncio.sleep(0.1)
+        # A new directory, its files are reported with it
+        (tmp_path / 'Series' / 'Show' / 'Season 2').mkdir()
+        (tmp_path / 'Series' / 'Show' / 'Season 2' / 'e01.mkv').write_bytes(b'episode')
+        assert await asyncio.wait_for(reports.get(), 1) == [
+            str(tmp_path / 'Movies'), str(tmp_path / 'Series' / 'Show')]
+        # Temporary files alone are no change
+        (tmp_path / 'Movies' / '.partial').write_bytes(b'partial')
+        await asyncio.sleep(0.3)
+        assert reports.empty()
+        # The new directory is watched
+        (tmp_path / 'Series' / 'Show' / 'Season 2' / 'e02.mkv').write_bytes(b'episode')
+        assert await asyncio.wait_for(reports.get(), 1) == [str(tmp_path / 'Series' / 'Show' / 'Season 2')]
+    finally:
+        watcher.close()
+
+@pytest.mark.asyncio
+async def test_max_delay(tmp_path):
+    import asyncio
+    from kodi_wol_listener.library_watcher import LibraryWatcher
+
+    reports = asyncio.Queue()
+    watcher = LibraryWatcher(str(tmp_path), reports.put_nowait, settle=0.2, max_delay=0.5).start()
+    try:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        # Changes keep coming, the report is not delayed forever
+        while reports.empty():
+            (tmp_path / 'video.mkv').write_bytes(b'video')
+            await asyncio.sleep(0.05)
+        assert loop.time() - start < 0.8
+    finally:
+        watcher.close()
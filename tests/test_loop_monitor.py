@@ -0,0 +1,41 @@
+import pytest
+
+@pytest.mark.asyncio
+async def test_lag(caplog):
+    import time
+    import asyncio
+    from kodi_wol_listener.loop_monitor import LoopLagMonitor, LOOP_LAG_SECONDS
+    count = LOOP_LAG_SECONDS.get()[0]
+    monitor = LoopLagMonitor(interval=0.01, warn_threshold=0.1)
+    task = asyncio.get_running_loop().create_task(monitor.run())
+    await asyncio.sleep(0.05)
+    # Debug mode is only turned on for slow callback reports
+    assert not asyncio.get_running_loop().get_debug()
+    # Block the loop
+    time.sleep(0.2)
+    await asyncio.sleep(0.05)
+    task.cancel()
+    assert LOOP_LAG_SECONDS.get()[0] > count
+    assert monitor.max_lag >= 0.15
+    assert 'Event loop blocked' in caplog.text
+
+@pytest.mark.asyncio
+async def test_profiler(tmp_path):
+    import os
+    import signal
+    import pstats
+    import asyncio
+    from kodi_wol_listener.loop_monitor import Profiler
+    profiler = Profiler(str(tmp_path / 'profiles'), duration=0.1)
+    profiler.install(signal.SIGUSR2)
+    os.kill(os.getpid(), signal.SIGUSR2)
+    await asyncio.sleep(0.01)
+    assert profiler.profile
+    # A second request while profiling is ignored
+    profiler.start()
+    await asyncio.sleep(0.2)
+    assert not profiler.profile
+    asyncio.get_running_loop().remove_signal_handler(signal.SIGUSR2)
+    profiles = os.listdir(tmp_path / 'profiles')
+    assert len(profiles) == 1
+    pstats.Stats(str(tmp_path / 'profiles' / profiles[0]))
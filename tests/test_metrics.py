@@ -0,0 +1,79 @@
+import pytest
+
+@pytest.fixture
+def registry():
+    from kodi_wol_listener.metrics import Registry
+    return Registry()
+
+def test_counter(registry):
+    from kodi_wol_listener import metrics
+    packets = metrics.counter('packets', 'Packets "received"', ['source', 'verdict'],
+                              registry=registry)
+    packets.inc('1.2.3.4', 'accepted')
+    packets.inc('1.2.3.4', 'accepted')
+    packets.inc('5.6.7.8', 'rejected', amount=3)
+    assert packets.get('1.2.3.4', 'accepted') == 2
+    assert registry.render() == (
+        '# TYPE packets counter\n'
+        '# HELP packets Packets \\"received\\"\n'
+        'packets_total{source="1.2.3.4",verdict="accepted"} 2\n'
+        'packets_total{source="5.6.7.8",verdict="rejected"} 3\n'
+        '# EOF\n')
+
+def test_gauge(registry):
+    from kodi_wol_listener import metrics
+    running = metrics.gauge('running', 'Running', registry=registry)
+    running.set(1)
+    running.set(0.5)
+    assert running.get() == 0.5
+    assert 'running 0.5\n' in registry.render()
+
+def test_histogram(registry):
+    from kodi_wol_listener import metrics
+    durations = metrics.histogram('duration_seconds', 'Durations', ['phase'], [0.1, 1],
+                                  registry=registry)
+    for value in (0.05, 0.1, 0.5, 2):
+        durations.observe(value, 'run')
+    assert durations.get('run') == (4, 2.65)
+    assert durations.get('other') == (0, 0.0)
+    assert registry.render().splitlines()[2:-1] == [
+        'duration_seconds_bucket{phase="run",le="0.1"} 2',
+        'duration_seconds_bucket{phase="run",le="1.0"} 3',
+        'duration_seconds_bucket{phase="run",le="+Inf"} 4',
+        'duration_seconds_count{phase="run"} 4',
+        'duration_seconds_sum{phase="run"} 2.65']
+
+@pytest.mark.asyncio
+async def test_server(registry):
+    import asyncio
+    from kodi_wol_listener import metrics
+    metrics.counter('packets', 'Packets', registry=registry).inc()
+    server = metrics.MetricsServer(registry)
+    port = await server.init(0, '127.0.0.1')
+
+    async def get(request):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(request)
+        response = await reader.read()
+        writer.close()
+        return response
+
+    response = await get(b'GET /metrics HTTP/1.1\r\nHost: pi\r\n\r\n')
+    header, body = response.split(b'\r\n\r\n', 1)
+    assert header.startswith(b'HTTP/1.1 200 OK')
+    assert metrics.CONTENT_TYPE.encode() in header
+    assert body == registry.render().encode()
+    assert (await get(b'GET / HTTP/1.1\r\n\r\n')).startswith(b'HTTP/1.1 404')
+    assert (await get(b'POST /metrics HTTP/1.1\r\n\r\n')).startswith(b'HTTP/1.1 405')
+    server.close()
+
+def test_receiver_metrics():
+    from kodi_wol_listener.wol_receiver import WolReceiver, PACKETS
+    receiver = WolReceiver(lambda addr: None)
+    receiver.mymac_bytes = bytes.fromhex('b827eb010203')
+    accepted = PACKETS.get('accepted')
+    rejected = PACKETS.get('rejected')
+    receiver.datagram_received(b'\xff' * 6 + receiver.mymac_bytes, ('10.0.0.1', 9))
+    receiver.datagram_received(b'hello', ('10.0.0.1', 9))
+    assert PACKETS.get('accepted') == accepted + 1
+    assert PACKETS.get('rejected') == rejected + 1
@@ -0,0 +1,81 @@
+import os
+import sys
+import pytest
+
+FAKE_RSYNC = os.path.join(os.path.dirname(__file__), 'fake_rsync.py')
+
+@pytest.fixture
+async def fake_rsync():
+    """A fake rsync daemon with a transfer child, yields their pids"""
+    import asyncio
+    proc = await asyncio.create_subprocess_exec(sys.executable, FAKE_RSYNC,
+                                                stdout=asyncio.subprocess.PIPE)
+    pids = [int(pid) for pid in (await proc.stdout.readline()).split()]
+    yield pids
+    proc.terminate()
+    await proc.wait()
+
+def ionice(pid):
+    import subprocess
+    return subprocess.run(['ionice', '-p', str(pid)], stdout=subprocess.PIPE,
+                          check=True).stdout.decode().strip()
+
+def test_find_processes():
+    from kodi_wol_listener.rsync_throttle import find_processes
+    with open('/proc/self/comm') as comm:
+        name = comm.read().strip()
+    assert os.getpid() in find_processes(name)
+    assert find_processes('no such process') == []
+
+@pytest.mark.asyncio
+async def test_processes(fake_rsync):
+    import time
+    from kodi_wol_listener.rsync_throttle import RsyncThrottle, find_processes
+    assert sorted(find_processes('rsync')) == sorted(fake_rsync)
+    throttle = RsyncThrottle('rsync', unit='')
+    start = time.monotonic()
+    await throttle.set_throttled(True)
+    assert time.monotonic() - start < 1
+    for pid in fake_rsync:
+        assert os.getpriority(os.PRIO_PROCESS, pid) == 19
+        assert ionice(pid) == 'best-effort: prio 7'
+    # Another throttle request changes nothing
+    await throttle.set_throttled(True)
+    assert throttle.niced == {pid: 0 for pid in fake_rsync}
+    start = time.monotonic()
+    await throttle.set_throttled(False)
+    assert time.monotonic() - start < 1
+    assert not throttle.throttled
+    if os.geteuid() == 0:
+        # Others depend on LimitNICE= of the fake rsync
+        for pid in fake_rsync:
+            assert os.getpriority(os.PRIO_PROCESS, pid) == 0
+            assert ionice(pid) == 'none: prio 0'
+
+@pytest.mark.skipif(not os.path.exists('/usr/bin/dbus-daemon'), reason='dbus-daemon required')
+@pytest.mark.asyncio
+async def test_unit(fake_systemd, fake_rsync):
+    import time
+    from kodi_wol_listener.rsync_throttle import RsyncThrottle
+    unit = fake_systemd.add_unit('rsync_user.service', 'active')
+    throttle = RsyncThrottle('rsync', 'rsync_user.service')
+    start = time.monotonic()
+    await throttle.set_throttled(True)
+    assert time.monotonic() - start < 1
+    assert unit.properties == {'CPUWeight': 10, 'IOWeight': 10}
+    # The weights need delegated cgroup controllers, the processes are
+    # reniced anyway
+    assert os.getpriority(os.PRIO_PROCESS, fake_rsync[0]) == 19
+    await throttle.set_throttled(False)
+    assert unit.properties == {'CPUWeight': 2 ** 64 - 1, 'IOWeight': 2 ** 64 - 1}
+
+@pytest.mark.skipif(not os.path.exists('/usr/bin/dbus-daemon'), reason='dbus-daemon required')
+@pytest.mark.asyncio
+async def test_unit_fallback(fake_systemd, fake_rsync):
+    from kodi_wol_listener.rsync_throttle import RsyncThrottle
+    # The daemon is not run by the unit, the processes are reniced only
+    throttle = RsyncThrottle('rsync', 'rsync_user.service')
+    await throttle.set_throttled(True)
+    assert not throttle.unit_throttled
+    assert os.getpriority(os.PRIO_PROCESS, fake_rsync[0]) == 19
+    await throttle.set_throttled(False)
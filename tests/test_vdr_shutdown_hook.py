@@ -0,0 +1,127 @@
+import pytest
+
+def test_parse_listener():
+    from kodi_wol_listener.vdr_shutdown_hook import parse_listener
+
+    assert parse_listener('kodi-pi') == ('udp', ('kodi-pi', 42429))
+    assert parse_listener('10.0.0.2:4000') == ('udp', ('10.0.0.2', 4000))
+    assert parse_listener('[fe80::1]:4000') == ('udp', ('fe80::1', 4000))
+    assert parse_listener('fe80::1') == ('udp', ('fe80::1', 42429))
+    assert parse_listener('unix:/run/kwl.sock') == ('unix', '/run/kwl.sock')
+
+def test_defer_minutes():
+    from kodi_wol_listener.vdr_shutdown_hook import defer_minutes
+
+    now = 100000
+    idle = {'kodi_running': False, 'last_wake': None}
+    assert defer_minutes({}, now) is None
+    assert defer_minutes({'a': idle}, now) is None
+    assert defer_minutes({'a': idle, 'b': dict(idle, kodi_running=True)}, now, retry=7) == 7
+    # Kodi in standby does not use the backend
+    assert defer_minutes({'a': dict(idle, kodi_running=True, standby=True)}, now) is None
+    # Woken 4 minutes ago, by the clock of the listener
+    woken = {'kodi_running': False, 'last_wake': {'time': 5000}, 'time': 5240}
+    assert defer_minutes({'a': woken}, now, recent=600) == 6
+    assert defer_minutes({'a': woken}, now, recent=240) is None
+    # A user requested shutdown is only deferred by running kodis
+    assert defer_minutes({'a': woken}, now, user=True) is None
+
+def test_next_wakeup():
+    from kodi_wol_listener.vdr_shutdown_hook import next_wakeup
+
+    now = 100000
+    assert next_wakeup(now) is None
+    assert next_wakeup(now, next_timer=200000, timer_lead=300) == 199700
+    statuses = {'a': {'next_wake': 150000.0}, 'b': {'next_wake': None}}
+    assert next_wakeup(now, 200000, 300, statuses) == 150000
+    # Past wakes are ignored
+    assert next_wakeup(now, 200000, 300, statuses, [90000, 120000]) == 120000
+
+def test_set_wakealarm(tmp_path):
+    from kodi_wol_listener.vdr_shutdown_hook import set_wakealarm
+
+    wakealarm = tmp_path / 'wakealarm'
+    wakealarm.write_text('')
+    assert set_wakealarm(None, str(wakealarm)) is False
+    assert set_wakealarm(123456, str(wakealarm)) is True
+    assert wakealarm.read_text() == '123456\n'
+    assert set_wakealarm(123456, str(wakealarm)) is False
+    assert set_wakealarm(None, str(wakealarm)) is True
+    assert wakealarm.read_text() == '0\n'
+
+def test_set_wakealarm_busy(mocker):
+    from kodi_wol_listener import vdr_shutdown_hook
+    import errno
+
+    written = []
+    def write(path, value):
+        if value and written and written[-1]:
+            raise OSError(errno.EBUSY, 'busy')
+        written.append(value)
+    mocker.patch.object(vdr_shutdown_hook, '_write', side_effect=write)
+    mocker.patch('builtins.open', mocker.mock_open(read_data='1000\n'))
+    vdr_shutdown_hook.set_wakealarm(2000, 'wakealarm')
+    assert written == [2000]
+    # A pending alarm is cleared only if the kernel refuses to overwrite it
+    vdr_shutdown_hook.set_wakealarm(3000, 'wakealarm')
+    assert written == [2000, 0, 3000]
+
+@pytest.mark.asyncio
+async def test_query_listeners(tmp_path):
+    from kodi_wol_listener.vdr_shutdown_hook import query_listeners
+    from kodi_wol_listener.wol_receiver import WolReceiver
+    from kodi_wol_listener.control_socket import ControlServer
+    import socket
+    import asyncio
+
+    status = {'kodi_running': True, 'last_wake': None}
+    class Manager():
+        def status(self):
+            return status
+    receiver = WolReceiver(None, interface='lo', status_callback=Manager().status,
+                           status_hosts=['127.0.0.1'])
+    port = await receiver.init()
+    control = await ControlServer(Manager()).init(str(tmp_path / 'control.sock'))
+    # A port without listener and a host dropping the query
+    closed = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    closed.bind(('127.0.0.1', 0))
+    silent = closed.getsockname()[1]
+    closed.close()
+    mute = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    mute.bind(('127.0.0.1', 0))
+    listeners = [f'127.0.0.1:{port}', f'unix:{control.path}', f'127.0.0.1:{silent}',
+                 f'127.0.0.1:{mute.getsockname()[1]}', f'unix:{tmp_path}/missing']
+    try:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        statuses = await loop.run_in_executor(None, query_listeners, listeners, 0.3)
+        assert loop.time() - start < 1
+    finally:
+        mute.close()
+        control.close()
+        receiver.transport.close()
+    assert statuses[f'127.0.0.1:{port}']['kodi_running'] is True
+    assert 'time' in statuses[f'127.0.0.1:{port}']
+    assert statuses[f'unix:{control.path}'] == status
+    assert len(statuses) == 2
+
+def test_run_hook(tmp_path, capsys, mocker):
+    from kodi_wol_listener import vdr_shutdown_hook
+
+    wakealarm = tmp_path / 'wakealarm'
+    wakealarm.write_text('')
+    query = mocker.patch.object(vdr_shutdown_hook, 'query_listeners')
+    timer = int(vdr_shutdown_hook.time.time()) + 3600
+
+    query.return_value = {'pi': {'kodi_running': True}}
+    assert vdr_shutdown_hook.run_hook(timer, listeners=['pi'], wakealarm=str(wakealarm)) == 0
+    assert capsys.readouterr().out == 'TRY_AGAIN=5\n'
+    assert wakealarm.read_text() == ''
+
+    query.return_value = {'pi': {'kodi_running': False, 'next_wake': timer - 1000}}
+    assert vdr_shutdown_hook.run_hook(timer, listeners=['pi'], wakealarm=str(wakealarm)) == 0
+    assert capsys.readouterr().out == 'SHUTDOWNCMD="/bin/systemctl --no-block suspend"\n'
+    assert wakealarm.read_text() == f'{timer - 1000}\n'
+
+    assert vdr_shutdown_hook.run_hook(timer, wakealarm=str(tmp_path / 'missing' / 'x')) == 1
+    assert capsys.readouterr().out.startswith('ABORT_MESSAGE=')
@@ -0,0 +1,74 @@
+import math
+import pytest
+
+def test_source():
+    from kodi_wol_listener.wake_journal import pack_source, unpack_source
+    for source in ('192.168.1.10', 'fe80::1', 'hotplug', None):
+        assert unpack_source(*pack_source(source)) == source
+
+def test_journal(tmp_path):
+    from kodi_wol_listener.wake_journal import WakeJournal, RECORD, WAKE, SESSION, VERDICTS
+    journal = WakeJournal(str(tmp_path / 'journal.bin'))
+    assert journal.records() == []
+    journal.add_wake(1000.5, '10.0.0.2', 'started')
+    journal.add_session(1000.5, '10.0.0.2', 0, 3600.0, duplicates=3, ready=4.5, hdmi=0.25,
+                        teardown=0.5)
+    # A record torn by a crash is cut as the journal is opened again
+    journal.close()
+    with open(journal.path, 'ab') as torn:
+        torn.write(b'\1' * 10)
+    journal.add_wake(5000.0, 'hotplug', 'resumed')
+    journal.close()
+    records = journal.records()
+    assert len(records) == 3
+    assert (records[0].time, records[0].kind, VERDICTS[records[0].verdict]) == (1000.5, WAKE, 'started')
+    assert math.isnan(records[0].ready)
+    assert records[1].kind == SESSION
+    assert (records[1].duration, records[1].ready, records[1].exit_code) == (3600.0, 4.5, 0)
+    assert records[1].duplicates == 3
+    assert VERDICTS[records[2].verdict] == 'resumed'
+    assert [record.time for record in journal.records(since=2000)] == [5000.0]
+    assert (tmp_path / 'journal.bin').stat().st_size == 3 * RECORD.size
+
+def test_rotate(tmp_path):
+    from kodi_wol_listener.wake_journal import WakeJournal, RECORD
+    journal = WakeJournal(str(tmp_path / 'journal.bin'), max_bytes=10 * RECORD.size)
+    for timestamp in range(25):
+        journal.add_wake(timestamp, '10.0.0.2', 'started')
+    journal.close()
+    # The oldest records are dropped, at most twice max_bytes are used
+    assert [record.time for record in journal.records()] == list(range(10, 25))
+    assert (tmp_path / 'journal.bin.1').stat().st_size == 10 * RECORD.size
+
+def test_wakes(tmp_path):
+    from kodi_wol_listener.wake_journal import WakeJournal
+    journal = WakeJournal(str(tmp_path / 'journal.bin'))
+    assert len(journal.wakes()) == 0
+    journal.add_wake(1000.5, '10.0.0.2', 'started')
+    journal.add_session(1000.5, '10.0.0.2', 0, 60.0)
+    journal.add_wake(2000.0, 'hotplug', 'prelaunched')
+    journal.add_wake(2010.0, '10.0.0.2', 'claimed')
+    journal.add_wake(3000.0, '10.0.0.2', 'resumed')
+    # Sessions and prelaunches are no usage
+    assert list(journal.wakes()) == [1000, 2010, 3000]
+    assert list(journal.wakes(since=2500)) == [3000]
+    journal.close()
+
+def test_analyze(tmp_path):
+    import time
+    from kodi_wol_listener.wake_journal import WakeJournal, analyze, percentile
+    journal = WakeJournal(str(tmp_path / 'journal.bin'))
+    day = time.mktime((2026, 10, 1, 20, 0, 0, 0, 0, -1))
+    journal.add_wake(day, '10.0.0.2', 'started')
+    journal.add_session(day, '10.0.0.2', 0, 7200.0, duplicates=1, ready=4.0)
+    journal.add_wake(day + 86400, '10.0.0.3', 'started')
+    journal.add_session(day + 86400, '10.0.0.3', -11, 600.0, ready=6.0)
+    journal.add_wake(day + 86400 + 900, '10.0.0.3', 'resumed', ready=1.0)
+    journal.close()
+    result = analyze(journal.records())
+    assert result['days'] == {'2026-10-01': {'wakes': 1, 'sessions': 1, 'usage': 7200.0},
+                              '2026-10-02': {'wakes': 2, 'sessions': 1, 'usage': 600.0}}
+    assert result['ready'] == [1.0, 4.0, 6.0]
+    assert percentile(result['ready'], 50) == 4.0
+    assert (result['wakes'], result['duplicates']) == (3, 1)
+    assert (result['sessions'], result['crashes']) == (2, 1)
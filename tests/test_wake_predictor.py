@@ -0,0 +1,96 @@
+import time
+import random
+import pytest
+
+def local_time(year, month, day, hour, minute=0):
+    return int(time.mktime((year, month, day, hour, minute, 0, 0, 0, -1)))
+
+def test_model():
+    from kodi_wol_listener.wake_predictor import WakeModel, slot_of, week_of
+    model = WakeModel(decay=0.5, session_gap=3600)
+    monday = local_time(2026, 10, 5, 20, 5)
+    slot, week = slot_of(monday), week_of(monday)
+    assert slot == 20 * 4
+    assert model.probability(slot, week) == 0
+    assert model.add_wake(monday)
+    # Same session
+    assert not model.add_wake(monday + 600)
+    assert model.probability(slot + 1, week) == 0
+    # Only past weeks are taken into account
+    assert model.probability(slot, week) == 0
+    assert model.probability(slot, week + 1) == pytest.approx(0.5)
+    assert model.probability(slot, week + 2) == pytest.approx(0.25)
+    assert model.add_wake(monday + 2 * 3600)
+    assert model.probability(slot + 8, week + 1) == pytest.approx(0.5)
+    assert model.probability(slot, week + 1) == pytest.approx(0.5)
+    # The next week strengthens the slot
+    model.add_wake(monday + 7 * 24 * 3600)
+    assert model.probability(slot, week + 2) == pytest.approx(0.75)
+    assert model.next_slot(monday + 7 * 24 * 3600, 300, 0.7) == \
+        local_time(2026, 10, 19, 20, 0)
+    assert model.next_slot(monday + 7 * 24 * 3600, 300, 0.8) is None
+
+def usage(weeks, noise, seed=0):
+    """Evening sessions at 20:00 mon-fri plus random wakes"""
+    rnd = random.Random(seed)
+    timestamps = []
+    for day in range(weeks * 7):
+        start = local_time(2026, 1, 5, 20) + day * 24 * 3600
+        if time.localtime(start).tm_wday < 5:
+            # A few packets per wake, the first one up to 10 minutes late
+            wake = start + rnd.randrange(600)
+            timestamps += [wake, wake + 1, wake + 2]
+        if rnd.random() < noise:
+            timestamps.append(start - 10 * 3600 + rnd.randrange(6 * 3600))
+    return timestamps
+
+def test_evaluate():
+    from kodi_wol_listener.wake_predictor import evaluate
+    assert evaluate([])['sessions'] == 0
+    result = evaluate(usage(20, 0.1), lead=300, threshold=0.5)
+    assert result['wakes'] > 300
+    assert result['sessions'] > 100
+    # 100 evening sessions, the first three weeks are needed for learning
+    assert result['hits'] >= 100 - 3 * 5
+    assert result['extra'] < result['prewakes'] * 0.1
+    # Random usage is not predictable
+    rnd = random.Random(1)
+    start = local_time(2026, 1, 5, 0)
+    result = evaluate([start + rnd.randrange(20 * 7 * 24 * 3600) for _ in range(200)])
+    assert result['hit_rate'] < 0.1
+
+@pytest.mark.asyncio
+async def test_scheduler(mocker):
+    import asyncio
+    from kodi_wol_listener.wake_predictor import (WakeModel, PreWakeScheduler, SLOT_SECONDS,
+                                                  slot_of, week_of)
+    send = mocker.patch('kodi_wol_listener.wake_predictor.send_magic_packet')
+    model = WakeModel()
+    now = time.time()
+    slot_start = (int(now + 60) // SLOT_SECONDS + 1) * SLOT_SECONDS
+    model.averages[slot_of(slot_start)] = 1.0
+    model.weeks[slot_of(slot_start)] = week_of(slot_start) - 1
+    scheduler = PreWakeScheduler(model, '01:02:03:04:05:06', lead=slot_start - now - 0.1)
+    task = asyncio.get_running_loop().create_task(scheduler.run())
+    await asyncio.sleep(0.3)
+    send.assert_called_once_with('01:02:03:04:05:06', '255.255.255.255')
+    task.cancel()
+    # No pre-wake if the backend has been woken recently
+    send.reset_mock()
+    model.add_wake(time.time())
+    scheduler = PreWakeScheduler(model, '01:02:03:04:05:06', lead=slot_start - time.time() - 0.1)
+    task = asyncio.get_running_loop().create_task(scheduler.run())
+    await asyncio.sleep(0.3)
+    send.assert_not_called()
+    # The skipped pre-wake does not suppress later ones
+    assert scheduler.last_prewake is None
+    task.cancel()
+
+def test_print_evaluation(capsys, tmp_path):
+    from kodi_wol_listener.wake_predictor import print_evaluation
+    from kodi_wol_listener.wake_journal import WakeJournal
+    journal = WakeJournal(str(tmp_path / 'journal.bin'))
+    for timestamp in usage(4, 0):
+        journal.add_wake(timestamp, '10.0.0.2', 'started')
+    print_evaluation(journal)
+    assert '60 wakes, 20 sessions in 3.6 weeks' in capsys.readouterr().out
@@ -50,8 +50,9 @@ async def test_graceful_signals_new(event_loop, app_signal_handler, handled):
     ('main', False, False),
     ('install', True, False),
     ('uninstall', False, True)])
-def test_run(mocker, app, coro_name, install, uninstall):
+def test_run(mocker, tmp_path, app, coro_name, install, uninstall):
     from kodi_wol_listener.wol_listener_subproc import KodiManager
+    from kodi_wol_listener.event_loop import EventLoop
     app, _ = app
     typer = mocker.patch('kodi_wol_listener.wol_listener_subproc.typer')
     asyncio = mocker.patch('kodi_wol_listener.wol_listener_subproc.asyncio')
@@ -60,10 +61,12 @@ def test_run(mocker, app, coro_name, install, uninstall):
     main = mocker.patch.object(app, coro_name)
     main.return_value = getattr(mocker.sentinel, coro_name + '_coro')
     def typer_run(*args):
-        app._typer_run(mocker.sentinel.port, KodiManager.DebugLevel.INFO, install, uninstall)
-    typer.run.side_effect = typer_run
+        app._typer_run(mocker.sentinel.port, KodiManager.DebugLevel.INFO, install, uninstall, 0, None, 5, None, 0, '', None, None,
+                      EventLoop.ASYNCIO, str(tmp_path / 'missing.conf'))
+    cli = typer.Typer.return_value
+    cli.side_effect = typer_run
     app.run()
-    typer.run.assert_called_once_with(app._typer_run)
+    cli.callback.return_value.assert_called_once_with(app._typer_run)
     asyncio.run.assert_called_once_with(main.return_value)
 
 @pytest.fixture
@@ -189,3 +192,304 @@ async def test_start(caplog, mocker, event_loop, app, mock_coroutine):
     await asyncio.sleep(0.1)
     app.kodi_done_cb.assert_called_once()
     assert not app.kodi_running
+
+@pytest.fixture
+def app_kodi(app, mock_coroutine, fake_kodi):
+    from kodi_wol_listener.async_subprocess import AsyncSubprocess
+    from kodi_wol_listener.kodi_jsonrpc import KodiJsonRpc
+    app, (AsyncSubprocessMock, _, _) = app
+    _, get_state_mock = mock_coroutine(app.hdmi, 'get_state')
+    _, set_state_mock = mock_coroutine(app.hdmi, 'set_state')
+    # Desktop restart after kodi got terminated
+    AsyncSubprocessMock.return_value.run_wait, _ = mock_coroutine()
+    get_state_mock.return_value = False
+    app.kodi = AsyncSubprocess(b'sleep 30; true', abort_on_fail=False, new_session=True)
+    app.rpc = KodiJsonRpc(port=fake_kodi.port)
+    return app, set_state_mock
+
+@pytest.mark.asyncio
+async def test_stop_graceful(mocker, app_kodi, fake_kodi):
+    import asyncio
+    app, set_state_mock = app_kodi
+    app.kodi_start(('hello', 42))
+    await asyncio.sleep(0.1)
+    # The fake kodi exits as requested
+    async def quit_kodi():
+        await fake_kodi.quit_requested.wait()
+        app.kodi.terminate()
+    asyncio.get_running_loop().create_task(quit_kodi())
+    await asyncio.wait_for(app.kodi_stop(), 1)
+    assert not app.kodi_running
+    set_state_mock.assert_has_calls([mocker.call(True), mocker.call(False)])
+    # Lifecycle metrics
+    from kodi_wol_listener.wol_listener_subproc import KODI_EXITS, SESSION_SECONDS
+    assert KODI_EXITS.get('-15') >= 1
+    assert SESSION_SECONDS.get()[0] >= 1
+
+@pytest.mark.asyncio
+async def test_stop_timeout(app_kodi, fake_kodi):
+    import asyncio
+    app, _ = app_kodi
+    app.KODI_QUIT_TIMEOUT = 0.1
+    app.kodi_start(('hello', 42))
+    await asyncio.sleep(0.1)
+    await asyncio.wait_for(app.kodi_stop(), 1)
+    assert fake_kodi.quit_requested.is_set()
+    assert not app.kodi_running
+
+@pytest.mark.asyncio
+async def test_idle_stop(app_kodi, fake_kodi):
+    import asyncio
+    app, _ = app_kodi
+    app.KODI_QUIT_TIMEOUT = 0.1
+    app.idle_timeout = 0.5
+    fake_kodi.screensaver = True
+    app.kodi_start(('hello', 42))
+    await asyncio.wait_for(app.kodi_task, 2)
+    assert fake_kodi.quit_requested.is_set()
+
+@pytest.mark.asyncio
+async def test_idle_standby(mocker, app_kodi, fake_kodi):
+    import asyncio
+    from kodi_wol_listener.config import Config
+    app, set_state_mock = app_kodi
+    app.KODI_QUIT_TIMEOUT = 0.1
+    app.config = Config({('kodi', 'idle_action'): 'standby'})
+    app.idle_timeout = 0.5
+    fake_kodi.screensaver = True
+    app.kodi_start(('hello', 42))
+    await asyncio.sleep(1.5)
+    # Kept running with the backend released and HDMI off
+    assert app.kodi_running and app.standby
+    assert app.status()['standby'] is True
+    assert not fake_kodi.quit_requested.is_set()
+    assert fake_kodi.addons == {app.PVR_ADDON: False}
+    assert set_state_mock.call_args == mocker.call(False)
+    # A wake resumes the running kodi
+    fake_kodi.screensaver = False
+    app.kodi_start(('hello', 42))
+    await asyncio.sleep(0.1)
+    assert not app.standby
+    assert fake_kodi.addons == {app.PVR_ADDON: True}
+    assert set_state_mock.call_args == mocker.call(True)
+    await asyncio.wait_for(app.kodi_stop(), 1)
+    assert not app.kodi_running
+
+@pytest.mark.asyncio
+async def test_journal(app_kodi, fake_kodi, tmp_path):
+    import asyncio
+    import math
+    from kodi_wol_listener.wake_journal import WakeJournal, WAKE, SESSION, VERDICTS
+    app, _ = app_kodi
+    app.KODI_QUIT_TIMEOUT = 0.1
+    app.journal = WakeJournal(str(tmp_path / 'journal.bin'))
+    app.kodi_start(('10.0.0.2', 42))
+    await asyncio.sleep(0.2)
+    app.kodi_start(('10.0.0.3', 42))
+    app.kodi_start(('10.0.0.2', 42))
+    await asyncio.wait_for(app.kodi_stop(), 1)
+    app.journal.close()
+    # The duplicates are counted by the session
+    wake, session = app.journal.records()
+    assert (wake.kind, VERDICTS[wake.verdict]) == (WAKE, 'started')
+    assert session.kind == SESSION
+    assert session.duplicates == 2
+    assert session.time == wake.time
+    assert session.exit_code == -15
+    assert session.ready < 0.2
+    assert not math.isnan(session.hdmi) and session.duration > 0.1
+
+@pytest.mark.asyncio
+async def test_start_records_wake(app, mock_coroutine, tmp_path):
+    import asyncio
+    from kodi_wol_listener.wake_journal import WakeJournal
+    from kodi_wol_listener.wake_predictor import WakeModel
+    app, _ = app
+    mock_coroutine(app, 'kodi_exec')
+    app.journal = WakeJournal(str(tmp_path / 'journal.bin'))
+    app.wake_model = WakeModel()
+    app.kodi_start(('hello', 42))
+    started = app.wake_model.last_wake
+    # A duplicate is no usage
+    app.kodi_start(('hello', 42))
+    await asyncio.sleep(0.01)
+    assert app.wake_model.last_wake == started
+    assert list(app.journal.wakes()) == [int(app.wake_model.last_wake)]
+    app.journal.close()
+
+@pytest.mark.asyncio
+async def test_prelaunch(app, mock_coroutine, tmp_path):
+    import asyncio
+    from kodi_wol_listener.wake_journal import WakeJournal, VERDICTS
+    from kodi_wol_listener.wake_predictor import WakeModel
+    app, _ = app
+    mock_coroutine(app, 'kodi_exec')
+    app.journal = WakeJournal(str(tmp_path / 'journal.bin'))
+    app.wake_model = WakeModel()
+    app.kodi_start(('hotplug', 0), prelaunch=True)
+    app.kodi_start(('hotplug', 0), prelaunch=True)
+    assert app.wake_model.last_wake is None
+    # The wake following a prelaunch claims it, the next one is a duplicate
+    app.kodi_start(('10.0.0.2', 42))
+    assert app.duplicate_wakes == 0
+    app.kodi_start(('10.0.0.2', 42))
+    assert app.duplicate_wakes == 1
+    await asyncio.sleep(0.01)
+    app.journal.close()
+    assert [VERDICTS[record.verdict] for record in app.journal.records()] == [
+        'prelaunched', 'claimed']
+    assert list(app.journal.wakes()) == [int(app.wake_model.last_wake)]
+
+@pytest.mark.asyncio
+async def test_status(mocker, app_kodi, fake_kodi):
+    import asyncio
+    app, _ = app_kodi
+    app.hdmi.state = None
+    listener = mocker.Mock()
+    app.add_state_listener(listener)
+    status = app.status()
+    assert not status['kodi_running']
+    assert status['last_wake'] is None
+    assert status['next_wake'] is None
+    app.kodi_start(('1.2.3.4', 42))
+    assert app.status()['kodi_running']
+    assert app.status()['last_wake']['source'] == '1.2.3.4'
+    listener.assert_called_once()
+    app.KODI_QUIT_TIMEOUT = 0.1
+    await asyncio.sleep(0.1)
+    await app.kodi_stop()
+    assert not listener.call_args[0][0]['kodi_running']
+    app.remove_state_listener(listener)
+
+@pytest.mark.asyncio
+async def test_reload(mocker, app, mock_coroutine, tmp_path, caplog):
+    app, _ = app
+    _, rebind_mock = mock_coroutine(app.wol_receiver, 'rebind')
+    app.config_path = str(tmp_path / 'kodi_wol_listener.conf')
+    app.config_overrides = {('kodi', 'idle_timeout'): 1}
+    app.kodi_running = True
+    with open(app.config_path, 'w') as config_file:
+        config_file.write("[listener]\nport = 4000\n"
+                          "[kodi]\ncommand = /opt/kodi/bin/kodi\nidle_timeout = 10\n"
+                          "[hdmi]\nvcgencmd = /opt/vc/bin/vcgencmd\n")
+    await app.reload()
+    rebind_mock.assert_called_once_with(4000)
+    app.kodi.set_command.assert_called_once_with(b'/opt/kodi/bin/kodi')
+    app.hdmi.set_vcgencmd.assert_called_once_with(b'/opt/vc/bin/vcgencmd')
+    app.wol_receiver.set_interface.assert_not_called()
+    # Command line settings take precedence, running kodi is not touched
+    assert app.idle_timeout == 60
+    assert 'precedence over kodi.idle_timeout' in caplog.text
+    assert app.kodi_running
+    app.kodi.terminate.assert_not_called()
+    # Unchanged file, nothing is applied again
+    await app.reload()
+    rebind_mock.assert_called_once()
+    app.kodi.set_command.assert_called_once()
+    # An invalid file is ignored
+    with open(app.config_path, 'w') as config_file:
+        config_file.write("[listener]\nport = none\n")
+    await app.reload()
+    assert app.config['listener', 'port'] == 4000
+
+def test_journal_config(app, tmp_path):
+    from kodi_wol_listener.config import Config
+    app, _ = app
+    path = str(tmp_path / 'journal.bin')
+    app.apply_config(Config({('journal', 'path'): path, ('journal', 'max_bytes'): 4800}))
+    assert (app.journal.path, app.journal.max_bytes) == (path, 4800)
+    # An empty path disables the journal
+    app.apply_config(Config({('journal', 'path'): ''}), {('journal', 'path')})
+    assert app.journal is None
+
+@pytest.mark.asyncio
+async def test_reload_failures(app, mock_coroutine, tmp_path):
+    app, _ = app
+    _, rebind_mock = mock_coroutine(app.wol_receiver, 'rebind')
+    rebind_mock.side_effect = OSError('Address in use')
+    app.wol_receiver.set_interface.side_effect = OSError('No such device')
+    app.config_path = str(tmp_path / 'kodi_wol_listener.conf')
+    app.config_overrides = {}
+    with open(app.config_path, 'w') as config_file:
+        config_file.write("[listener]\nport = 4000\ninterface = wlan0\n"
+                          "[kodi]\ncommand = /opt/kodi/bin/kodi\n")
+    await app.reload()
+    # The other settings are applied, the failed ones are retried on the next reload
+    app.kodi.set_command.assert_called_once_with(b'/opt/kodi/bin/kodi')
+    assert app.config['kodi', 'command'] == '/opt/kodi/bin/kodi'
+    assert app.config['listener', 'port'] == 42429
+    assert app.config['listener', 'interface'] == 'eth0'
+    rebind_mock.side_effect = None
+    app.wol_receiver.set_interface.side_effect = None
+    await app.reload()
+    rebind_mock.assert_called_with(4000)
+    app.wol_receiver.set_interface.assert_called_with('wlan0')
+    app.kodi.set_command.assert_called_once()
+    assert app.config['listener', 'port'] == 4000
+
+@pytest.mark.asyncio
+async def test_cec_wake(app_kodi, fake_kodi, tmp_path):
+    import os
+    import sys
+    import asyncio
+    from kodi_wol_listener.config import Config
+    app, _ = app_kodi
+    log = tmp_path / 'cec.log'
+    fake_cec = os.path.join(os.path.dirname(__file__), 'fake_cec_client.py')
+    app.config = Config({('cec', 'command'): f'{sys.executable} {fake_cec} --log {log}'})
+    await app._start_cec()
+    app.KODI_QUIT_TIMEOUT = 0.1
+    app.kodi_start(('hello', 42))
+    await asyncio.sleep(0.1)
+    # The TV is switched on while kodi is running
+    assert await asyncio.wait_for(app.cec.power_status(), 2) == 'on'
+    assert app.kodi_running
+    await app.kodi_stop()
+    await app.cec.close()
+    assert log.read_text().split('\n')[:3] == ['on 0', 'as', 'pow 0']
+
+@pytest.mark.asyncio
+async def test_rsync_throttle(mocker, mock_coroutine, app_kodi, fake_kodi):
+    import asyncio
+    app, _ = app_kodi
+    app.rpc.notification_callback = app._kodi_notification
+    set_throttled, set_throttled_mock = mock_coroutine()
+    app.rsync_throttle = mocker.Mock(set_throttled=set_throttled)
+    app.KODI_QUIT_TIMEOUT = 0.1
+    app.kodi_start(('hello', 42))
+    await asyncio.sleep(0.2)
+    # Playback notifications are received while kodi runs
+    assert app.rpc.connected
+    fake_kodi.notify('Player.OnPlay')
+    await asyncio.sleep(0.05)
+    fake_kodi.notify('Player.OnStop')
+    await asyncio.sleep(0.05)
+    await app.kodi_stop()
+    assert set_throttled_mock.call_args_list == [
+        mocker.call(True), mocker.call(True), mocker.call(False), mocker.call(False)]
+
+@pytest.mark.asyncio
+async def test_library_scan(app_kodi, fake_kodi, tmp_path):
+    import asyncio
+    from kodi_wol_listener.config import Config
+    app, _ = app_kodi
+    app.config = Config({('library', 'watch'): str(tmp_path), ('library', 'settle'): 0.1})
+    app._start_library_watcher()
+    (tmp_path / 'Movies').mkdir()
+    (tmp_path / 'Movies' / 'movie.mkv').write_bytes(b'movie')
+    await asyncio.sleep(0.3)
+    # Queued while kodi is not running
+    assert app.pending_scans == {str(tmp_path / 'Movies')}
+    assert not fake_kodi.methods('VideoLibrary.Scan')
+    app.KODI_QUIT_TIMEOUT = 0.1
+    app.kodi_start(('hello', 42))
+    await asyncio.sleep(0.1)
+    (tmp_path / 'Movies' / 'movie2.mkv').write_bytes(b'movie')
+    (tmp_path / 'other.mkv').write_bytes(b'movie')
+    await asyncio.sleep(0.3)
+    await app.kodi_stop()
+    app.library_watcher.close()
+    assert fake_kodi.methods('VideoLibrary.Scan') == [
+        {'directory': str(tmp_path / 'Movies') + '/', 'showdialogs': False},
+        {'directory': str(tmp_path) + '/', 'showdialogs': False}]
+    assert not app.pending_scans
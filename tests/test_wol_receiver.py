@@ -34,3 +34,77 @@ async def test_all(caplog, mocker, event_loop):
     # Evaluate results, a single call is expected
     await asyncio.wait_for(terminate, 1)
     callback.assert_called_once_with(src_addr)
+
+@pytest.mark.asyncio
+async def test_rebind(mocker):
+    from kodi_wol_listener.wol_receiver import WolReceiver
+    import socket
+    import asyncio
+
+    received = asyncio.Queue()
+    wol = WolReceiver(received.put_nowait)
+    old_port = await wol.init()
+    # The port in use is kept if binding the new one fails
+    blocker = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+    blocker.bind(('0.0.0.0', 0))
+    with pytest.raises(OSError):
+        await wol.rebind(blocker.getsockname()[1])
+    blocker.close()
+    new_port = await wol.rebind(0)
+    assert new_port != old_port
+    with socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM) as sock:
+        sock.sendto(b'\xff' * 6 + wol.mymac_bytes, ('127.0.0.1', new_port))
+        await asyncio.wait_for(received.get(), 1)
+        # The old port is closed
+        sock.sendto(b'\xff' * 6 + wol.mymac_bytes, ('127.0.0.1', old_port))
+        await asyncio.sleep(0.05)
+    assert received.empty()
+    wol.transport.close()
+
+@pytest.mark.asyncio
+async def test_status_query():
+    from kodi_wol_listener.wol_receiver import WolReceiver, STATUS_QUERY, STATUS_INTERVAL
+    import json
+    import socket
+    import asyncio
+
+    wol = WolReceiver(None, interface='lo', status_callback=lambda: {'kodi_running': False})
+    port = await wol.init()
+    with pytest.raises(ValueError):
+        wol.set_status_hosts(['kodi-pi'])
+    with socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM) as sock:
+        sock.setblocking(False)
+        # Not answered unless the querying host is configured
+        sock.sendto(STATUS_QUERY, ('127.0.0.1', port))
+        await asyncio.sleep(0.02)
+        with pytest.raises(BlockingIOError):
+            sock.recv(1024)
+        wol.set_status_hosts(['127.0.0.1'])
+        sock.sendto(STATUS_QUERY, ('127.0.0.1', port))
+        await asyncio.sleep(0.02)
+        assert json.loads(sock.recv(1024))['kodi_running'] is False
+        # Further queries within the interval are dropped
+        sock.sendto(STATUS_QUERY, ('127.0.0.1', port))
+        await asyncio.sleep(0.02)
+        with pytest.raises(BlockingIOError):
+            sock.recv(1024)
+        await asyncio.sleep(STATUS_INTERVAL)
+        sock.sendto(STATUS_QUERY, ('127.0.0.1', port))
+        await asyncio.sleep(0.02)
+        assert json.loads(sock.recv(1024))['kodi_running'] is False
+    wol.transport.close()
+
+@pytest.mark.asyncio
+async def test_lazy_interface():
+    from kodi_wol_listener.wol_receiver import WolReceiver
+    # A missing interface fails only as the receiver starts
+    wol = WolReceiver(None, interface='missing0')
+    with pytest.raises(OSError):
+        await wol.init()
+    wol.set_interface('lo')
+    await wol.init()
+    assert wol.mymac_bytes == bytes(6)
+    with pytest.raises(OSError):
+        wol.set_interface('missing0')
+    assert wol.interface == 'lo'
+    wol.transport.close()
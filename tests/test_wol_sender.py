@@ -0,0 +1,96 @@
+import pytest
+
+def test_magic_packet():
+    from kodi_wol_listener.wol_sender import magic_packet
+    packet = magic_packet('01:02:03:04:05:06')
+    assert len(packet) == 102
+    assert packet.startswith(b'\xff' * 6 + b'\x01\x02\x03\x04\x05\x06')
+    assert magic_packet('01-02-03-04-05-06') == packet
+    with pytest.raises(ValueError):
+        magic_packet('01:02:03')
+
+def test_send():
+    import socket
+    from kodi_wol_listener.wol_sender import send_magic_packet, magic_packet
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    send_magic_packet('01:02:03:04:05:06', '127.0.0.1', sock.getsockname()[1])
+    assert sock.recv(1024) == magic_packet('01:02:03:04:05:06')
+    sock.close()
+
+def test_secureon():
+    from kodi_wol_listener.wol_sender import magic_packet
+    packet = magic_packet('01:02:03:04:05:06')
+    assert magic_packet('01:02:03:04:05:06', 'aa:bb:cc:dd:ee:ff') == packet + bytes.fromhex('aabbccddeeff')
+    assert magic_packet('01:02:03:04:05:06', '192.168.1.1') == packet + bytes([192, 168, 1, 1])
+    with pytest.raises(ValueError):
+        magic_packet('01:02:03:04:05:06', 'aa:bb')
+
+def test_parse_target():
+    import socket
+    from kodi_wol_listener.wol_sender import parse_target
+    assert parse_target('broadcast') == (socket.AF_INET, ('255.255.255.255', 9))
+    assert parse_target('10.0.0.255', 7) == (socket.AF_INET, ('10.0.0.255', 7))
+    assert parse_target('127.0.0.1:4000') == (socket.AF_INET, ('127.0.0.1', 4000))
+    assert parse_target('[::1]:4000')[:2] == (socket.AF_INET6, ('::1', 4000, 0, 0))
+    assert parse_target('::1')[1][:2] == ('::1', 9)
+
+def test_wol_sender():
+    import socket
+    from kodi_wol_listener.wol_sender import WolSender, magic_packet, parse_target
+    receivers = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM),
+                 socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)]
+    receivers[0].bind(('127.0.0.1', 0))
+    receivers[1].bind(('::1', 0))
+    targets = [parse_target(f'127.0.0.1:{receivers[0].getsockname()[1]}'),
+               parse_target(f'[::1]:{receivers[1].getsockname()[1]}')]
+    packets = [magic_packet('01:02:03:04:05:06'), magic_packet('0a:0b:0c:0d:0e:0f', '1.2.3.4')]
+    sender = WolSender()
+    try:
+        result = sender.send(packets, targets, repeat=3, spacing=0.05)
+    finally:
+        sender.close()
+    assert result.sent == 12 and result.failed == 0
+    assert result.seconds >= 0.1
+    for receiver in receivers:
+        assert [receiver.recv(1024) for _ in range(6)] == packets * 3
+        receiver.close()
+
+def test_wol_sender_rate():
+    import socket
+    from kodi_wol_listener.wol_sender import WolSender, magic_packet
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    sender = WolSender()
+    try:
+        result = sender.send([magic_packet('01:02:03:04:05:06')] * 50,
+                             [(socket.AF_INET, receiver.getsockname())], rate=1000, batch=10)
+    finally:
+        sender.close()
+        receiver.close()
+    assert result.sent == 50
+    # The last batch starts after 40 packets at 1000 packets/s
+    assert result.seconds >= 0.04
+
+def test_wol_sender_full_buffer(tmp_path):
+    import socket
+    from kodi_wol_listener.wol_sender import WolSender, magic_packet
+    path = str(tmp_path / 'receiver')
+    receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    receiver.bind(path)
+    sender = WolSender(timeout=0.2)
+    try:
+        # An always writable socket of another family
+        sender._socket(socket.AF_INET)
+        # Fill the queue of the receiver, it does not read
+        sock = sender._socket(socket.AF_UNIX)
+        with pytest.raises(BlockingIOError):
+            while True:
+                sock.sendto(b'x' * 1024, path)
+        # Waits for the full socket only, then gives up
+        result = sender.send([magic_packet('01:02:03:04:05:06')], [(socket.AF_UNIX, path)])
+    finally:
+        sender.close()
+        receiver.close()
+    assert result.sent == 0 and result.failed == 1
+    assert result.seconds >= 0.2
@@ -0,0 +1,173 @@
+"""End-to-end simulation of the wake pipeline
+
+Runs the real KodiManager in-process against local fakes: magic packets are
+sent over UDP, vcgencmd is fake_vcgencmd.py with a configurable delay, kodi
+is fake_kodi.py opening its JSON-RPC port after a configurable delay and
+exiting on Application.Quit, the desktop restart is 'true'.
+
+A wake cycle measures the time from sending the magic packet(s) until kodi
+answers on JSON-RPC and the HDMI output is on, then quits kodi and measures
+the time until the pipeline is idle again.
+
+Standalone usage:
+    python wake_pipeline.py [--cycles 20] [--kodi-delay 1.0]
+                            [--vcgencmd-delay 0.1] [--duplicates 1]
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# pylint: disable=wrong-import-position
+from benchmark import Timings
+from kodi_wol_listener.config import Config
+from kodi_wol_listener.kodi_jsonrpc import KodiJsonRpc, KodiJsonRpcError
+from kodi_wol_listener.wol_listener_subproc import KodiManager, LAUNCHES
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_tcp_port():
+    """Return a currently unused local TCP port"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class WakePipeline():
+    """A KodiManager wired to fakes
+
+    Args:
+        work_dir (str) Directory for the state of the fakes
+        kodi_delay (float) Seconds until the fake kodi opens its JSON-RPC port
+        vcgencmd_delay (float) Seconds each fake vcgencmd call takes
+    """
+    # Interval to poll for kodi being ready
+    POLL_INTERVAL = 0.005
+
+    def __init__(self, work_dir, kodi_delay=1.0, vcgencmd_delay=0.1):
+        self.hdmi_state_file = os.path.join(work_dir, 'display_power')
+        self.kodi_port = free_tcp_port()
+        python = sys.executable
+        self.config = Config({
+            ('listener', 'port'): 0,
+            ('listener', 'interface'): 'lo',
+            ('kodi', 'command'): (f'exec {python} {TESTS_DIR}/fake_kodi.py '
+                                  f'--port {self.kodi_port} --delay {kodi_delay}'),
+            ('kodi', 'jsonrpc_port'): self.kodi_port,
+            ('kodi', 'desktop_restart_command'): 'true',
+            ('hdmi', 'vcgencmd'): (f'{python} {TESTS_DIR}/fake_vcgencmd.py '
+                                   f'{self.hdmi_state_file} {vcgencmd_delay}')})
+        self.app = None
+        self.app_task = None
+        self.address = None
+        self.packet = None
+        self.wake_timings = Timings(f'wake to ready (kodi {kodi_delay}s, '
+                                    f'vcgencmd {vcgencmd_delay}s)')
+        self.quit_timings = Timings('quit to idle')
+
+    async def start(self):
+        """Start the listener"""
+        with open(self.hdmi_state_file, 'w') as state:
+            state.write('0')
+        self.app = KodiManager()
+        self.app.apply_config(self.config)
+        self.app_task = asyncio.get_running_loop().create_task(self.app.main(0))
+        while self.app.exit_future is None:
+            await asyncio.sleep(self.POLL_INTERVAL)
+        receiver = self.app.wol_receiver
+        self.address = ('127.0.0.1', receiver.transport.get_extra_info('sockname')[1])
+        self.packet = b'\xff' * 6 + receiver.mymac_bytes * 16
+        return self
+
+    async def stop(self):
+        """Stop the listener"""
+        await self.app.kodi_stop()
+        self.app.exit_future.set_result('SIGTERM')
+        await self.app_task
+
+    def hdmi_on(self):
+        """True if the fake display is on"""
+        with open(self.hdmi_state_file) as state:
+            return state.read().strip() == '1'
+
+    async def kodi_ready(self):
+        """True if kodi answers on JSON-RPC"""
+        rpc = KodiJsonRpc(port=self.kodi_port, timeout=1.0)
+        try:
+            await rpc.connect()
+            return await rpc.call('JSONRPC.Ping') == 'pong'
+        except (OSError, asyncio.TimeoutError, KodiJsonRpcError):
+            return False
+        finally:
+            rpc.close()
+
+    async def wake(self, duplicates=1):
+        """Send magic packets at once, wait until kodi is ready and HDMI on
+
+        Args:
+            duplicates (int) Number of magic packets, from different sockets
+        Returns:
+            (float) Seconds from sending until ready
+        """
+        sockets = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(duplicates)]
+        try:
+            start = time.perf_counter()
+            for sock in sockets:
+                sock.sendto(self.packet, self.address)
+            while not (self.hdmi_on() and await self.kodi_ready()):
+                await asyncio.sleep(self.POLL_INTERVAL)
+            latency = time.perf_counter() - start
+        finally:
+            for sock in sockets:
+                sock.close()
+        self.wake_timings.add(latency)
+        return latency
+
+    async def quit(self):
+        """Quit kodi, wait until the HDMI output is restored"""
+        await self.quit_timings.measure(self.app.kodi_stop)
+        assert not self.hdmi_on()
+
+    async def run(self, cycles, duplicates=1):
+        """Run wake/quit cycles
+
+        Returns:
+            (dict) Number of 'started' and 'duplicate' launches
+        """
+        started, duplicate = LAUNCHES.get('started'), LAUNCHES.get('duplicate')
+        for _ in range(cycles):
+            await self.wake(duplicates)
+            await self.quit()
+        return {'started': LAUNCHES.get('started') - started,
+                'duplicate': LAUNCHES.get('duplicate') - duplicate}
+
+
+async def simulate(args):
+    with tempfile.TemporaryDirectory() as work_dir:
+        pipeline = await WakePipeline(work_dir, args.kodi_delay, args.vcgencmd_delay).start()
+        try:
+            launches = await pipeline.run(args.cycles, args.duplicates)
+        finally:
+            await pipeline.stop()
+    pipeline.wake_timings.report()
+    pipeline.quit_timings.report()
+    print(f"launches: {launches['started']} started, {launches['duplicate']} duplicates")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cycles', type=int, default=20)
+    parser.add_argument('--kodi-delay', type=float, default=1.0)
+    parser.add_argument('--vcgencmd-delay', type=float, default=0.1)
+    parser.add_argument('--duplicates', type=int, default=1)
+    asyncio.run(simulate(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()